@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+A long-lived event loop on a daemon thread, for running async agent code from sync callers.
+
+``asyncio.run`` fails when the caller already runs inside an event loop, and each
+call would create a new loop with its own pooled AsyncClient that is never closed.
+Coroutines submitted here all share one loop, so they also share one async client
+and its warm connections.
+"""
+import asyncio
+import threading
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    def __init__(self, name: str = "agent-loop"):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run ``awaitable`` on the background loop and block until it finishes."""
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("BackgroundLoop.run called from the background loop itself; await the coroutine")
+        future = asyncio.run_coroutine_threadsafe(awaitable, self._loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+_background_loop: Optional[BackgroundLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> BackgroundLoop:
+    """Process-wide background loop, started on first use."""
+    global _background_loop
+    if _background_loop is None:
+        with _background_loop_lock:
+            if _background_loop is None:
+                _background_loop = BackgroundLoop()
+    return _background_loop
@@ -1,21 +1,54 @@
 # -*- coding: utf-8 -*-
+import json
+import time
 from abc import ABC
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Hashable, Iterator, List, Optional, Tuple
 
-from openai import OpenAI
+from loguru import logger
 
-from settings import OPENAI_API_KEY, OPENAI_BASE_URL, MODEL_NAME
+from settings import (LLM_CACHE_ENABLED, LLM_HEDGE_ENABLED, LLM_STRUCTURED_OUTPUT_RETRIES,
+                      OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_HEDGE_BASE_URL, OPENAI_STREAM_USAGE)
+from utils.telemetry import LLMCall, get_telemetry
+from .batch import batch_request_line
+from .client_registry import ClientRegistry, get_client_registry
+from .resilience import DEFAULT_RETRY_POLICY, RetryPolicy, aretry_call, get_latency_tracker, hedged, retry_call
+from .response_cache import ResponseCache, get_response_cache
+from .routing import Endpoint, ModelProfile, Router, get_router
+from .scheduler import Priority, RequestScheduler, estimate_request_tokens, get_scheduler
+from .structured_output import (IncrementalJSONParser, StructuredOutputError, parse_json_response,
+                                response_format as structured_response_format)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, OpenAI
+
+
+def _format_kwargs(response_format: Optional[Dict]) -> Dict:
+    return {"response_format": response_format} if response_format else {}
+
+
+def _total_tokens(usage) -> Optional[int]:
+    return getattr(usage, "total_tokens", None) if usage is not None else None
 
 
 class BaseAIAgent(ABC):
-    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+    # 响应缓存的 TTL (秒)。None 表示该 Agent 不使用缓存，子类可按需覆盖
+    cache_ttl: Optional[float] = None
+    # 调度优先级：交互式 Agent 覆盖为 Priority.INTERACTIVE，排在后台分析请求之前
+    priority: Priority = Priority.BACKGROUND
+    # 截止时间与重试策略，子类可按需覆盖
+    retry_policy: RetryPolicy = DEFAULT_RETRY_POLICY
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 cache_ttl: Optional[float] = None):
         """
         初始化 BaseAIAgent。
 
         Args:
             api_key: OpenAI API 密钥。如果为 None，则从 settings.py 中读取。
-            base_url: OpenAI API 的 base URL。如果为 None，则从 settings.py 中读取。
+            base_url: OpenAI API 的 base URL。如果为 None，则按路由表选择 endpoint；显式传入时所有路由都使用它。
+            cache_ttl: 覆盖类级别的缓存 TTL。仅当 settings.LLM_CACHE_ENABLED 为 True 时生效。
         """
+        self._base_url_override = base_url
         api_key = api_key or OPENAI_API_KEY
         base_url = base_url or OPENAI_BASE_URL
 
@@ -25,20 +58,442 @@ class BaseAIAgent(ABC):
         if not base_url:
             print("UserWarning: OpenAI Base URL is not set. Using it may cause some error")
 
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.api_key = api_key
+        self.base_url = base_url
+        # 客户端由进程级注册表按 (base_url, api_key) 共享，并共用一个带连接池的 HTTP 传输层：
+        # 每个请求构造的 Agent 复用已建立的连接；命中缓存或从未发请求的 Agent 也不必导入 openai
+        self.client_registry: ClientRegistry = get_client_registry()
+        self.router: Router = get_router()
+
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+        self.cache: Optional[ResponseCache] = \
+            get_response_cache() if LLM_CACHE_ENABLED and self.cache_ttl else None
+        # 最近一次调用的 usage (prompt_tokens / completion_tokens)，缓存命中或服务未返回时为 None
+        self.last_usage = None
+        # 所有请求都经过全局调度器；user_key 用于同一优先级内按用户轮转
+        self.scheduler: RequestScheduler = get_scheduler()
+        self.user_key: Optional[Hashable] = None
 
-    def generate_response(self, messages: List[Dict[str, str]]) -> str:
+    def generate_response(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None,
+                          route: Optional[str] = None, response_format: Optional[Dict] = None,
+                          use_cache: bool = True) -> str:
         """
         使用 OpenAI 的 Chat Completions API 生成回复。
 
         Args:
             messages: 一个消息列表，每个消息是一个字典，包含 "role" (system, user, assistant) 和 "content"。
+            user_key: 调度公平性使用的用户标识，默认为 self.user_key。
+            route: 调用方的方法名 (如 "collect_preferences")，与 Agent 类名组成路由，决定使用的模型与 endpoint。
+            response_format: Chat Completions 的 response_format 参数 (JSON 模式)，同时计入缓存键。
+            use_cache: 为 False 时不读写响应缓存 (结构化输出在校验通过后自行缓存)。
+
+        Returns:
+            LLM 的回复内容。
+        """
+        self.last_usage = None
+        method = route or "generate_response"
+        route, profile = self._route(route)
+        cache_key = self._cache_key(messages, profile, response_format) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, method, "response")
+                return cached
+
+        call = self._start_call(method, profile, user_key)
+        try:
+            with self._slot(messages, user_key) as ticket:
+                response = self._create(route, profile, messages, call=call, **_format_kwargs(response_format))
+                self.last_usage = response.usage
+                self.scheduler.release(ticket, _total_tokens(response.usage))
+        except BaseException as e:
+            call.fail(e)
+            raise
+        call.finish(response.usage)
+        content = response.choices[0].message.content.strip()
+        if cache_key:
+            self.cache.set(cache_key, content, self.cache_ttl, namespace=type(self).__name__)
+        return content
+
+    def batch_request(self, custom_id: str, messages: List[Dict[str, str]], route: Optional[str] = None,
+                      response_format: Optional[Dict] = None) -> Dict:
+        """Batch API 的一行请求，与在线调用使用相同的路由 (模型与采样参数)。"""
+        _, profile = self._route(route)
+        return batch_request_line(custom_id, {"model": profile.model, "messages": messages, **profile.params(),
+                                              **_format_kwargs(response_format)})
+
+    def _route(self, route: Optional[str]) -> Tuple[str, ModelProfile]:
+        name = f"{type(self).__name__}.{route}" if route else type(self).__name__
+        return name, self.router.profile_for(name)
+
+    @property
+    def client(self) -> "OpenAI":
+        """默认 endpoint 的同步客户端。"""
+        return self.client_registry.client(self.base_url, self.api_key)
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """默认 endpoint 的异步客户端：在事件循环中等待 LLM 响应时不占用工作线程。"""
+        return self.client_registry.async_client(self.base_url, self.api_key)
+
+    @property
+    def hedge_client(self) -> Optional["AsyncOpenAI"]:
+        """对冲请求的客户端：配置了备用 base URL 时发往备用服务，否则为 None (发往路由表中的下一个 endpoint)。"""
+        if LLM_HEDGE_ENABLED and OPENAI_HEDGE_BASE_URL:
+            return self.client_registry.async_client(OPENAI_HEDGE_BASE_URL, self.api_key)
+        return None
+
+    def _client_key(self, endpoint: Endpoint) -> Tuple[Optional[str], str]:
+        """该 endpoint 的 (base_url, api_key)。构造时显式传入的 base_url 优先于路由表。"""
+        return self._base_url_override or endpoint.base_url, endpoint.api_key or self.api_key
+
+    def _cache_key(self, messages: List[Dict[str, str]], profile: ModelProfile,
+                   response_format: Optional[Dict] = None) -> Optional[str]:
+        """返回本次请求的缓存键 (包含模型、采样参数与 response_format)；未启用缓存时返回 None。"""
+        if not self.cache:
+            return None
+        return ResponseCache.make_key(profile.model, messages, {**profile.params(), **_format_kwargs(response_format)})
+
+    def _slot(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None):
+        return self.scheduler.slot(self.priority, user_key if user_key is not None else self.user_key,
+                                   estimate_request_tokens(messages))
+
+    def _aslot(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None):
+        return self.scheduler.aslot(self.priority, user_key if user_key is not None else self.user_key,
+                                    estimate_request_tokens(messages))
+
+    def _start_call(self, method: str, profile: ModelProfile, user_key: Optional[Hashable] = None,
+                    stream: bool = False) -> LLMCall:
+        """遥测记录：调用方在成功、失败或被取消时调用 finish / fail 提交。"""
+        return LLMCall(agent=type(self).__name__, method=method, model=profile.model, stream=stream,
+                       user_id=user_key if user_key is not None else self.user_key,
+                       objective_id=getattr(self, "objective_id", None))
+
+    def _create(self, route: str, profile: ModelProfile, messages: List[Dict[str, str]],
+                call: Optional[LLMCall] = None, **kwargs):
+        """One Chat Completions request on the next endpoint of ``profile``, with deadline and retries."""
+        endpoint = self.router.pick_endpoint(profile)
+        if call is not None:
+            call.endpoint = self._base_url_override or endpoint.base_url
+        client = self.client_registry.client(*self._client_key(endpoint))
+        started = time.perf_counter()
+        try:
+            response = retry_call(lambda timeout: client.chat.completions.create(
+                model=profile.model,
+                messages=messages,
+                timeout=timeout,
+                **profile.params(),
+                **kwargs
+            ), self.retry_policy)
+        except Exception:
+            self.router.record(route, profile, endpoint, time.perf_counter() - started, ok=False)
+            raise
+        self.router.record(route, profile, endpoint, time.perf_counter() - started)
+        return response
+
+    async def _acreate(self, route: str, profile: ModelProfile, messages: List[Dict[str, str]],
+                       call: Optional[LLMCall] = None, **kwargs):
+        """
+        Async variant of _create. When LLM_HEDGE_ENABLED, an attempt still pending after the
+        route's recent P95 latency gets a duplicate on hedge_client (or the profile's next
+        endpoint); the slower one is cancelled, and a losing stream that already opened is closed.
+        """
+        endpoint = self.router.pick_endpoint(profile)
+        if call is not None:
+            call.endpoint = self._base_url_override or endpoint.base_url
+        client = self.client_registry.async_client(*self._client_key(endpoint))
+        stream = bool(kwargs.get("stream"))
+        tracker = get_latency_tracker()
+        latency_key = (route, stream)
+
+        def request(async_client: "AsyncOpenAI", timeout: Optional[float]):
+            return async_client.chat.completions.create(model=profile.model, messages=messages, timeout=timeout,
+                                                        **profile.params(), **kwargs)
+
+        async def attempt(timeout: Optional[float]):
+            attempt_started = time.perf_counter()
+            response = await hedged(
+                lambda: request(client, timeout),
+                lambda: request(self._hedge_client(profile), timeout),
+                tracker.hedge_delay(latency_key) if LLM_HEDGE_ENABLED else None,
+                discard=(lambda losing_stream: losing_stream.close()) if stream else None
+            )
+            tracker.record(latency_key, time.perf_counter() - attempt_started)
+            return response
+
+        started = time.perf_counter()
+        try:
+            response = await aretry_call(attempt, self.retry_policy)
+        except Exception:
+            self.router.record(route, profile, endpoint, time.perf_counter() - started, ok=False)
+            raise
+        self.router.record(route, profile, endpoint, time.perf_counter() - started)
+        return response
+
+    def _hedge_client(self, profile: ModelProfile) -> "AsyncOpenAI":
+        if self.hedge_client is not None:
+            return self.hedge_client
+        return self.client_registry.async_client(*self._client_key(self.router.pick_endpoint(profile)))
+
+    @staticmethod
+    def _stream_options() -> Dict:
+        """流式请求的额外参数：开启后最后一个 chunk 会携带 usage。"""
+        return {"stream_options": {"include_usage": True}} if OPENAI_STREAM_USAGE else {}
+
+    def stream_response(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None,
+                        route: Optional[str] = None, response_format: Optional[Dict] = None) -> Iterator[str]:
+        """
+        以流式方式调用 Chat Completions API，逐块产出回复文本。调度槽位在整个流式输出期间保持占用。
+
+        Args:
+            messages: 与 generate_response 相同的消息列表。
+            user_key: 与 generate_response 相同。
+            route: 与 generate_response 相同。
+            response_format: 与 generate_response 相同。
+
+        Yields:
+            模型新生成的文本片段 (delta)，调用方负责拼接。
+        """
+        method = route or "stream_response"
+        route, profile = self._route(route)
+        call = self._start_call(method, profile, user_key, stream=True)
+        try:
+            with self._slot(messages, user_key) as ticket:
+                # 只对建立流的请求重试；开始输出后不再重试，避免重复内容
+                stream = self._create(route, profile, messages, call=call, stream=True, **self._stream_options(),
+                                      **_format_kwargs(response_format))
+                self.last_usage = None
+                try:
+                    for chunk in stream:
+                        if getattr(chunk, "usage", None):
+                            self.last_usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            call.first_token()
+                            yield delta
+                    self.scheduler.release(ticket, _total_tokens(self.last_usage))
+                finally:
+                    # 调用方提前停止迭代时 (例如用户关闭页面) 释放底层 HTTP 连接
+                    stream.close()
+        except BaseException as e:
+            call.fail(e)
+            raise
+        call.finish(self.last_usage)
+
+    async def agenerate_response(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None,
+                                 route: Optional[str] = None, response_format: Optional[Dict] = None,
+                                 use_cache: bool = True) -> str:
+        """
+        generate_response 的异步版本，基于 AsyncOpenAI。等待调度槽位时不阻塞事件循环。
+
+        Args:
+            messages: 与 generate_response 相同的消息列表。
+            user_key: 与 generate_response 相同。
+            route: 与 generate_response 相同。
+            response_format: 与 generate_response 相同。
+            use_cache: 与 generate_response 相同。
 
         Returns:
             LLM 的回复内容。
         """
-        response = self.client.chat.completions.create(
-            model=MODEL_NAME,  # 你可以根据需要更改模型
-            messages=messages
-        )
-        return response.choices[0].message.content.strip()
+        self.last_usage = None
+        method = route or "generate_response"
+        route, profile = self._route(route)
+        cache_key = self._cache_key(messages, profile, response_format) if use_cache else None
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, method, "response")
+                return cached
+
+        call = self._start_call(method, profile, user_key)
+        try:
+            async with self._aslot(messages, user_key) as ticket:
+                response = await self._acreate(route, profile, messages, call=call,
+                                               **_format_kwargs(response_format))
+                self.last_usage = response.usage
+                self.scheduler.release(ticket, _total_tokens(response.usage))
+        except BaseException as e:
+            call.fail(e)
+            raise
+        call.finish(response.usage)
+        content = response.choices[0].message.content.strip()
+        if cache_key:
+            self.cache.set(cache_key, content, self.cache_ttl, namespace=type(self).__name__)
+        return content
+
+    async def astream_response(self, messages: List[Dict[str, str]], user_key: Optional[Hashable] = None,
+                               route: Optional[str] = None,
+                               response_format: Optional[Dict] = None) -> AsyncIterator[str]:
+        """
+        stream_response 的异步版本，逐块产出回复文本。
+
+        Args:
+            messages: 与 generate_response 相同的消息列表。
+            user_key: 与 generate_response 相同。
+            route: 与 generate_response 相同。
+            response_format: 与 generate_response 相同。
+
+        Yields:
+            模型新生成的文本片段 (delta)。
+        """
+        method = route or "stream_response"
+        route, profile = self._route(route)
+        call = self._start_call(method, profile, user_key, stream=True)
+        try:
+            async with self._aslot(messages, user_key) as ticket:
+                stream = await self._acreate(route, profile, messages, call=call, stream=True,
+                                             **self._stream_options(), **_format_kwargs(response_format))
+                self.last_usage = None
+                try:
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None):
+                            self.last_usage = chunk.usage
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            call.first_token()
+                            yield delta
+                    self.scheduler.release(ticket, _total_tokens(self.last_usage))
+                finally:
+                    await stream.close()
+        except BaseException as e:
+            call.fail(e)
+            raise
+        call.finish(self.last_usage)
+
+    # Structured (JSON) outputs, shared by the sync and async APIs below.
+
+    def _structured_setup(self, messages: List[Dict[str, str]], route: Optional[str], name: str,
+                          schema: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """本路由的 response_format (profile 不支持 JSON 模式时为 None) 与校验后结果的缓存键。"""
+        _, profile = self._route(route)
+        fmt = structured_response_format(profile.structured_output, name, schema)
+        return fmt, self._cache_key(messages, profile, fmt or {"schema": name})
+
+    def _parse_structured(self, method: str, text: str, schema: Dict,
+                          final: bool) -> Tuple[Optional[Dict], Optional[StructuredOutputError]]:
+        """解析并校验回复，记录结果 (strict / recovered / invalid / failed)；最后一次仍失败时抛出异常。"""
+        telemetry = get_telemetry()
+        agent = type(self).__name__
+        try:
+            value, strict = parse_json_response(text, schema)
+        except StructuredOutputError as e:
+            telemetry.record_structured_output(agent, method, "failed" if final else "invalid")
+            if final:
+                raise
+            logger.warning(f"{agent}.{method} returned invalid JSON ({e}); asking again")
+            return None, e
+        # recovered: 纯 json.loads 会失败、由容错解析器挽回的回复，即省下的一次重新请求
+        telemetry.record_structured_output(agent, method, "strict" if strict else "recovered")
+        return value, None
+
+    @staticmethod
+    def _repair_messages(messages: List[Dict[str, str]], text: str,
+                         error: StructuredOutputError) -> List[Dict[str, str]]:
+        return messages + [
+            {"role": "assistant", "content": text},
+            {"role": "user", "content": f"That reply is not valid JSON for the schema ({error}). "
+                                        f"Reply with only the corrected JSON object."},
+        ]
+
+    def _cache_structured(self, cache_key: Optional[str], value: Dict) -> None:
+        if cache_key:
+            self.cache.set(cache_key, json.dumps(value, ensure_ascii=False), self.cache_ttl,
+                           namespace=type(self).__name__)
+
+    def generate_structured(self, messages: List[Dict[str, str]], schema: Dict, name: str,
+                            user_key: Optional[Hashable] = None, route: Optional[str] = None) -> Dict:
+        """
+        生成符合 ``schema`` 的 JSON 对象。
+
+        profile 支持时请求 JSON 模式 (structured_output)；回复用容错解析器解析，可去掉代码块和
+        前后的说明文字。仍无法解析或不符合 schema 时附上错误重新请求，最多
+        LLM_STRUCTURED_OUTPUT_RETRIES 次。只有校验通过的结果才写入响应缓存。
+
+        Args:
+            messages: 与 generate_response 相同的消息列表。
+            schema: 回复必须满足的 JSON schema。
+            name: schema 名称 (json_schema 模式需要)。
+            user_key: 与 generate_response 相同。
+            route: 与 generate_response 相同。
+
+        Returns:
+            解析后的 JSON 对象。
+
+        Raises:
+            StructuredOutputError: 重试后回复仍无效。
+        """
+        method = route or "generate_structured"
+        fmt, cache_key = self._structured_setup(messages, route, name, schema)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, method, "response")
+                return json.loads(cached)
+
+        attempt = 0
+        while True:
+            text = self.generate_response(messages, user_key, route, response_format=fmt, use_cache=False)
+            value, error = self._parse_structured(method, text, schema, attempt >= LLM_STRUCTURED_OUTPUT_RETRIES)
+            if value is not None:
+                self._cache_structured(cache_key, value)
+                return value
+            messages = self._repair_messages(messages, text, error)
+            attempt += 1
+
+    async def agenerate_structured(self, messages: List[Dict[str, str]], schema: Dict, name: str,
+                                   user_key: Optional[Hashable] = None, route: Optional[str] = None) -> Dict:
+        """generate_structured 的异步版本。"""
+        method = route or "generate_structured"
+        fmt, cache_key = self._structured_setup(messages, route, name, schema)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, method, "response")
+                return json.loads(cached)
+
+        attempt = 0
+        while True:
+            text = await self.agenerate_response(messages, user_key, route, response_format=fmt, use_cache=False)
+            value, error = self._parse_structured(method, text, schema, attempt >= LLM_STRUCTURED_OUTPUT_RETRIES)
+            if value is not None:
+                self._cache_structured(cache_key, value)
+                return value
+            messages = self._repair_messages(messages, text, error)
+            attempt += 1
+
+    async def astream_structured(self, messages: List[Dict[str, str]], schema: Dict, name: str,
+                                 user_key: Optional[Hashable] = None,
+                                 route: Optional[str] = None) -> AsyncIterator[Tuple[str, object]]:
+        """
+        以流式方式生成 JSON 对象，每个顶层字段的值完整后立即产出 ``(key, value)``。
+
+        字段已经交给调用方，因此不做重新请求：完整对象不符合 schema 时抛出 StructuredOutputError。
+        """
+        method = route or "generate_structured"
+        fmt, cache_key = self._structured_setup(messages, route, name, schema)
+        if cache_key:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, method, "response")
+                for item in json.loads(cached).items():
+                    yield item
+                return
+
+        parser = IncrementalJSONParser()
+        chunks = []
+        try:
+            async for delta in self.astream_response(messages, user_key, route, response_format=fmt):
+                chunks.append(delta)
+                for item in parser.feed(delta):
+                    yield item
+        except StructuredOutputError:
+            get_telemetry().record_structured_output(type(self).__name__, method, "failed")
+            raise
+        value, _ = self._parse_structured(method, "".join(chunks), schema, final=True)
+        self._cache_structured(cache_key, value)
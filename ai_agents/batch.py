@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Offline batch generation in the OpenAI Batch API format.
+
+Requests are JSONL lines::
+
+    {"custom_id": "...", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+
+and results come back as::
+
+    {"custom_id": "...", "response": {"status_code": 200, "body": <chat completion>}, "error": null}
+
+``BatchBackend`` hides where a batch runs. ``OpenAIBatchBackend`` uploads the file to
+the provider's Batch API (24h completion window, batch pricing); ``LocalBatchBackend``
+answers every request immediately from a responder function and keeps its files in a
+directory, as a stand-in for tests and development.
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional
+
+from loguru import logger
+
+from settings import BATCH_BACKEND, BATCH_COMPLETION_WINDOW, BATCH_LOCAL_DIR, BATCH_POLL_INTERVAL
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+# Terminal states of the OpenAI Batch API
+FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def batch_request_line(custom_id: str, body: Dict) -> Dict:
+    return {"custom_id": custom_id, "method": "POST", "url": CHAT_COMPLETIONS_URL, "body": body}
+
+
+def result_content(result: Dict) -> Optional[str]:
+    """The assistant message of a successful result line, or None if the request failed."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    return response["body"]["choices"][0]["message"]["content"].strip()
+
+
+def result_error(result: Dict) -> str:
+    error = result.get("error") or (result.get("response") or {}).get("body", {}).get("error")
+    return json.dumps(error) if error else f"HTTP {(result.get('response') or {}).get('status_code')}"
+
+
+class BatchBackend(ABC):
+    @abstractmethod
+    def submit(self, input_path: str) -> str:
+        """Submit a JSONL request file; returns the batch id."""
+
+    @abstractmethod
+    def status(self, batch_id: str) -> str:
+        """One of the OpenAI Batch API statuses ("validating", "in_progress", "completed", ...)."""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> Iterator[Dict]:
+        """Stream the result lines (successes and errors) of a finished batch."""
+
+    def wait(self, batch_id: str, poll_interval: float = BATCH_POLL_INTERVAL,
+             timeout: Optional[float] = None) -> str:
+        """Poll until the batch reaches a terminal status and return it."""
+        started = time.monotonic()
+        while True:
+            batch_status = self.status(batch_id)
+            if batch_status in FINISHED_STATUSES:
+                return batch_status
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Batch {batch_id} still {batch_status} after {timeout}s")
+            time.sleep(poll_interval)
+
+
+class OpenAIBatchBackend(BatchBackend):
+    def __init__(self, client: "OpenAI", completion_window: str = BATCH_COMPLETION_WINDOW):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as file:
+            input_file = self.client.files.create(file=file, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window=self.completion_window
+        )
+        logger.info(f"Submitted batch {batch.id} ({input_path})")
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id: str) -> Iterator[Dict]:
+        batch = self.client.batches.retrieve(batch_id)
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def echo_responder(body: Dict) -> str:
+    """
+    Default local responder: a JSON object echoing the model and the last user message,
+    or, for requests with a JSON response format, the fake backend's instance of the schema.
+    """
+    if (body.get("response_format") or {}).get("type") in ("json_schema", "json_object"):
+        from .fake_llm import get_fake_llm  # pylint: disable=import-outside-toplevel
+        return " ".join(get_fake_llm().plan(body["messages"], body["response_format"]).tokens)
+    user_messages = [message["content"] for message in body["messages"] if message["role"] == "user"]
+    return json.dumps({"model": body["model"], "echo": user_messages[-1] if user_messages else ""})
+
+
+class LocalBatchBackend(BatchBackend):
+    """
+    File-based stand-in for the Batch API: ``submit`` copies the input to
+    ``<directory>/<batch_id>/input.jsonl`` and writes ``output.jsonl`` right away,
+    answering each request with ``responder(body)``.
+    """
+
+    def __init__(self, directory: str = BATCH_LOCAL_DIR, responder: Callable[[Dict], str] = echo_responder):
+        self.directory = directory
+        self.responder = responder
+
+    def _path(self, batch_id: str, name: str) -> str:
+        return os.path.join(self.directory, batch_id, name)
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        os.makedirs(os.path.join(self.directory, batch_id))
+        shutil.copyfile(input_path, self._path(batch_id, "input.jsonl"))
+        with open(input_path, encoding="utf-8") as requests, \
+                open(self._path(batch_id, "output.jsonl"), "w", encoding="utf-8") as output:
+            for line in requests:
+                if line.strip():
+                    output.write(json.dumps(self._answer(json.loads(line)), ensure_ascii=False) + "\n")
+        return batch_id
+
+    def _answer(self, request: Dict) -> Dict:
+        try:
+            content = self.responder(request["body"])
+        except Exception as e:  # pylint: disable=broad-except
+            return {"custom_id": request["custom_id"], "response": None,
+                    "error": {"code": "responder_error", "message": str(e)}}
+        body = {
+            "object": "chat.completion",
+            "model": request["body"]["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+        }
+        return {"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None}
+
+    def status(self, batch_id: str) -> str:
+        return "completed" if os.path.exists(self._path(batch_id, "output.jsonl")) else "failed"
+
+    def results(self, batch_id: str) -> Iterator[Dict]:
+        with open(self._path(batch_id, "output.jsonl"), encoding="utf-8") as output:
+            for line in output:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def get_batch_backend(client: Optional["OpenAI"] = None) -> BatchBackend:
+    """The backend selected by settings.BATCH_BACKEND ("openai" or "local")."""
+    if BATCH_BACKEND == "local":
+        return LocalBatchBackend()
+    if client is None:
+        raise ValueError("The OpenAI batch backend needs a client")
+    return OpenAIBatchBackend(client)
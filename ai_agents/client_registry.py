@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide OpenAI clients over one shared, pooled HTTP transport.
+
+``ClientRegistry`` hands out one ``OpenAI`` / ``AsyncOpenAI`` client per
+(base_url, api_key), and all of them send through a single httpx client with
+keep-alive, pool limits and optional HTTP/2. Agents are built per request, so a
+new learning session reuses warm connections instead of paying fresh TCP and TLS
+handshakes and leaving an idle pool behind.
+
+Async clients are kept per event loop: pooled connections belong to the loop that
+opened them. Sync callers of async agent code (``MetaPromptAgent.collect_all_preferences``)
+all run on the one long-lived loop of ``background_loop``.
+
+The SDK's own retries are disabled (``max_retries=0``): ``resilience.retry_call`` is the
+only retry layer, so a call makes at most ``LLM_MAX_ATTEMPTS`` requests with full-jitter
+backoff, and the per-attempt ``timeout=`` stays within ``LLM_DEADLINE``.
+
+``ConnectionStats`` counts requests, newly opened connections and TLS handshakes
+per host from httpcore trace events; in steady state ``connections`` stops growing
+while ``requests`` keeps counting. The counters are exported on /metrics.
+"""
+import asyncio
+import importlib.util
+import threading
+import weakref
+from collections import defaultdict
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+from loguru import logger
+
+from settings import (LLM_BACKEND, LLM_HTTP2, LLM_HTTP_KEEPALIVE_EXPIRY, LLM_HTTP_MAX_CONNECTIONS,
+                      LLM_HTTP_MAX_KEEPALIVE)
+
+if TYPE_CHECKING:
+    import httpx
+    from openai import AsyncOpenAI, OpenAI
+
+ClientKey = Tuple[Optional[str], str]
+
+# httpcore trace events -> ConnectionStats counter
+_TRACE_EVENTS = {
+    "connection.connect_tcp.complete": "connections",
+    "connection.connect_unix_socket.complete": "connections",
+    "connection.start_tls.complete": "tls_handshakes",
+}
+CONNECTION_COUNTERS = ("requests", "connections", "tls_handshakes")
+
+
+class ConnectionStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(CONNECTION_COUNTERS, 0))
+
+    def record(self, host: str, counter: str) -> None:
+        with self._lock:
+            self._counts[host][counter] += 1
+
+    def trace(self, host: str):
+        def on_event(event_name: str, _info: Dict) -> None:
+            counter = _TRACE_EVENTS.get(event_name)
+            if counter:
+                self.record(host, counter)
+        return on_event
+
+    def atrace(self, host: str):
+        async def on_event(event_name: str, _info: Dict) -> None:
+            counter = _TRACE_EVENTS.get(event_name)
+            if counter:
+                self.record(host, counter)
+        return on_event
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Counters per host, plus ``reuse_ratio``: the share of requests sent on an already open connection."""
+        with self._lock:
+            result = {host: dict(counts) for host, counts in self._counts.items()}
+        for counts in result.values():
+            requests = counts["requests"]
+            counts["reuse_ratio"] = max(requests - counts["connections"], 0) / requests if requests else 0.0
+        return result
+
+
+class _NoLoop:
+    """Key of the async clients created outside a running event loop."""
+
+
+_NO_LOOP = _NoLoop()
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+class ClientRegistry:
+    def __init__(self, max_connections: int = LLM_HTTP_MAX_CONNECTIONS,
+                 max_keepalive_connections: int = LLM_HTTP_MAX_KEEPALIVE,
+                 keepalive_expiry: float = LLM_HTTP_KEEPALIVE_EXPIRY, http2: bool = LLM_HTTP2):
+        if http2 and not http2_available():
+            logger.warning('LLM_HTTP2 is set but the h2 package is missing (pip install "httpx[http2]"); '
+                           "using HTTP/1.1")
+            http2 = False
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+        self.stats = ConnectionStats()
+        self._lock = threading.Lock()
+        self._http_client: Optional["httpx.Client"] = None
+        self._clients: Dict[ClientKey, "OpenAI"] = {}
+        # event loop -> (shared httpx.AsyncClient, clients bound to it); entries go away with their loop
+        self._async: "weakref.WeakKeyDictionary[object, Tuple[httpx.AsyncClient, Dict[ClientKey, AsyncOpenAI]]]" = \
+            weakref.WeakKeyDictionary()
+
+    def client(self, base_url: Optional[str], api_key: str) -> "OpenAI":
+        if LLM_BACKEND == "fake":
+            from .fake_llm import FakeOpenAI  # pylint: disable=import-outside-toplevel
+            return FakeOpenAI()
+        key = (base_url, api_key)
+        client = self._clients.get(key)
+        if client is None:
+            from openai import DefaultHttpxClient, OpenAI  # pylint: disable=import-outside-toplevel
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    if self._http_client is None:
+                        self._http_client = DefaultHttpxClient(**self._http_options(self._on_request))
+                    client = OpenAI(api_key=api_key, base_url=base_url, http_client=self._http_client,
+                                    max_retries=0)
+                    self._clients[key] = client
+        return client
+
+    def async_client(self, base_url: Optional[str], api_key: str) -> "AsyncOpenAI":
+        if LLM_BACKEND == "fake":
+            from .fake_llm import FakeAsyncOpenAI  # pylint: disable=import-outside-toplevel
+            return FakeAsyncOpenAI()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = _NO_LOOP
+        key = (base_url, api_key)
+        entry = self._async.get(loop)
+        client = entry[1].get(key) if entry is not None else None
+        if client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient  # pylint: disable=import-outside-toplevel
+            with self._lock:
+                entry = self._async.get(loop)
+                if entry is None:
+                    self._drop_closed_loops()
+                    entry = (DefaultAsyncHttpxClient(**self._http_options(self._on_async_request)), {})
+                    self._async[loop] = entry
+                client = entry[1].get(key)
+                if client is None:
+                    client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=entry[0], max_retries=0)
+                    entry[1][key] = client
+        return client
+
+    def _drop_closed_loops(self) -> None:
+        # Open connections reference their loop, so an entry would otherwise keep a finished loop alive
+        for loop in list(self._async.keys()):
+            if loop is not _NO_LOOP and loop.is_closed():
+                del self._async[loop]
+
+    def _http_options(self, on_request) -> Dict:
+        import httpx  # pylint: disable=import-outside-toplevel
+
+        return {
+            "limits": httpx.Limits(max_connections=self.max_connections,
+                                   max_keepalive_connections=self.max_keepalive_connections,
+                                   keepalive_expiry=self.keepalive_expiry),
+            "http2": self.http2,
+            "event_hooks": {"request": [on_request]},
+        }
+
+    def _on_request(self, request: "httpx.Request") -> None:
+        self.stats.record(request.url.host, "requests")
+        request.extensions["trace"] = self.stats.trace(request.url.host)
+
+    async def _on_async_request(self, request: "httpx.Request") -> None:
+        self.stats.record(request.url.host, "requests")
+        request.extensions["trace"] = self.stats.atrace(request.url.host)
+
+    def close(self) -> None:
+        """Close the sync transport; async transports are dropped with their event loops."""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+            self._http_client = None
+            self._clients.clear()
+
+
+_client_registry: Optional[ClientRegistry] = None
+_client_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    global _client_registry
+    if _client_registry is None:
+        with _client_registry_lock:
+            if _client_registry is None:
+                _client_registry = ClientRegistry()
+    return _client_registry
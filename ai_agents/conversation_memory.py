@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Token-budgeted conversation memory for LearningAgent.
+
+The most recent turns are kept verbatim while they fit in MEMORY_TOKEN_BUDGET
+(and MEMORY_MAX_TURNS); older turns are folded into a running summary by a
+background worker, so the prompt size per turn stays roughly constant no matter
+how long a session runs and the request path never waits for summarization.
+"""
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from settings import MEMORY_MAX_SESSIONS, MEMORY_MAX_TURNS, MEMORY_SUMMARY_MAX_WORDS, MEMORY_TOKEN_BUDGET
+
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+# One worker is enough: summaries are small and off the request path
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+
+Summarizer = Callable[[str, List[Dict[str, str]]], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate: one token per CJK character, four characters per token otherwise."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class ConversationMemory:
+    def __init__(self,
+                 summarizer: Optional[Summarizer] = None,
+                 token_budget: int = MEMORY_TOKEN_BUDGET,
+                 max_turns: int = MEMORY_MAX_TURNS):
+        """
+        Args:
+            summarizer: ``(previous_summary, turns) -> new_summary``. Defaults to SummaryAgent.
+            token_budget: Token budget for the summary plus the verbatim turns.
+            max_turns: Maximum number of verbatim exchanges (user + assistant) kept.
+        """
+        self.summarizer = summarizer
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.summary = ""
+        self._recent: Deque[Dict[str, str]] = deque()
+        self._recent_tokens = 0
+        self._to_fold: List[Dict[str, str]] = []
+        self._folding = False
+        self._lock = threading.Lock()
+
+    def add_turn(self, user_input: str, response: str) -> None:
+        """Record one exchange and schedule folding if the budget is exceeded."""
+        with self._lock:
+            for message in ({"role": "user", "content": user_input},
+                            {"role": "assistant", "content": response}):
+                self._recent.append(message)
+                self._recent_tokens += estimate_tokens(message["content"])
+            self._evict_locked()
+            schedule = bool(self._to_fold) and not self._folding
+            if schedule:
+                self._folding = True
+        if schedule:
+            _summary_executor.submit(self._fold)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Summary (if any) followed by the verbatim recent turns, ready to splice into a prompt."""
+        with self._lock:
+            messages = []
+            if self.summary:
+                messages.append({"role": "system",
+                                 "content": f"Summary of the earlier conversation:\n{self.summary}"})
+            messages.extend(self._recent)
+            return messages
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self.summary and not self._recent
+
+    def _evict_locked(self) -> None:
+        # Evict whole exchanges so a user message is never separated from its reply
+        budget = self.token_budget - estimate_tokens(self.summary)
+        while self._recent and (len(self._recent) > 2 * self.max_turns or self._recent_tokens > budget):
+            for _ in range(min(2, len(self._recent))):
+                message = self._recent.popleft()
+                self._recent_tokens -= estimate_tokens(message["content"])
+                self._to_fold.append(message)
+
+    def _fold(self) -> None:
+        while True:
+            with self._lock:
+                turns, previous = list(self._to_fold), self.summary
+                if not turns:
+                    self._folding = False
+                    return
+            try:
+                summary = self._summarize(previous, turns)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Conversation summary refresh failed; keeping the previous summary")
+                with self._lock:
+                    self._folding = False
+                return
+            with self._lock:
+                self.summary = summary
+                del self._to_fold[:len(turns)]
+                # A longer summary leaves less room for verbatim turns
+                self._evict_locked()
+
+    def _summarize(self, previous: str, turns: List[Dict[str, str]]) -> str:
+        if self.summarizer is None:
+            from .summary_agent import SummaryAgent  # pylint: disable=import-outside-toplevel
+            agent = SummaryAgent()
+            self.summarizer = lambda summary, new_turns: agent.summarize(summary, new_turns,
+                                                                         MEMORY_SUMMARY_MAX_WORDS)
+        return self.summarizer(previous, turns)
+
+
+class ConversationMemoryStore:
+    """Process-wide memories keyed by learning session id, bounded by MEMORY_MAX_SESSIONS (LRU)."""
+
+    def __init__(self, max_sessions: int = MEMORY_MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._memories: "OrderedDict[int, ConversationMemory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: int,
+            loader: Optional[Callable[[], List[Dict[str, str]]]] = None) -> ConversationMemory:
+        """
+        Return the memory of a session, creating it on first use.
+
+        ``loader`` returns the persisted transcript as chat messages; it is only called
+        when the memory is not resident (e.g. after a restart or LRU eviction).
+        """
+        with self._lock:
+            memory = self._memories.get(session_id)
+            if memory is not None:
+                self._memories.move_to_end(session_id)
+                return memory
+
+        memory = ConversationMemory()
+        history = loader() if loader else []
+        for user_message, assistant_message in zip(history[::2], history[1::2]):
+            memory.add_turn(user_message["content"], assistant_message["content"])
+
+        with self._lock:
+            memory = self._memories.setdefault(session_id, memory)
+            self._memories.move_to_end(session_id)
+            while len(self._memories) > self.max_sessions:
+                self._memories.popitem(last=False)
+        return memory
+
+    def discard(self, session_id: int) -> None:
+        with self._lock:
+            self._memories.pop(session_id, None)
+
+
+_store = ConversationMemoryStore()
+
+
+def get_memory_store() -> ConversationMemoryStore:
+    return _store
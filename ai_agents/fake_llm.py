@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic stand-in for an OpenAI-compatible chat completions API.
+
+``FakeOpenAI`` / ``FakeAsyncOpenAI`` implement the ``client.chat.completions.create``
+surface in-process (plain and streaming responses, ``usage`` with
+``prompt_tokens_details.cached_tokens``, per-request ``timeout``). ``serve`` exposes
+the same behaviour over HTTP (JSON and SSE), so the real OpenAI client can be pointed
+at it::
+
+    python -m ai_agents.fake_llm --port 8765 --latency-ms 300 --tokens-per-second 50
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py
+
+With ``LLM_BACKEND=fake`` the agents use the in-process clients directly. Latency is
+drawn from a log-normal distribution around the configured median, tokens are
+emitted at a fixed rate and errors are injected at a configurable rate, all from
+a seeded RNG so runs are reproducible.
+"""
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from openai import APIStatusError, APITimeoutError, InternalServerError, RateLimitError
+
+from settings import FAKE_LLM_ERROR_RATE, FAKE_LLM_LATENCY_MS, FAKE_LLM_TOKENS_PER_SECOND
+from .structured_output import schema_from_instructions
+
+_WORDS = ("learn practice review concept example exercise explain step focus skill "
+          "question answer summary detail goal progress level topic idea method").split()
+
+
+@dataclass
+class FakeLLMConfig:
+    # 首个 token 前的延迟: 对数正态分布的中位数 (秒) 与 sigma
+    latency_median_s: float = 0.0
+    latency_sigma: float = 0.5
+    # 生成速度，0 表示整段回复立即返回
+    tokens_per_second: float = 0.0
+    completion_tokens: int = 64
+    # 注入错误的概率与状态码 (0 表示超时)
+    error_rate: float = 0.0
+    error_status: int = 500
+    # 前缀缓存命中时报告的 cached_tokens 占 prompt 的比例
+    cached_token_ratio: float = 0.0
+    seed: int = 0
+    # messages -> 回复文本；默认根据最后一条用户消息生成确定的文本 (请求 JSON 模式时为符合 schema 的 JSON)
+    reply: Optional[Callable[[List[Dict[str, str]]], str]] = None
+
+
+@dataclass
+class _Plan:
+    latency_s: float
+    tokens: List[str]
+    prompt_tokens: int
+    error_status: Optional[int]
+
+
+def _default_reply(messages: List[Dict[str, str]], length: int) -> List[str]:
+    last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+    digest = hashlib.sha256(last.encode("utf-8")).digest()
+    return [_WORDS[digest[i % len(digest)] % len(_WORDS)] for i in range(length)]
+
+
+def _example(schema: Dict[str, Any], words: Iterator[str]) -> Any:
+    """A deterministic instance of ``schema``, filled with words from the reply."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _example(subschema, words) for key, subschema in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_example(schema.get("items", {}), words) for _ in range(2)]
+    if kind in ("integer", "number"):
+        return len(next(words))
+    if kind == "boolean":
+        return len(next(words)) % 2 == 0
+    return " ".join(next(words) for _ in range(3))
+
+
+def _json_reply(tokens: List[str], response_format: Dict[str, Any], messages: List[Dict[str, str]]) -> List[str]:
+    words = itertools.cycle(tokens or _WORDS)
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+    else:
+        # JSON mode only guarantees an object; like a real model, follow the schema given in the prompt
+        schema = next((found for found in (schema_from_instructions(m.get("content") or "")
+                                           for m in messages if m["role"] == "system") if found), None)
+    value = _example(schema, words) if schema else {"reply": " ".join(tokens)}
+    return json.dumps(value).split(" ")
+
+
+class FakeLLM:
+    """Shared engine of the in-process clients and the HTTP server."""
+
+    def __init__(self, config: Optional[FakeLLMConfig] = None):
+        self.config = config or FakeLLMConfig()
+        self._rng = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def plan(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None) -> _Plan:
+        config = self.config
+        with self._lock:
+            self.requests += 1
+            latency = self._rng.lognormvariate(0, config.latency_sigma) * config.latency_median_s \
+                if config.latency_median_s else 0.0
+            failed = config.error_rate and self._rng.random() < config.error_rate
+        if config.reply:
+            tokens = config.reply(messages).split(" ")
+        else:
+            tokens = _default_reply(messages, config.completion_tokens)
+            if response_format and response_format.get("type") in ("json_schema", "json_object"):
+                tokens = _json_reply(tokens, response_format, messages)
+        prompt_tokens = sum(len((m.get("content") or "").split()) for m in messages)
+        return _Plan(latency, tokens, prompt_tokens, config.error_status if failed else None)
+
+    def token_delay(self) -> float:
+        return 1.0 / self.config.tokens_per_second if self.config.tokens_per_second else 0.0
+
+    def usage(self, plan: _Plan) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": plan.prompt_tokens,
+            "completion_tokens": len(plan.tokens),
+            "total_tokens": plan.prompt_tokens + len(plan.tokens),
+            "prompt_tokens_details": {"cached_tokens": int(plan.prompt_tokens * self.config.cached_token_ratio)},
+        }
+
+    def completion(self, model: str, plan: _Plan) -> Dict[str, Any]:
+        return {
+            "id": f"chatcmpl-fake-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": " ".join(plan.tokens)}}],
+            "usage": self.usage(plan),
+        }
+
+    def chunks(self, model: str, plan: _Plan, include_usage: bool) -> Iterator[Dict[str, Any]]:
+        completion_id = f"chatcmpl-fake-{uuid.uuid4().hex[:12]}"
+        for index, token in enumerate(plan.tokens):
+            yield {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                   "choices": [{"index": 0, "delta": {"content": token if index == 0 else f" {token}"},
+                                "finish_reason": None}]}
+        if include_usage:
+            yield {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                   "choices": [], "usage": self.usage(plan)}
+
+
+class _FakeHTTPResponse:
+    """Just enough of an httpx.Response for the OpenAI error classes."""
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+        self.request = None
+
+
+def _error(status: int) -> Exception:
+    if status == 0:
+        return APITimeoutError(request=None)
+    error_class = RateLimitError if status == 429 else InternalServerError if status >= 500 else APIStatusError
+    return error_class(f"Injected error {status}", response=_FakeHTTPResponse(status), body=None)
+
+
+def _namespace(value: Any) -> Any:
+    """Wire-format dicts -> attribute access objects, like the OpenAI response models."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_namespace(item) for item in value]
+    return value
+
+
+def _request_plan(llm: FakeLLM, messages, timeout: Optional[float],
+                  response_format: Optional[Dict[str, Any]] = None) -> Tuple[_Plan, float]:
+    plan = llm.plan(messages, response_format)
+    if timeout is not None and plan.latency_s > timeout:
+        return plan, timeout
+    return plan, plan.latency_s
+
+
+class _Stream:
+    def __init__(self, chunks: Iterator[Dict[str, Any]], token_delay: float):
+        self._chunks = chunks
+        self._token_delay = token_delay
+        self._closed = False
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            if self._closed:
+                return
+            if self._token_delay and chunk["choices"]:
+                time.sleep(self._token_delay)
+            yield _namespace(chunk)
+
+    def close(self) -> None:
+        self._closed = True
+
+
+class _AsyncStream(_Stream):
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for chunk in self._chunks:
+            if self._closed:
+                return
+            if self._token_delay and chunk["choices"]:
+                await asyncio.sleep(self._token_delay)
+            yield _namespace(chunk)
+
+    async def close(self) -> None:
+        self._closed = True
+
+
+class _Completions:
+    def __init__(self, llm: FakeLLM):
+        self._llm = llm
+
+    def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False,
+               timeout: Optional[float] = None, stream_options: Optional[Dict] = None,
+               response_format: Optional[Dict] = None, **_):
+        plan, wait = _request_plan(self._llm, messages, timeout, response_format)
+        if wait:
+            time.sleep(wait)
+        if wait < plan.latency_s:
+            raise _error(0)
+        if plan.error_status is not None:
+            raise _error(plan.error_status)
+        if stream:
+            include_usage = bool((stream_options or {}).get("include_usage"))
+            return _Stream(self._llm.chunks(model, plan, include_usage), self._llm.token_delay())
+        if self._llm.token_delay():
+            time.sleep(self._llm.token_delay() * len(plan.tokens))
+        return _namespace(self._llm.completion(model, plan))
+
+
+class _AsyncCompletions(_Completions):
+    async def create(self, model: str, messages: List[Dict[str, str]], stream: bool = False,
+                     timeout: Optional[float] = None, stream_options: Optional[Dict] = None,
+                     response_format: Optional[Dict] = None, **_):
+        plan, wait = _request_plan(self._llm, messages, timeout, response_format)
+        if wait:
+            await asyncio.sleep(wait)
+        if wait < plan.latency_s:
+            raise _error(0)
+        if plan.error_status is not None:
+            raise _error(plan.error_status)
+        if stream:
+            include_usage = bool((stream_options or {}).get("include_usage"))
+            return _AsyncStream(self._llm.chunks(model, plan, include_usage), self._llm.token_delay())
+        if self._llm.token_delay():
+            await asyncio.sleep(self._llm.token_delay() * len(plan.tokens))
+        return _namespace(self._llm.completion(model, plan))
+
+
+class FakeOpenAI:
+    def __init__(self, llm: Optional[FakeLLM] = None, **_):
+        self.llm = llm or get_fake_llm()
+        self.chat = SimpleNamespace(completions=_Completions(self.llm))
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, llm: Optional[FakeLLM] = None, **_):
+        self.llm = llm or get_fake_llm()
+        self.chat = SimpleNamespace(completions=_AsyncCompletions(self.llm))
+
+    async def close(self) -> None:
+        pass
+
+
+_fake_llm = FakeLLM(FakeLLMConfig(
+    latency_median_s=FAKE_LLM_LATENCY_MS / 1000,
+    tokens_per_second=FAKE_LLM_TOKENS_PER_SECOND,
+    error_rate=FAKE_LLM_ERROR_RATE,
+))
+
+
+def get_fake_llm() -> FakeLLM:
+    return _fake_llm
+
+
+def configure_fake_llm(config: FakeLLMConfig) -> FakeLLM:
+    """Replace the shared engine's configuration (and reseed it)."""
+    global _fake_llm
+    _fake_llm = FakeLLM(config)
+    return _fake_llm
+
+
+def make_handler(llm: FakeLLM):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def _send_json(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):  # pylint: disable=invalid-name
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            plan = llm.plan(request["messages"], request.get("response_format"))
+            time.sleep(plan.latency_s)
+            if plan.error_status is not None:
+                status = plan.error_status or 504
+                self._send_json(status, {"error": {"message": f"Injected error {status}", "type": "fake"}})
+                return
+            if not request.get("stream"):
+                time.sleep(llm.token_delay() * len(plan.tokens))
+                self._send_json(200, llm.completion(request["model"], plan))
+                return
+
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for chunk in llm.chunks(request["model"], plan, include_usage):
+                if chunk["choices"]:
+                    time.sleep(llm.token_delay())
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text: str) -> None:
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeLLMHandler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, llm: Optional[FakeLLM] = None) -> ThreadingHTTPServer:
+    """Start the HTTP stand-in on a daemon thread; call ``shutdown()`` on the result to stop it."""
+    server = ThreadingHTTPServer((host, port), make_handler(llm or get_fake_llm()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake OpenAI-compatible chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=FAKE_LLM_LATENCY_MS)
+    parser.add_argument("--tokens-per-second", type=float, default=FAKE_LLM_TOKENS_PER_SECOND)
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=FAKE_LLM_ERROR_RATE)
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeLLM(FakeLLMConfig(latency_median_s=args.latency_ms / 1000, tokens_per_second=args.tokens_per_second,
+                                 completion_tokens=args.completion_tokens, error_rate=args.error_rate,
+                                 error_status=args.error_status, seed=args.seed))
+    http_server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1")
+    http_server.serve_forever()
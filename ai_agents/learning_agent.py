@@ -1,48 +1,174 @@
 # -*- coding: utf-8 -*-
+import asyncio
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
 from sqlalchemy.orm import Session
 
+from controllers.identity_cache import ObjectiveSnapshot, UserSnapshot, get_identity_cache
 from controllers.objective_controller import ObjectiveController
 from controllers.user_controller import UserController
+from settings import SEMANTIC_CACHE_ENABLED
+from utils.telemetry import get_telemetry
+from . import prompt_templates
 from .base import BaseAIAgent
+from .scheduler import Priority
+from .conversation_memory import ConversationMemory
+from .message_layout import MessageLayout
+
+if TYPE_CHECKING:
+    from .semantic_cache import SemanticCache
+
+
+NOT_FOUND_MESSAGE = "User or objective not found."
+
+LEARNING_LAYOUT = MessageLayout(prompt_templates.LEARNING_INSTRUCTIONS)
+
+# 路由与遥测中使用的方法名
+LEARNING_ROUTE = "generate_learning_response"
+
+
+async def _single_chunk(text: str) -> AsyncIterator[str]:
+    yield text
 
 
 class LearningAgent(BaseAIAgent):
-    def __init__(self, user_id: int, objective_id: int, db: Session):
+    # Tutoring turns are interactive and always go ahead of background analysis
+    priority = Priority.INTERACTIVE
+
+    def __init__(self, user_id: int, objective_id: int, db: Session,
+                 semantic_cache: Optional["SemanticCache"] = None):
         super().__init__()
         self.user_id = user_id
+        self.user_key = user_id
         self.objective_id = objective_id
         self.db = db
         self.user_controller = UserController(db)
         self.objective_controller = ObjectiveController(db)
+        self.semantic_cache = semantic_cache
+        if self.semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+            # 语义缓存依赖 numpy，未启用时不导入
+            from .semantic_cache import get_semantic_cache  # pylint: disable=import-outside-toplevel
+            self.semantic_cache = get_semantic_cache()
+
+    def _load_context(self) -> Tuple[Optional[UserSnapshot], Optional[ObjectiveSnapshot]]:
+        # Read-through snapshots: a steady-state turn issues no SELECT
+        user = self.user_controller.get_user_snapshot(self.user_id)
+        objective = self.objective_controller.get_objective_snapshot(self.objective_id)
+        return user, objective
+
+    @staticmethod
+    def _semantic_scope(user: UserSnapshot, objective: ObjectiveSnapshot,
+                        prompt_template: Optional[str] = None) -> Tuple:
+        # The reply is conditioned on everything rendered into the system prompt, so the scope
+        # covers the template and every field it is formatted with; answers are only shared
+        # between learners whose prompts are identical
+        template = prompt_template or prompt_templates.GENERAL_LEARNING_PROMPT
+        return (hash(template), objective.name, objective.current_level, objective.target_level,
+                objective.description, user.name, user.occupation, user.age)
+
+    @staticmethod
+    def _build_messages(user: UserSnapshot, objective: ObjectiveSnapshot, user_input: str,
+                        prompt_template: Optional[str] = None,
+                        memory: Optional[ConversationMemory] = None) -> List[Dict[str, str]]:
+        history = memory.messages() if memory else []
+        template = prompt_template or prompt_templates.GENERAL_LEARNING_PROMPT
+        system_messages = get_identity_cache().get_rendered_prompt(
+            template, user, objective,
+            lambda: LearningAgent._render_system_messages(user, objective, template)
+        )
+        return [*system_messages, *history, {"role": "user", "content": user_input}]
+
+    @staticmethod
+    def _render_system_messages(user: UserSnapshot, objective: ObjectiveSnapshot,
+                                prompt_template: str) -> Tuple[Dict[str, str], ...]:
+        fields = {
+            "user_name": user.name,
+            "objective_name": objective.name,  # type: ignore
+            "current_level": objective.current_level,  # type: ignore
+            "target_level": objective.target_level,  # type: ignore
+            "objective_description": objective.description,  # type: ignore
+            "user_occupation": user.occupation,
+            "user_age": user.age
+        }
+
+        if prompt_template == prompt_templates.GENERAL_LEARNING_PROMPT:
+            # 静态指令 -> 学习目标 -> 用户，之后才是历史和本轮输入，最大化可复用的前缀
+            return tuple(LEARNING_LAYOUT.prefix(
+                objective_context=prompt_templates.LEARNING_OBJECTIVE_CONTEXT.format(**fields),
+                user_context=prompt_templates.LEARNING_USER_CONTEXT.format(**fields)
+            ))
+
+        # 自定义模板：整段格式化为一条 system 消息
+        return ({"role": "system", "content": prompt_template.format(**fields)},)
 
-    def generate_learning_response(self, user_input: str, prompt_template: str) -> str:
-        user = self.user_controller.get_user(self.user_id)
-        objective = self.objective_controller.get_objective(self.objective_id)
+    def _remember(self, scope: Tuple, user_input: str, response: str,
+                  memory: Optional[ConversationMemory], cacheable: bool) -> None:
+        if memory is not None:
+            memory.add_turn(user_input, response)
+        if cacheable:
+            self.semantic_cache.store(scope, user_input, response)
 
+    async def _aremember(self, scope: Tuple, user_input: str, response: str,
+                         memory: Optional[ConversationMemory], cacheable: bool) -> None:
+        if memory is not None:
+            memory.add_turn(user_input, response)
+        if cacheable:
+            # 向量化与索引写入都是 CPU 计算，不在事件循环线程上执行
+            await asyncio.to_thread(self.semantic_cache.store, scope, user_input, response)
+
+    def _stream_and_remember(self, stream: Iterator[str], scope: Tuple, user_input: str,
+                             memory: Optional[ConversationMemory], cacheable: bool) -> Iterator[str]:
+        chunks = []
+        for delta in stream:
+            chunks.append(delta)
+            yield delta
+        self._remember(scope, user_input, "".join(chunks).strip(), memory, cacheable)
+
+    async def _astream_and_remember(self, stream: AsyncIterator[str], scope: Tuple, user_input: str,
+                                    memory: Optional[ConversationMemory], cacheable: bool) -> AsyncIterator[str]:
+        chunks = []
+        async for delta in stream:
+            chunks.append(delta)
+            yield delta
+        await self._aremember(scope, user_input, "".join(chunks).strip(), memory, cacheable)
+
+    def _use_semantic_cache(self, memory: Optional[ConversationMemory]) -> bool:
+        # Replies that depend on earlier turns must not be shared across learners
+        return bool(self.semantic_cache) and (memory is None or memory.is_empty())
+
+    def generate_learning_response(self, user_input: str, prompt_template: Optional[str] = None,
+                                   stream: bool = False,
+                                   memory: Optional[ConversationMemory] = None) -> Union[str, Iterator[str]]:
+        """
+        Generate the tutor reply for one turn.
+
+        With ``stream=True`` an iterator of text deltas is returned instead of the
+        full reply, so the UI can render tokens as they arrive. When ``memory`` is
+        given, its summary and recent turns are sent along and the new exchange is
+        added to it once the reply is complete. Without a custom ``prompt_template``
+        the prompt-cache-friendly LEARNING_LAYOUT is used.
+        """
+        user, objective = self._load_context()
         if not user or not objective:
-            return "User or objective not found."
-
-            # 构建 messages 列表
-        messages = [
-            {
-                "role": "system",
-                "content": prompt_template.format(
-                    user_name=user.name,
-                    objective_name=objective.name,  # type: ignore
-                    current_level=objective.current_level,  # type: ignore
-                    target_level=objective.target_level,  # type: ignore
-                    objective_description=objective.description,  # type: ignore
-                    user_occupation=user.occupation,
-                    user_age=user.age
-                )
-            },
-            {
-                "role": "user",
-                "content": user_input
-            }
-        ]
-
-        response = self.generate_response(messages)
+            return iter([NOT_FOUND_MESSAGE]) if stream else NOT_FOUND_MESSAGE
+
+        scope = self._semantic_scope(user, objective, prompt_template)
+        cacheable = self._use_semantic_cache(memory)
+        if cacheable:
+            cached = self.semantic_cache.lookup(scope, user_input)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, LEARNING_ROUTE, "semantic")
+                if memory is not None:
+                    memory.add_turn(user_input, cached)
+                return iter([cached]) if stream else cached
+
+        messages = self._build_messages(user, objective, user_input, prompt_template, memory)
+        if stream:
+            return self._stream_and_remember(self.stream_response(messages, route=LEARNING_ROUTE), scope, user_input,
+                                             memory, cacheable)
+
+        response = self.generate_response(messages, route=LEARNING_ROUTE)
+        self._remember(scope, user_input, response, memory, cacheable)
 
         # 在这里添加后处理逻辑，例如：
         # - 提取关键信息
@@ -51,3 +177,31 @@ class LearningAgent(BaseAIAgent):
         # - 调用第三方 API (如果需要)
 
         return response
+
+    async def agenerate_learning_response(self, user_input: str, prompt_template: Optional[str] = None,
+                                          stream: bool = False,
+                                          memory: Optional[ConversationMemory] = None
+                                          ) -> Union[str, AsyncIterator[str]]:
+        """Async variant of generate_learning_response for event-loop based handlers."""
+        user, objective = self._load_context()
+        if not user or not objective:
+            return _single_chunk(NOT_FOUND_MESSAGE) if stream else NOT_FOUND_MESSAGE
+
+        scope = self._semantic_scope(user, objective, prompt_template)
+        cacheable = self._use_semantic_cache(memory)
+        if cacheable:
+            cached = await asyncio.to_thread(self.semantic_cache.lookup, scope, user_input)
+            if cached is not None:
+                get_telemetry().record_cache_hit(type(self).__name__, LEARNING_ROUTE, "semantic")
+                if memory is not None:
+                    memory.add_turn(user_input, cached)
+                return _single_chunk(cached) if stream else cached
+
+        messages = self._build_messages(user, objective, user_input, prompt_template, memory)
+        if stream:
+            return self._astream_and_remember(self.astream_response(messages, route=LEARNING_ROUTE), scope, user_input,
+                                              memory, cacheable)
+
+        response = await self.agenerate_response(messages, route=LEARNING_ROUTE)
+        await self._aremember(scope, user_input, response, memory, cacheable)
+        return response
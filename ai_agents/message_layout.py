@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt-cache-friendly message layout.
+
+Providers behind OPENAI_BASE_URL discount and speed up requests whose leading
+tokens are byte-identical to a recent request. MessageLayout therefore always
+emits content from most-shared to least-shared:
+
+    1. static instructions   (identical for every request of an agent method)
+    2. objective context     (shared by every turn on the same objective)
+    3. user context          (shared by every turn of the same user)
+    4. conversation history  (shared by the turns of one session)
+    5. the current turn
+"""
+from typing import Dict, Iterable, List
+
+
+class MessageLayout:
+    def __init__(self, instructions: str):
+        """
+        Args:
+            instructions: Static system instructions. Must not contain per-user or
+                per-objective data, otherwise the shared prefix is lost.
+        """
+        self.instructions = instructions.strip()
+
+    def prefix(self, objective_context: str = "", user_context: str = "") -> List[Dict[str, str]]:
+        """System messages shared by every turn with the same objective and user."""
+        messages = [{"role": "system", "content": self.instructions}]
+        context = "\n\n".join(part.strip() for part in (objective_context, user_context) if part)
+        if context:
+            messages.append({"role": "system", "content": context})
+        return messages
+
+    def build(self,
+              turn: str,
+              objective_context: str = "",
+              user_context: str = "",
+              history: Iterable[Dict[str, str]] = ()) -> List[Dict[str, str]]:
+        messages = self.prefix(objective_context, user_context)
+        messages.extend(history)
+        messages.append({"role": "user", "content": turn})
+        return messages
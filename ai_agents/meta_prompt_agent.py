@@ -1,60 +1,85 @@
 # -*- coding: utf-8 -*-
+import asyncio
 import json
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from models.meta_prompt_session import MetaPromptSession
 from models.user import UserModel
+from settings import META_PROMPT_CACHE_TTL, PREFERENCE_COLLECTION_TIMEOUT
+from .background_loop import get_background_loop
 from .base import BaseAIAgent
+from .message_layout import MessageLayout
+from .resilience import DeadlineExceeded
+from .structured_output import (LEARNING_GOALS_SCHEMA, LEARNING_PATH_SCHEMA, USER_PREFERENCES_SCHEMA,
+                                response_format as structured_response_format, schema_instructions)
+
+
+# Static instructions come first and the per-user data last, so every request of a
+# method shares the same leading tokens (see message_layout)
+USER_PREFERENCES_LAYOUT = MessageLayout(
+    "You are an AI learning specialist analyzing user data to determine optimal learning preferences. "
+    "Analyze the user described in the next message. " + schema_instructions(USER_PREFERENCES_SCHEMA)
+)
+PERSONALIZED_PROMPT_LAYOUT = MessageLayout(
+    "You are an AI specializing in creating personalized learning experiences. "
+    "Create a personalized learning prompt for the user whose context is given as JSON in the next message."
+)
+LEARNING_GOALS_LAYOUT = MessageLayout(
+    "You are an AI learning goals analyst. Analyze and structure the learning goals listed in the next message. "
+    + schema_instructions(LEARNING_GOALS_SCHEMA)
+)
+LEARNING_PATH_LAYOUT = MessageLayout(
+    "You are an AI learning path advisor. Create a learning path for the user whose preferences "
+    "are given as JSON in the next message. " + schema_instructions(LEARNING_PATH_SCHEMA)
+)
+PROMPT_STYLE_LAYOUT = MessageLayout(
+    "You are an AI specializing in communication style adaptation. Adapt the prompt in the next message "
+    "to match the user preferences given with it."
+)
+
+
+# custom_id suffixes of the offline onboarding batch requests ("<session id>:<kind>")
+BATCH_PERSONALIZED_PROMPT = "personalized_prompt"
+BATCH_LEARNING_PATH = "learning_path"
+
+
+def _user_profile(user: UserModel) -> str:
+    return f"Name: {user.name}\nAge: {user.age}\nOccupation: {user.occupation}"
 
 
 class MetaPromptAgent(BaseAIAgent):
+    # Onboarding completions are deterministic functions of the user profile
+    cache_ttl = META_PROMPT_CACHE_TTL
+
     def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
         super().__init__(api_key, base_url)
+        # The questions are static; the user's profile is sent after them in its own message
         self.collection_prompts = {
-            "learning_style": "Based on the user's background as a {occupation} aged {age}, "
+            "learning_style": "Based on the user's background (occupation and age), "
                               "what would be their most effective learning style?",
-            "goals": "What specific learning goals would be most beneficial for a {occupation} "
-                     "aged {age} named {name}?",
-            "interests": "What topics or areas might interest a {occupation} like {name} "
-                         "who is {age} years old?",
+            "goals": "What specific learning goals would be most beneficial for this user, "
+                     "given their occupation and age?",
+            "interests": "What topics or areas might interest this user, given their occupation and age?",
+        }
+        self._collection_layouts = {
+            preference_type: MessageLayout(f"You are a learning preference analyst. {question}")
+            for preference_type, question in self.collection_prompts.items()
         }
 
-    def analyze_user_preferences(self, user: UserModel) -> Dict:
-        """Analyze user information to determine optimal learning preferences"""
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI learning specialist analyzing user data to determine "
-                           "optimal learning preferences."
-            },
-            {
-                "role": "user",
-                "content": f"Analyze the following user: Name: {user.name}, Age: {user.age}, Occupation: {user.occupation}"
-            }
-        ]
-        analysis = self.generate_response(messages)
-        return json.loads(analysis)
+    # Message builders are shared by the sync and async APIs below.
 
-    def collect_preferences(self, user: UserModel, preference_type: str) -> str:
-        """Collect specific user preferences through targeted prompting"""
-        prompt_template = self.collection_prompts.get(preference_type)
-        if not prompt_template:
-            raise ValueError(f"Unknown preference type: {preference_type}")
+    @staticmethod
+    def _user_preferences_messages(user: UserModel) -> List[Dict[str, str]]:
+        return USER_PREFERENCES_LAYOUT.build(_user_profile(user))
 
-        prompt = prompt_template.format(
-            name=user.name,
-            age=user.age,
-            occupation=user.occupation
-        )
-
-        messages = [
-            {"role": "system", "content": "You are a learning preference analyst."},
-            {"role": "user", "content": prompt}
-        ]
-        return self.generate_response(messages)
+    def _collect_preferences_messages(self, user: UserModel, preference_type: str) -> List[Dict[str, str]]:
+        layout = self._collection_layouts.get(preference_type)
+        if not layout:
+            raise ValueError(f"Unknown preference type: {preference_type}")
+        return layout.build(_user_profile(user))
 
-    def generate_personalized_prompt(self, session: MetaPromptSession) -> str:
-        """Generate a personalized learning prompt based on collected preferences"""
+    @staticmethod
+    def _personalized_prompt_messages(session: MetaPromptSession) -> List[Dict[str, str]]:
         preferences = session.collected_preferences
         user = session.user
 
@@ -68,63 +93,148 @@ class MetaPromptAgent(BaseAIAgent):
                 "occupation": user.occupation
             }
         }
+        return PERSONALIZED_PROMPT_LAYOUT.build(json.dumps(context, sort_keys=True))
 
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI specializing in creating personalized learning experiences."
-            },
-            {
-                "role": "user",
-                "content": f"Create a personalized learning prompt for a user with "
-                           f"the following context: {json.dumps(context)}"
-            }
-        ]
-        return self.generate_response(messages)
+    @staticmethod
+    def _learning_goals_messages(goals: List[str]) -> List[Dict[str, str]]:
+        return LEARNING_GOALS_LAYOUT.build(json.dumps(goals))
+
+    @staticmethod
+    def _learning_path_messages(session: MetaPromptSession) -> List[Dict[str, str]]:
+        return LEARNING_PATH_LAYOUT.build(json.dumps(session.collected_preferences, sort_keys=True))
+
+    @staticmethod
+    def _prompt_style_messages(prompt: str, user_preferences: Dict) -> List[Dict[str, str]]:
+        return PROMPT_STYLE_LAYOUT.build(
+            f"Preferences: {json.dumps(user_preferences, sort_keys=True)}\n\nPrompt:\n{prompt}"
+        )
+
+    def analyze_user_preferences(self, user: UserModel) -> Dict:
+        """Analyze user information to determine optimal learning preferences"""
+        return self.generate_structured(self._user_preferences_messages(user), USER_PREFERENCES_SCHEMA,
+                                        "user_preferences", user.id, route="analyze_user_preferences")
+
+    def collect_preferences(self, user: UserModel, preference_type: str) -> str:
+        """Collect specific user preferences through targeted prompting"""
+        return self.generate_response(self._collect_preferences_messages(user, preference_type), user.id,
+                                      route="collect_preferences")
+
+    def generate_personalized_prompt(self, session: MetaPromptSession) -> str:
+        """Generate a personalized learning prompt based on collected preferences"""
+        return self.generate_response(self._personalized_prompt_messages(session), session.user_id,
+                                      route="generate_personalized_prompt")
 
     def analyze_learning_goals(self, goals: List[str]) -> Dict:
         """Analyze and structure learning goals for better personalization"""
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI learning goals analyst."
-            },
-            {
-                "role": "user",
-                "content": f"Analyze and structure these learning goals: {goals}"
-            }
-        ]
-        analysis = self.generate_response(messages)
-        return json.loads(analysis)
+        return self.generate_structured(self._learning_goals_messages(goals), LEARNING_GOALS_SCHEMA,
+                                        "learning_goals", route="analyze_learning_goals")
 
     def suggest_learning_path(self, user: UserModel, session: MetaPromptSession) -> Dict:
         """Suggest a personalized learning path based on user preferences and goals"""
-        preferences = session.collected_preferences
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI learning path advisor."
-            },
-            {
-                "role": "user",
-                "content": f"Create a learning path for user with "
-                           f"preferences: {json.dumps(preferences)}"
-            }
-        ]
-        path_suggestion = self.generate_response(messages)
-        return json.loads(path_suggestion)
+        return self.generate_structured(self._learning_path_messages(session), LEARNING_PATH_SCHEMA,
+                                        "learning_path", user.id, route="suggest_learning_path")
+
+    def _learning_path_format(self) -> Optional[Dict]:
+        _, profile = self._route("suggest_learning_path")
+        return structured_response_format(profile.structured_output, "learning_path", LEARNING_PATH_SCHEMA)
 
     def adapt_prompt_style(self, prompt: str, user_preferences: Dict) -> str:
         """Adapt the prompt style based on user preferences"""
-        messages = [
-            {
-                "role": "system",
-                "content": "You are an AI specializing in communication style adaptation."
-            },
-            {
-                "role": "user",
-                "content": f"Adapt this prompt: '{prompt}' to match "
-                           f"preferences: {json.dumps(user_preferences)}"
-            }
+        return self.generate_response(self._prompt_style_messages(prompt, user_preferences),
+                                      route="adapt_prompt_style")
+
+    def onboarding_batch_requests(self, session: MetaPromptSession) -> List[Dict]:
+        """Batch API lines for generate_personalized_prompt and suggest_learning_path of one session"""
+        return [
+            self.batch_request(f"{session.id}:{BATCH_PERSONALIZED_PROMPT}",
+                               self._personalized_prompt_messages(session), route="generate_personalized_prompt"),
+            self.batch_request(f"{session.id}:{BATCH_LEARNING_PATH}",
+                               self._learning_path_messages(session), route="suggest_learning_path",
+                               response_format=self._learning_path_format()),
         ]
-        return self.generate_response(messages)
+
+    async def aanalyze_user_preferences(self, user: UserModel) -> Dict:
+        """Async variant of analyze_user_preferences"""
+        return await self.agenerate_structured(self._user_preferences_messages(user), USER_PREFERENCES_SCHEMA,
+                                               "user_preferences", user.id, route="analyze_user_preferences")
+
+    async def acollect_preferences(self, user: UserModel, preference_type: str) -> str:
+        """Async variant of collect_preferences"""
+        return await self.agenerate_response(self._collect_preferences_messages(user, preference_type), user.id,
+                                             route="collect_preferences")
+
+    async def agenerate_personalized_prompt(self, session: MetaPromptSession) -> str:
+        """Async variant of generate_personalized_prompt"""
+        return await self.agenerate_response(self._personalized_prompt_messages(session), session.user_id,
+                                             route="generate_personalized_prompt")
+
+    async def aanalyze_learning_goals(self, goals: List[str]) -> Dict:
+        """Async variant of analyze_learning_goals"""
+        return await self.agenerate_structured(self._learning_goals_messages(goals), LEARNING_GOALS_SCHEMA,
+                                               "learning_goals", route="analyze_learning_goals")
+
+    async def asuggest_learning_path(self, user: UserModel, session: MetaPromptSession) -> Dict:
+        """Async variant of suggest_learning_path"""
+        return await self.agenerate_structured(self._learning_path_messages(session), LEARNING_PATH_SCHEMA,
+                                               "learning_path", user.id, route="suggest_learning_path")
+
+    async def astream_learning_path(self, user: UserModel,
+                                    session: MetaPromptSession) -> AsyncIterator[Tuple[str, Any]]:
+        """Streaming variant of asuggest_learning_path: yields ("summary", ...) before the stages finish"""
+        async for item in self.astream_structured(self._learning_path_messages(session), LEARNING_PATH_SCHEMA,
+                                                  "learning_path", user.id, route="suggest_learning_path"):
+            yield item
+
+    async def aadapt_prompt_style(self, prompt: str, user_preferences: Dict) -> str:
+        """Async variant of adapt_prompt_style"""
+        return await self.agenerate_response(self._prompt_style_messages(prompt, user_preferences),
+                                             route="adapt_prompt_style")
+
+    async def acollect_all_preferences(
+            self,
+            user: UserModel,
+            timeout: Optional[float] = PREFERENCE_COLLECTION_TIMEOUT
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Collect every entry of collection_prompts concurrently.
+
+        The prompts only depend on the user's name, age and occupation, so they are
+        issued at once. Each call gets its own timeout; a failed or timed-out call
+        does not discard the others.
+
+        Returns:
+            A ``(preferences, errors)`` pair mapping preference type to the collected
+            text or to the error message respectively.
+        """
+        preference_types = list(self.collection_prompts)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self.acollect_preferences(user, preference_type), timeout)
+              for preference_type in preference_types),
+            return_exceptions=True
+        )
+
+        preferences, errors = {}, {}
+        for preference_type, result in zip(preference_types, results):
+            if isinstance(result, DeadlineExceeded):
+                # Also a TimeoutError: the call's own retry deadline, not the per-call timeout below
+                errors[preference_type] = str(result) or "Deadline exceeded"
+            elif isinstance(result, asyncio.TimeoutError):
+                errors[preference_type] = f"Timed out after {timeout}s"
+            elif isinstance(result, Exception):
+                errors[preference_type] = str(result) or type(result).__name__
+            else:
+                preferences[preference_type] = result
+        return preferences, errors
+
+    def collect_all_preferences(
+            self,
+            user: UserModel,
+            timeout: Optional[float] = PREFERENCE_COLLECTION_TIMEOUT
+    ) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Blocking wrapper around acollect_all_preferences for sync callers.
+
+        Runs on the shared background loop, so it also works when called from code
+        that is itself inside an event loop, and reuses one pooled async client.
+        """
+        return get_background_loop().run(self.acollect_all_preferences(user, timeout))
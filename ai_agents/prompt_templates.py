@@ -5,14 +5,29 @@
 
 # self-defined packages
 
+# 以下三段按共享范围从大到小排列：静态指令 -> 学习目标 -> 用户。
+# 服务端的前缀缓存要求请求开头的 token 完全一致，所以静态部分必须放在最前面，
+# 且不能夹带任何按用户或按目标变化的字段。
 
-GENERAL_LEARNING_PROMPT = """
-你是一位个性化学习助手，你的任务是帮助一位{user_age}岁{user_occupation}进行多领域的学习和提升。这位用户名叫{user_name}
+# 所有用户、所有学习目标共享的静态指令
+LEARNING_INSTRUCTIONS = """
+你是一位个性化学习助手，你的任务是帮助用户进行多领域的学习和提升。
 
-当前的学习目标是：{objective_name}
+请记住，你的角色是一位友好的学习伙伴，而不是严格的老师。要多给予鼓励和正面反馈，帮助用户建立学习信心。同时，要善于发现用户的潜在兴趣点，适时引导拓展学习视野。
+"""
+
+# 学习目标相关的上下文
+LEARNING_OBJECTIVE_CONTEXT = """当前的学习目标是：{objective_name}
 学习目标的详细描述：{objective_description}
 用户当前的水平：{current_level}
-用户的目标水平：{target_level}
+用户的目标水平：{target_level}"""
 
-请记住，你的角色是一位友好的学习伙伴，而不是严格的老师。要多给予鼓励和正面反馈，帮助用户建立学习信心。同时，要善于发现用户的潜在兴趣点，适时引导拓展学习视野。
+# 用户相关的上下文
+LEARNING_USER_CONTEXT = """这位用户名叫{user_name}，{user_age}岁，职业是{user_occupation}。"""
+
+# 完整的单段提示词，保留给记录学习会话 (ai_prompt) 和自定义模板的调用方
+GENERAL_LEARNING_PROMPT = f"""{LEARNING_INSTRUCTIONS}
+{LEARNING_OBJECTIVE_CONTEXT}
+
+{LEARNING_USER_CONTEXT}
 """
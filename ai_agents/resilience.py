@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Deadlines, retries and hedged requests for LLM calls.
+
+``retry_call`` / ``aretry_call`` run one call under an overall deadline, retrying
+retryable provider errors with full-jitter exponential backoff. ``hedged`` fires a
+duplicate request once the first one has been outstanding for longer than the
+recent p95 latency, keeps whichever finishes first and cancels the other.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional, TypeVar
+
+from loguru import logger
+
+from settings import (LLM_ATTEMPT_TIMEOUT, LLM_DEADLINE, LLM_HEDGE_MIN_SAMPLES, LLM_HEDGE_PERCENTILE,
+                      LLM_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY)
+
+T = TypeVar("T")
+
+_RETRYABLE_STATUS = {408, 409, 429}
+
+
+class DeadlineExceeded(TimeoutError):
+    """The overall deadline of a call ran out before any attempt succeeded."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_attempts: int = LLM_MAX_ATTEMPTS
+    base_delay: float = LLM_RETRY_BASE_DELAY
+    max_delay: float = LLM_RETRY_MAX_DELAY
+    # 整个调用 (含所有重试) 的截止时间与单次尝试的超时，单位秒；None 表示不限制
+    deadline: Optional[float] = LLM_DEADLINE
+    attempt_timeout: Optional[float] = LLM_ATTEMPT_TIMEOUT
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, min(max_delay, base_delay * 2 ** attempt)]."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def is_retryable(error: BaseException) -> bool:
+    # 只在出错时才需要这些异常类；模块级导入会把整个 openai 包拖进冷启动
+    from openai import (APIConnectionError, APIStatusError, APITimeoutError,  # pylint: disable=import-outside-toplevel
+                        RateLimitError)
+
+    if isinstance(error, (APITimeoutError, APIConnectionError, RateLimitError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in _RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by a Retry-After header, if the provider sent one."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _Attempts:
+    """Shared bookkeeping of retry_call and aretry_call."""
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.started = time.monotonic()
+        self.attempt = 0
+
+    def remaining(self) -> Optional[float]:
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def timeout(self) -> Optional[float]:
+        """Timeout of the next attempt: the attempt timeout capped by what is left of the deadline."""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(f"LLM call exceeded its {self.policy.deadline}s deadline")
+        if remaining is None:
+            return self.policy.attempt_timeout
+        if self.policy.attempt_timeout is None:
+            return remaining
+        return min(remaining, self.policy.attempt_timeout)
+
+    def delay_after(self, error: BaseException) -> float:
+        """Backoff before the next attempt; re-raises ``error`` when no attempt is left."""
+        self.attempt += 1
+        if not is_retryable(error) or self.attempt >= self.policy.max_attempts:
+            raise error
+        delay = _retry_after(error) or self.policy.backoff(self.attempt - 1)
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded(f"LLM call exceeded its {self.policy.deadline}s deadline") from error
+        logger.warning(f"LLM attempt {self.attempt} failed ({type(error).__name__}: {error}); "
+                       f"retrying in {delay:.2f}s")
+        return delay
+
+
+def retry_call(call: Callable[[Optional[float]], T], policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> T:
+    """
+    Run ``call(timeout)`` until it succeeds, a non-retryable error is raised, the
+    attempts are used up or the deadline passes. ``call`` must honour ``timeout``
+    (the OpenAI client does via its ``timeout=`` request option).
+    """
+    attempts = _Attempts(policy)
+    while True:
+        try:
+            return call(attempts.timeout())
+        except Exception as error:  # pylint: disable=broad-except
+            time.sleep(attempts.delay_after(error))
+
+
+async def aretry_call(call: Callable[[Optional[float]], Awaitable[T]],
+                      policy: RetryPolicy = DEFAULT_RETRY_POLICY) -> T:
+    """Async variant of retry_call; each attempt is also bounded by asyncio.wait_for."""
+    attempts = _Attempts(policy)
+    while True:
+        timeout = attempts.timeout()
+        try:
+            return await asyncio.wait_for(call(timeout), timeout)
+        except Exception as error:  # pylint: disable=broad-except
+            await asyncio.sleep(attempts.delay_after(error))
+
+
+class LatencyTracker:
+    """Rolling window of recent latencies per key, used to derive the hedging delay."""
+
+    def __init__(self, window: int = 200, percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[Hashable, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def hedge_delay(self, key: Hashable) -> Optional[float]:
+        """The configured percentile of recent latencies, or None until enough samples exist."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            import numpy as np  # pylint: disable=import-outside-toplevel
+            return float(np.percentile(np.fromiter(samples, dtype=float), self.percentile))
+
+
+_latency_tracker = LatencyTracker()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _latency_tracker
+
+
+async def hedged(primary: Callable[[], Awaitable[T]], hedge: Callable[[], Awaitable[T]],
+                 delay: Optional[float],
+                 discard: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+    """
+    Await ``primary()``; if it is still pending after ``delay`` seconds, also start
+    ``hedge()`` and return the first successful result. The other request is
+    cancelled, or passed to ``discard`` (e.g. to close a stream) if it already
+    finished. With ``delay=None`` no hedge is sent. If one request fails the other
+    is still awaited; the error is raised only when both fail.
+    """
+    first = asyncio.ensure_future(primary())
+    if delay is None:
+        return await first
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay)
+    except asyncio.CancelledError:
+        first.cancel()
+        raise
+    if done:
+        return first.result()
+
+    logger.debug(f"LLM request outstanding after {delay * 1000:.0f}ms, sending hedge")
+    pending = {first, asyncio.ensure_future(hedge())}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+                error = task.exception()
+            else:
+                continue
+            for task in done - {winner}:
+                if task.exception() is None and discard:
+                    await discard(task.result())
+            return winner.result()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
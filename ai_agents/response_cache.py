@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存。
+
+两级缓存：进程内 LRU (OrderedDict) + data 目录下的 SQLite 表。缓存键是模型名、
+消息列表和采样参数的规范化 JSON 的 SHA-256，因此只有完全相同的请求才会命中。
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from settings import LLM_CACHE_MAX_DISK_ENTRIES, LLM_CACHE_MAX_MEMORY_ENTRIES, LLM_CACHE_PATH
+
+# 每写入多少条检查一次磁盘容量，避免每次写入都 COUNT(*)
+_DISK_EVICTION_CHECK_INTERVAL = 100
+
+
+class ResponseCache:
+    def __init__(self,
+                 path: str = LLM_CACHE_PATH,
+                 max_memory_entries: int = LLM_CACHE_MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES):
+        """
+        Args:
+            path: SQLite 文件路径。
+            max_memory_entries: 内存 LRU 层的最大条目数。
+            max_disk_entries: SQLite 层的最大条目数，超出后按最近访问时间淘汰。
+        """
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+            "key TEXT PRIMARY KEY, namespace TEXT, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_response_cache_last_access "
+            "ON llm_response_cache (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], params: Optional[Dict[str, Any]] = None) -> str:
+        """根据模型名、消息和采样参数生成规范化的缓存键。"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params or {}},
+            sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return response
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT response, expires_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE llm_response_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+            return row[0]
+
+    def set(self, key: str, response: str, ttl: float, namespace: Optional[str] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache "
+                "(key, namespace, response, created_at, expires_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, namespace, response, now, expires_at, now)
+            )
+            self._writes_since_check += 1
+            if self._writes_since_check >= _DISK_EVICTION_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict_disk(now)
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM llm_response_cache")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中计数，供日志或监控使用。"""
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "hits": self.memory_hits + self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key: str, response: str, expires_at: float) -> None:
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_disk(self, now: float) -> None:
+        cursor = self._conn.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (now,))
+        self.evictions += max(cursor.rowcount, 0)
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_response_cache").fetchone()
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM llm_response_cache WHERE key IN "
+                "(SELECT key FROM llm_response_cache ORDER BY last_access LIMIT ?)", (overflow,)
+            )
+            self.evictions += overflow
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """返回进程内共享的 ResponseCache，首次使用时创建。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Task-aware routing of LLM calls to model/endpoint profiles.
+
+A route is ``"<AgentClass>.<method>"`` (e.g. ``"MetaPromptAgent.collect_preferences"``)
+or just ``"<AgentClass>"``. The routing table maps routes to profiles; a profile names
+the model, its sampling parameters and one or more endpoints, balanced by smooth
+weighted round-robin. Unrouted calls use the ``default`` profile, which matches the
+previous behaviour (MODEL_NAME on OPENAI_BASE_URL).
+
+The table is built from settings, or loaded from the JSON file in LLM_ROUTING_FILE::
+
+    {
+      "profiles": {
+        "fast": {"model": "gpt-4o-mini", "max_tokens": 256, "temperature": 0, "structured_output": "json_schema",
+                 "endpoints": [{"base_url": "http://fleet-a/v1", "weight": 3},
+                               {"base_url": "http://fleet-b/v1", "weight": 1}]}
+      },
+      "routes": {"MetaPromptAgent.collect_preferences": "fast"}
+    }
+"""
+import json
+import threading
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from settings import (FAST_MODEL_BASE_URLS, FAST_MODEL_MAX_TOKENS, FAST_MODEL_NAME, FAST_MODEL_TEMPERATURE,
+                      LLM_ROUTE_LOG_EVERY, LLM_ROUTING_FILE, LLM_STRUCTURED_OUTPUT, MODEL_NAME, OPENAI_BASE_URL,
+                      OPENAI_BASE_URLS)
+
+DEFAULT_PROFILE = "default"
+
+# Short classification-style tasks that a small model handles well
+FAST_ROUTES = (
+    "MetaPromptAgent.collect_preferences",
+    "MetaPromptAgent.adapt_prompt_style",
+    "MetaPromptAgent.analyze_learning_goals",
+)
+# Sampling overrides of the fast profile unless FAST_MODEL_MAX_TOKENS / FAST_MODEL_TEMPERATURE say otherwise
+FAST_DEFAULT_MAX_TOKENS = 512
+FAST_DEFAULT_TEMPERATURE = 0
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    # None: the client library's default URL
+    base_url: Optional[str]
+    # None: use the agent's own API key
+    api_key: Optional[str] = None
+    weight: int = 1
+
+
+@dataclass(frozen=True)
+class ModelProfile:
+    name: str
+    model: str
+    endpoints: Tuple[Endpoint, ...]
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    # How the endpoints accept structured outputs (see structured_output.STRUCTURED_OUTPUT_MODES)
+    structured_output: str = LLM_STRUCTURED_OUTPUT
+
+    def params(self) -> Dict[str, Any]:
+        """Sampling parameters sent with every request of this profile (also part of the cache key)."""
+        params = {}
+        if self.max_tokens is not None:
+            params["max_tokens"] = self.max_tokens
+        if self.temperature is not None:
+            params["temperature"] = self.temperature
+        return params
+
+
+@dataclass
+class _RouteStats:
+    requests: int = 0
+    errors: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    by_endpoint: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+
+
+def parse_endpoints(spec: str) -> Tuple[Endpoint, ...]:
+    """``"url|weight,url|weight"`` (weight optional) -> endpoints."""
+    endpoints = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        base_url, _, weight = item.partition("|")
+        endpoints.append(Endpoint(base_url=base_url, weight=int(weight or 1)))
+    return tuple(endpoints)
+
+
+class Router:
+    def __init__(self, profiles: Dict[str, ModelProfile], routes: Dict[str, str]):
+        if DEFAULT_PROFILE not in profiles:
+            raise ValueError(f"The routing table needs a '{DEFAULT_PROFILE}' profile")
+        unknown = {profile for profile in routes.values() if profile not in profiles}
+        if unknown:
+            raise ValueError(f"Routes refer to unknown profiles: {sorted(unknown)}")
+        self.profiles = profiles
+        self.routes = routes
+        self._lock = threading.Lock()
+        # Smooth weighted round-robin state: profile -> current weight per endpoint
+        self._current: Dict[str, List[int]] = {name: [0] * len(profile.endpoints)
+                                               for name, profile in profiles.items()}
+        self._stats: Dict[Tuple[str, str], _RouteStats] = defaultdict(_RouteStats)
+
+    @classmethod
+    def from_dict(cls, table: Dict[str, Any]) -> "Router":
+        profiles = {}
+        for name, spec in table.get("profiles", {}).items():
+            profiles[name] = ModelProfile(
+                name=name,
+                model=spec["model"],
+                endpoints=tuple(Endpoint(**endpoint) for endpoint in spec["endpoints"]),
+                max_tokens=spec.get("max_tokens"),
+                temperature=spec.get("temperature"),
+                structured_output=spec.get("structured_output", LLM_STRUCTURED_OUTPUT),
+            )
+        return cls(profiles, dict(table.get("routes", {})))
+
+    def profile_for(self, route: str) -> ModelProfile:
+        """Exact route first, then the agent-wide route (``"MetaPromptAgent"``), then the default profile."""
+        name = self.routes.get(route) or self.routes.get(route.split(".", 1)[0]) or DEFAULT_PROFILE
+        return self.profiles[name]
+
+    def pick_endpoint(self, profile: ModelProfile) -> Endpoint:
+        """Smooth weighted round-robin: spreads picks in proportion to the weights without bursts."""
+        if len(profile.endpoints) == 1:
+            return profile.endpoints[0]
+        with self._lock:
+            current = self._current[profile.name]
+            total = 0
+            best = 0
+            for index, endpoint in enumerate(profile.endpoints):
+                current[index] += endpoint.weight
+                total += endpoint.weight
+                if current[index] > current[best]:
+                    best = index
+            current[best] -= total
+            return profile.endpoints[best]
+
+    def record(self, route: str, profile: ModelProfile, endpoint: Endpoint, latency_s: float,
+               ok: bool = True) -> None:
+        with self._lock:
+            stats = self._stats[(route, profile.name)]
+            stats.requests += 1
+            stats.errors += 0 if ok else 1
+            stats.total_s += latency_s
+            stats.max_s = max(stats.max_s, latency_s)
+            stats.by_endpoint[str(endpoint.base_url)] += 1
+            summary = stats.requests % LLM_ROUTE_LOG_EVERY == 0
+            avg_ms = stats.total_s / stats.requests * 1000
+        if summary:
+            logger.info(f"route={route} profile={profile.name}: {stats.requests} requests, "
+                        f"{stats.errors} errors, avg {avg_ms:.0f}ms, max {stats.max_s * 1000:.0f}ms")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                route: {
+                    "profile": profile,
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "avg_latency_ms": stats.total_s / stats.requests * 1000 if stats.requests else 0.0,
+                    "max_latency_ms": stats.max_s * 1000,
+                    "by_endpoint": dict(stats.by_endpoint),
+                }
+                for (route, profile), stats in self._stats.items()
+            }
+
+
+def default_routing_table() -> Dict[str, Any]:
+    """
+    Routing table built from settings: the strong model for everything, except that
+    FAST_ROUTES go to the "fast" profile once any FAST_MODEL_* setting is configured.
+    """
+    strong_endpoints = parse_endpoints(OPENAI_BASE_URLS or OPENAI_BASE_URL or "") or (Endpoint(base_url=None),)
+    table = {
+        "profiles": {
+            DEFAULT_PROFILE: {
+                "model": MODEL_NAME,
+                "endpoints": [asdict(endpoint) for endpoint in strong_endpoints],
+            },
+        },
+        "routes": {},
+    }
+    if not (FAST_MODEL_NAME or FAST_MODEL_BASE_URLS or FAST_MODEL_MAX_TOKENS is not None
+            or FAST_MODEL_TEMPERATURE is not None):
+        # Nothing configured: keep these calls identical to every other call
+        return table
+
+    fast_endpoints = parse_endpoints(FAST_MODEL_BASE_URLS) if FAST_MODEL_BASE_URLS else strong_endpoints
+    table["profiles"]["fast"] = {
+        "model": FAST_MODEL_NAME or MODEL_NAME,
+        "endpoints": [asdict(endpoint) for endpoint in fast_endpoints],
+        "max_tokens": FAST_DEFAULT_MAX_TOKENS if FAST_MODEL_MAX_TOKENS is None else FAST_MODEL_MAX_TOKENS,
+        "temperature": FAST_DEFAULT_TEMPERATURE if FAST_MODEL_TEMPERATURE is None else FAST_MODEL_TEMPERATURE,
+    }
+    table["routes"] = {route: "fast" for route in FAST_ROUTES}
+    return table
+
+
+def load_router(path: Optional[str] = LLM_ROUTING_FILE) -> Router:
+    if path:
+        with open(path, encoding="utf-8") as file:
+            return Router.from_dict(json.load(file))
+    return Router.from_dict(default_routing_table())
+
+
+_router: Optional[Router] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Router:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = load_router()
+    return _router
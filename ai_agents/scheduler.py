@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide scheduler for LLM requests.
+
+Every agent call takes a slot from one ``RequestScheduler`` before it reaches the
+provider. A slot is granted only while
+
+* fewer than ``max_concurrency`` requests are in flight, and
+* the request- and token-per-minute buckets have room for it.
+
+Waiting requests are ordered by priority class first (interactive tutoring before
+background onboarding analysis), then round-robin across users within a class, so a
+single user's burst cannot starve everybody else. Both threads (``slot``) and
+coroutines (``aslot``) can wait; coroutines wait on a future and never block the
+event loop.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from enum import IntEnum
+from typing import Any, Deque, Dict, Hashable, List, Optional
+
+from loguru import logger
+
+from settings import (LLM_COMPLETION_TOKEN_RESERVE, LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE,
+                      LLM_TOKENS_PER_MINUTE)
+
+
+class Priority(IntEnum):
+    """Lower values are served first."""
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+def estimate_request_tokens(messages: List[Dict[str, str]],
+                            completion_reserve: int = LLM_COMPLETION_TOKEN_RESERVE) -> int:
+    """Rough prompt size (~4 characters per token) plus a reserve for the completion."""
+    return sum(len(message.get("content") or "") for message in messages) // 4 + completion_reserve
+
+
+class TokenBucket:
+    """Refills continuously at ``per_minute / 60`` units per second up to ``per_minute``."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` is available (0 if it is available now)."""
+        self._refill(now)
+        # A request larger than the whole bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+
+class Ticket:
+    """One request's place in the scheduler; granted once a slot is assigned to it."""
+
+    def __init__(self, priority: Priority, user_key: Hashable, tokens: int):
+        self.priority = priority
+        self.user_key = user_key
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.released = False
+        self._event: Optional[threading.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._future: Optional[asyncio.Future] = None
+
+
+class RequestScheduler:
+    def __init__(self,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = LLM_TOKENS_PER_MINUTE):
+        """
+        Args:
+            max_concurrency: 同时进行中的请求上限。
+            requests_per_minute: 每分钟请求数上限，0 表示不限制。
+            tokens_per_minute: 每分钟 token 数上限 (按估算值预扣，完成后按实际用量校正)，0 表示不限制。
+        """
+        self.max_concurrency = max_concurrency
+        self._rpm = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tpm = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        # priority -> user_key -> waiting tickets; OrderedDict order is the round-robin order
+        self._queues: Dict[Priority, "OrderedDict[Hashable, Deque[Ticket]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._in_flight = 0
+        self._retry_timer: Optional[threading.Timer] = None
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    # -- waiting ---------------------------------------------------------------
+
+    @contextmanager
+    def slot(self, priority: Priority = Priority.BACKGROUND, user_key: Hashable = None, tokens: int = 0):
+        """Block the calling thread until a slot is granted; release it on exit."""
+        ticket = Ticket(priority, user_key, tokens)
+        ticket._event = threading.Event()
+        self._enqueue(ticket)
+        ticket._event.wait()
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Priority = Priority.BACKGROUND, user_key: Hashable = None, tokens: int = 0):
+        """Await a slot without blocking the event loop; release it on exit."""
+        ticket = Ticket(priority, user_key, tokens)
+        ticket._loop = asyncio.get_running_loop()
+        ticket._future = ticket._loop.create_future()
+        self._enqueue(ticket)
+        try:
+            await ticket._future
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def release(self, ticket: Ticket, actual_tokens: Optional[int] = None) -> None:
+        """
+        Return the slot of a granted ticket. ``actual_tokens`` (e.g. ``usage.total_tokens``)
+        corrects the token bucket for the difference to the estimate. Idempotent.
+        """
+        with self._lock:
+            if not ticket.granted or ticket.released:
+                return
+            ticket.released = True
+            self._in_flight -= 1
+            if self._tpm and actual_tokens is not None:
+                difference = ticket.tokens - actual_tokens
+                if difference > 0:
+                    self._tpm.give_back(difference)
+                else:
+                    self._tpm.take(-difference)
+            self._dispatch()
+
+    def _enqueue(self, ticket: Ticket) -> None:
+        with self._lock:
+            self._queues[ticket.priority].setdefault(ticket.user_key, deque()).append(ticket)
+            self._stats[ticket.priority.name]["enqueued"] += 1
+            self._dispatch()
+
+    def _cancel(self, ticket: Ticket) -> None:
+        with self._lock:
+            if not ticket.granted:
+                users = self._queues[ticket.priority]
+                waiting = users.get(ticket.user_key)
+                if waiting and ticket in waiting:
+                    waiting.remove(ticket)
+                    if not waiting:
+                        del users[ticket.user_key]
+                self._stats[ticket.priority.name]["cancelled"] += 1
+                return
+        # Granted, but the waiter is gone: if the future already holds the result nobody
+        # will use the slot, otherwise _resolve sees the cancelled future and releases it
+        if ticket._future.done() and not ticket._future.cancelled():
+            self.release(ticket)
+
+    # -- granting --------------------------------------------------------------
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        for priority in Priority:
+            users = self._queues[priority]
+            if users:
+                return next(iter(users.values()))[0]
+        return None
+
+    def _dispatch(self) -> None:
+        """Grant slots while capacity and rate budget allow. Caller holds the lock."""
+        while self._in_flight < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            now = time.monotonic()
+            delay = max(self._rpm.wait_time(1, now) if self._rpm else 0.0,
+                        self._tpm.wait_time(ticket.tokens, now) if self._tpm else 0.0)
+            if delay > 0:
+                self._schedule_retry(delay)
+                return
+
+            users = self._queues[ticket.priority]
+            waiting = users[ticket.user_key]
+            waiting.popleft()
+            # Round-robin: a user who still has requests queued goes to the back
+            del users[ticket.user_key]
+            if waiting:
+                users[ticket.user_key] = waiting
+
+            if self._rpm:
+                self._rpm.take(1)
+            if self._tpm:
+                self._tpm.take(ticket.tokens)
+            self._in_flight += 1
+            ticket.granted = True
+            self._record_wait(ticket, now - ticket.enqueued_at)
+            self._wake(ticket)
+
+    def _schedule_retry(self, delay: float) -> None:
+        if self._retry_timer is not None and self._retry_timer.is_alive():
+            return
+        self._retry_timer = threading.Timer(delay, self._retry)
+        self._retry_timer.daemon = True
+        self._retry_timer.start()
+
+    def _retry(self) -> None:
+        with self._lock:
+            self._retry_timer = None
+            self._dispatch()
+
+    def _wake(self, ticket: Ticket) -> None:
+        if ticket._event is not None:
+            ticket._event.set()
+        else:
+            ticket._loop.call_soon_threadsafe(self._resolve, ticket)
+
+    def _resolve(self, ticket: Ticket) -> None:
+        # Runs on the waiter's event loop
+        if ticket._future.cancelled():
+            self.release(ticket)
+        else:
+            ticket._future.set_result(None)
+
+    # -- metrics ---------------------------------------------------------------
+
+    def _record_wait(self, ticket: Ticket, wait_s: float) -> None:
+        stats = self._stats[ticket.priority.name]
+        stats["granted"] += 1
+        stats["wait_s"] += wait_s
+        stats["max_wait_s"] = max(stats["max_wait_s"], wait_s)
+        if wait_s > 1:
+            logger.debug(f"LLM request ({ticket.priority.name}, user={ticket.user_key}) "
+                         f"waited {wait_s * 1000:.0f}ms for a slot")
+
+    def queue_depth(self) -> Dict[str, int]:
+        with self._lock:
+            return {priority.name: sum(len(waiting) for waiting in self._queues[priority].values())
+                    for priority in Priority}
+
+    def snapshot(self) -> Dict[str, Any]:
+        """In-flight count, queue depth per priority and wait-time statistics."""
+        depth = self.queue_depth()
+        with self._lock:
+            classes = {}
+            for priority in Priority:
+                stats = dict(self._stats[priority.name])
+                granted = stats.get("granted", 0)
+                stats["queue_depth"] = depth[priority.name]
+                stats["avg_wait_ms"] = stats.get("wait_s", 0.0) / granted * 1000 if granted else 0.0
+                stats["max_wait_ms"] = stats.get("max_wait_s", 0.0) * 1000
+                classes[priority.name] = stats
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "requests_bucket": self._rpm.level if self._rpm else None,
+                "tokens_bucket": self._tpm.level if self._tpm else None,
+                "priorities": classes,
+            }
+
+
+_scheduler = RequestScheduler()
+
+
+def get_scheduler() -> RequestScheduler:
+    return _scheduler
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+语义近似缓存。
+
+同一学习目标下的学习者经常用不同措辞问同一个问题。这里用哈希 n-gram 向量化
+问题文本，在按作用域 (学习目标、水平、提示模板与其中的学习者字段) 划分的 NumPy
+余弦相似度索引中查找已有回答，相似度超过阈值时直接复用，避免再走一次 LLM。
+
+相似度计算在锁外进行：锁内只取索引的快照，计算完成后再回到锁内，丢弃期间已被覆盖的条目。
+"""
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from settings import (SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_MAX_ENTRIES, SEMANTIC_CACHE_MAX_SCOPES,
+                      SEMANTIC_CACHE_THRESHOLD)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# 分块计算相似度矩阵时每块的索引行数，限制临时矩阵的内存占用
+_SEARCH_BLOCK_ROWS = 65536
+
+
+class HashingVectorizer:
+    """把文本映射为 L2 归一化的哈希特征向量 (词 unigram/bigram + 字符 3-gram)，无需训练。"""
+
+    def __init__(self, n_features: int = SEMANTIC_CACHE_DIM, char_ngram: int = 3):
+        self.n_features = n_features
+        self.char_ngram = char_ngram
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        features = [f"w:{token}" for token in tokens]
+        features.extend(f"b:{left} {right}" for left, right in zip(tokens, tokens[1:]))
+        for token in tokens:
+            padded = f" {token} "
+            features.extend(f"c:{padded[i:i + self.char_ngram]}"
+                            for i in range(max(len(padded) - self.char_ngram + 1, 1)))
+        return features
+
+    def transform(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                # 用哈希的最高位决定符号，减少哈希碰撞带来的偏差
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                matrix[row, digest % self.n_features] += sign
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class _ScopeIndex:
+    """单个作用域的向量索引。容量按倍数增长，达到上限后以环形缓冲区覆盖最旧条目。"""
+
+    def __init__(self, dim: int, max_entries: int):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, got {max_entries}")
+        self.max_entries = max_entries
+        self.vectors = np.empty((min(1024, max_entries), dim), dtype=np.float32)
+        self.answers: List[Optional[str]] = [None] * len(self.vectors)
+        # 每个槽位最近一次写入的序号，用于识别锁外计算期间被覆盖的条目
+        self.stamps = np.zeros(len(self.vectors), dtype=np.int64)
+        self.writes = 0
+        self.size = 0
+        self._oldest = 0
+
+    def add(self, vector: np.ndarray, answer: str) -> None:
+        if self.size == len(self.vectors) and self.size < self.max_entries:
+            capacity = min(self.size * 2, self.max_entries)
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            self.answers.extend([None] * (capacity - self.size))
+            self.stamps = np.concatenate([self.stamps, np.zeros(capacity - self.size, dtype=np.int64)])
+
+        if self.size < len(self.vectors):
+            slot = self.size
+            self.size += 1
+        else:
+            # 已满：覆盖最旧的条目
+            slot = self._oldest
+            self._oldest = (self._oldest + 1) % self.size
+        self.writes += 1
+        self.vectors[slot] = vector
+        self.answers[slot] = answer
+        self.stamps[slot] = self.writes
+
+
+def _search(vectors: np.ndarray, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """返回每个查询向量在 vectors 中的最佳匹配下标和相似度。"""
+    best_index = np.full(len(queries), -1, dtype=np.int64)
+    best_score = np.full(len(queries), -np.inf, dtype=np.float32)
+    for start in range(0, len(vectors), _SEARCH_BLOCK_ROWS):
+        block = vectors[start:start + _SEARCH_BLOCK_ROWS]
+        scores = block @ queries.T  # (block_rows, n_queries)
+        block_best = scores.argmax(axis=0)
+        block_score = scores[block_best, np.arange(len(queries))]
+        improved = block_score > best_score
+        best_score[improved] = block_score[improved]
+        best_index[improved] = block_best[improved] + start
+    return best_index, best_score
+
+
+class SemanticCache:
+    def __init__(self,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries_per_scope: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES,
+                 vectorizer: Optional[HashingVectorizer] = None):
+        """
+        Args:
+            threshold: 余弦相似度阈值，达到该值才视为同一个问题。
+            max_entries_per_scope: 每个作用域最多保留的条目数。
+            max_scopes: 最多保留的作用域数，超出后淘汰最久未使用的作用域。
+            vectorizer: 文本向量化器，默认使用 HashingVectorizer。
+
+        内存上限约为 max_scopes * max_entries_per_scope * dim * 4 字节。
+        """
+        if max_entries_per_scope < 1 or max_scopes < 1:
+            raise ValueError("max_entries_per_scope and max_scopes must be at least 1, "
+                             f"got {max_entries_per_scope} and {max_scopes}")
+        self.threshold = threshold
+        self.max_entries_per_scope = max_entries_per_scope
+        self.max_scopes = max_scopes
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self._scopes: "OrderedDict[Hashable, _ScopeIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, scope: Hashable, question: str) -> Optional[str]:
+        """返回与 question 足够相似的已缓存回答，没有则返回 None。"""
+        return self.lookup_many(scope, [question])[0]
+
+    def lookup_many(self, scope: Hashable, questions: Sequence[str]) -> List[Optional[str]]:
+        """批量查找，所有问题共用一次分块矩阵乘法。"""
+        queries = self.vectorizer.transform(questions)
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None or index.size == 0:
+                self.misses += len(questions)
+                return [None] * len(questions)
+            self._scopes.move_to_end(scope)
+            # 快照：扩容会换成新数组，旧数组的前 size 行不再变化；已满时被覆盖的槽位由 stamps 识别
+            vectors, written = index.vectors[:index.size], index.writes
+
+        best_index, best_score = _search(vectors, queries)
+
+        with self._lock:
+            results = []
+            for position, score in zip(best_index, best_score):
+                if position >= 0 and score >= self.threshold and index.stamps[position] <= written:
+                    self.hits += 1
+                    results.append(index.answers[position])
+                else:
+                    self.misses += 1
+                    results.append(None)
+            return results
+
+    def store(self, scope: Hashable, question: str, answer: str) -> None:
+        vector = self.vectorizer.transform([question])[0]
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is None:
+                index = _ScopeIndex(self.vectorizer.n_features, self.max_entries_per_scope)
+                self._scopes[scope] = index
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+            index.add(vector, answer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "scopes": len(self._scopes),
+                "entries": sum(index.size for index in self._scopes.values()),
+            }
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """返回进程内共享的 SemanticCache，首次使用时创建。"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+    return _cache
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Structured (JSON) outputs: response schemas, the ``response_format`` to request them,
+and a tolerant incremental JSON parser.
+
+The parser accepts what models actually send back: prose before or after the
+object, Markdown code fences, and streamed text split at arbitrary points. Fed
+chunk by chunk, it returns every top-level field as soon as its value is complete,
+so a caller can act on ``"summary"`` while ``"stages"`` is still streaming.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# 各方法的响应 schema。json_schema 严格模式要求所有属性都在 required 中且不允许额外属性
+USER_PREFERENCES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "learning_style": {"type": "string"},
+        "pace": {"type": "string"},
+        "preferred_formats": {"type": "array", "items": {"type": "string"}},
+        "session_length_minutes": {"type": "integer"},
+    },
+    "required": ["learning_style", "pace", "preferred_formats", "session_length_minutes"],
+    "additionalProperties": False,
+}
+
+LEARNING_GOALS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "goals": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "goal": {"type": "string"},
+                    "category": {"type": "string"},
+                    "timeframe": {"type": "string"},
+                    "measurable_outcome": {"type": "string"},
+                },
+                "required": ["goal", "category", "timeframe", "measurable_outcome"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["goals"],
+    "additionalProperties": False,
+}
+
+LEARNING_PATH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "stages": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "objectives": {"type": "array", "items": {"type": "string"}},
+                    "duration_weeks": {"type": "integer"},
+                    "resources": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["title", "objectives", "duration_weeks", "resources"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["summary", "stages"],
+    "additionalProperties": False,
+}
+
+# ModelProfile.structured_output 的取值
+STRUCTURED_OUTPUT_MODES = ("json_schema", "json_object", "none")
+
+_JSON_TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float),
+               "boolean": bool}
+
+
+class StructuredOutputError(ValueError):
+    """The response holds no JSON object, or the object does not match the schema."""
+
+
+def response_format(mode: str, name: str, schema: Dict) -> Optional[Dict]:
+    """The ``response_format`` request parameter for ``mode``; None when the endpoint has no JSON mode."""
+    if mode == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+    if mode == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+_SCHEMA_INSTRUCTIONS = "Respond with a single JSON object and nothing else, matching this JSON schema: "
+
+
+def schema_instructions(schema: Dict) -> str:
+    """Instruction text for the static system message, so endpoints without JSON mode still get the shape."""
+    return _SCHEMA_INSTRUCTIONS + json.dumps(schema, sort_keys=True, separators=(",", ":"))
+
+
+def schema_from_instructions(text: str) -> Optional[Dict]:
+    """The schema embedded by ``schema_instructions``, or None when ``text`` contains none."""
+    start = text.find(_SCHEMA_INSTRUCTIONS)
+    if start < 0:
+        return None
+    try:
+        schema, _ = json.JSONDecoder().raw_decode(text, start + len(_SCHEMA_INSTRUCTIONS))
+    except json.JSONDecodeError:
+        return None
+    return schema if isinstance(schema, dict) else None
+
+
+class IncrementalJSONParser:
+    """
+    Parses the first JSON object in a stream of text chunks.
+
+    ``feed`` returns the top-level ``(key, value)`` pairs completed by the chunk.
+    Text before the opening brace (prose, a code fence) and after the closing one
+    is ignored.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._segment: List[str] = []
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed = []
+        for char in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._segment.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.extend(self._close_segment())
+                    self.done = True
+                    continue
+            elif char == "," and self._depth == 1:
+                completed.extend(self._close_segment())
+                continue
+            self._segment.append(char)
+        return completed
+
+    def _close_segment(self) -> List[Tuple[str, Any]]:
+        segment = "".join(self._segment).strip()
+        self._segment = []
+        if not segment:
+            # 空对象或多余的逗号
+            return []
+        try:
+            parsed = json.loads("{" + segment + "}")
+        except ValueError as e:
+            raise StructuredOutputError(f"Invalid JSON field: {segment[:80]!r}") from e
+        self.fields.update(parsed)
+        return list(parsed.items())
+
+    def result(self) -> Dict[str, Any]:
+        if not self.done:
+            raise StructuredOutputError("The response does not contain a complete JSON object")
+        return self.fields
+
+
+def validate(value: Any, schema: Dict, path: str = "$") -> None:
+    """Checks types, required keys and array items; enough to catch a model answering the wrong shape."""
+    expected = schema.get("type")
+    if expected and (not isinstance(value, _JSON_TYPES[expected])
+                     or expected in ("integer", "number") and isinstance(value, bool)):
+        raise StructuredOutputError(f"{path}: expected {expected}, got {type(value).__name__}")
+    if expected == "object":
+        missing = [key for key in schema.get("required", ()) if key not in value]
+        if missing:
+            raise StructuredOutputError(f"{path}: missing {', '.join(missing)}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                validate(value[key], subschema, f"{path}.{key}")
+    elif expected == "array" and "items" in schema:
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+
+
+def parse_json_response(text: str, schema: Optional[Dict] = None) -> Tuple[Dict[str, Any], bool]:
+    """
+    Parse a complete response.
+
+    Returns:
+        ``(value, strict)``: ``strict`` is False when plain ``json.loads`` would have
+        failed and the tolerant parser recovered the object.
+    """
+    try:
+        value, strict = json.loads(text), True
+    except ValueError:
+        parser = IncrementalJSONParser()
+        parser.feed(text)
+        value, strict = parser.result(), False
+    if not isinstance(value, dict):
+        raise StructuredOutputError(f"Expected a JSON object, got {type(value).__name__}")
+    if schema is not None:
+        validate(value, schema)
+    return value, strict
+
+
+def iter_fields(chunks: Iterator[str]) -> Iterator[Tuple[str, Any]]:
+    """Top-level fields of the JSON object in a stream of text deltas, as they complete."""
+    parser = IncrementalJSONParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    parser.result()
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from typing import Dict, List
+
+from .base import BaseAIAgent
+
+
+class SummaryAgent(BaseAIAgent):
+    def summarize(self, previous_summary: str, turns: List[Dict[str, str]], max_words: int) -> str:
+        """Fold older conversation turns into the running summary"""
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        messages = [
+            {
+                "role": "system",
+                "content": "You maintain a running summary of a tutoring conversation. Keep what the learner "
+                           "already knows, what they struggled with, open questions and agreed next steps. "
+                           f"Answer with the updated summary only, in at most {max_words} words."
+            },
+            {
+                "role": "user",
+                "content": f"Current summary:\n{previous_summary or '(empty)'}\n\n"
+                           f"New turns to fold in:\n{transcript}"
+            }
+        ]
+        return self.generate_response(messages)
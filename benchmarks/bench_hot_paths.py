@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+热点路径微基准：在进程内 fake LLM 与临时 SQLite 数据库上测量应用自身的开销。
+
+覆盖 LearningAgent.generate_learning_response (同步与流式)、LearningPage.respond、
+MetaPromptController 的分步收集流程、HomePage.refresh_objectives、复习队列以及控制器 CRUD。
+报告 p50/p95/p99 与 tracemalloc 统计的内存分配；可保存基线并在回归时返回非零退出码。
+
+用法:
+    python -m benchmarks.bench_hot_paths
+    python -m benchmarks.bench_hot_paths --latency-ms 50 --only learning
+    python -m benchmarks.bench_hot_paths --save-baseline
+    python -m benchmarks.bench_hot_paths --compare --tolerance 0.25
+"""
+import argparse
+import itertools
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# 必须在导入 settings 之前设置：使用 fake LLM、临时数据库，并关闭会让重复请求命中的缓存
+_BENCH_DIR = tempfile.mkdtemp(prefix="bench_hot_paths_")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_BENCH_DIR, 'bench.db')}"
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+
+from loguru import logger  # noqa: E402
+
+from ai_agents.fake_llm import FakeLLMConfig, configure_fake_llm  # noqa: E402
+from benchmarks.harness import compare, format_table, load_baseline, measure, save_baseline  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "hot_paths.json")
+
+
+def _seed(objectives: int, review_items: int):
+    # pylint: disable=import-outside-toplevel
+    from controllers.objective_controller import ObjectiveController
+    from controllers.review_controller import ReviewController
+    from controllers.user_controller import UserController
+    from utils.database import init_db, session_scope
+
+    init_db()
+    with session_scope() as db:
+        user = UserController(db).create_user(name="Bench User", age=30, occupation="Engineer",
+                                              language_preference="English")
+        controller = ObjectiveController(db)
+        objective_ids = [
+            controller.create_objective(user_id=user.id, name=f"Objective {i}", description="benchmark",
+                                        priority=i % 5, current_level="Beginner",
+                                        target_level="Intermediate").id
+            for i in range(objectives)
+        ]
+        # 一半已到期，一半在未来 30 天内到期
+        now = datetime.utcnow()
+        ReviewController(db).bulk_create_items(
+            {"user_id": user.id, "objective_id": objective_ids[i % objectives], "prompt": f"concept {i}",
+             "due_at": now + timedelta(days=(i % 60) - 30)}
+            for i in range(review_items)
+        )
+        return user.id, objective_ids[0]
+
+
+def build_cases(user_id: int, objective_id: int):
+    # pylint: disable=import-outside-toplevel
+    from ai_agents.learning_agent import LearningAgent
+    from controllers.meta_prompt_controller import MetaPromptController, PromptCollectionStep
+    from controllers.objective_controller import ObjectiveController
+    from controllers.review_controller import ReviewController
+    from controllers.user_controller import UserController
+    from utils.database import session_scope
+
+    counter = itertools.count()
+    cases = {}
+
+    def learning_generate():
+        with session_scope() as db:
+            LearningAgent(user_id, objective_id, db).generate_learning_response(f"question {next(counter)}")
+    cases["learning_agent.generate_learning_response"] = learning_generate
+
+    async def learning_stream():
+        with session_scope() as db:
+            stream = await LearningAgent(user_id, objective_id, db).agenerate_learning_response(
+                f"question {next(counter)}", stream=True)
+        async for _ in stream:
+            pass
+    cases["learning_agent.agenerate_learning_response(stream)"] = learning_stream
+
+    try:
+        from ui_pages.home_page import HomePage
+        from ui_pages.learning_page import LearningPage
+        from ui_pages.session_state import UserSessionState
+    except ImportError as e:
+        print(f"skipping UI benchmarks: {e}", file=sys.stderr)
+    else:
+        state = UserSessionState(user_id=user_id, objective_id=objective_id)
+        LearningPage.init_agent(state)
+
+        async def learning_page_respond():
+            async for _ in LearningPage.respond(None, f"question {next(counter)}", state):
+                pass
+        cases["learning_page.respond"] = learning_page_respond
+
+        def refresh_objectives():
+            HomePage.refresh_objectives(HomePage, "", "Ascending", state)
+        cases["home_page.refresh_objectives"] = refresh_objectives
+
+    def objectives_page():
+        with session_scope() as db:
+            ObjectiveController(db).get_objectives_page(user_id=user_id)
+    cases["objective_controller.get_objectives_page"] = objectives_page
+
+    async def meta_prompt_flow():
+        with session_scope() as db:
+            controller = MetaPromptController(db)
+            session_id = controller.create_session(user_id).id
+            for step in (PromptCollectionStep.LEARNING_STYLE, PromptCollectionStep.GOALS,
+                         PromptCollectionStep.INTERESTS, PromptCollectionStep.REVIEW):
+                await controller.acollect_step(session_id, step)
+                controller.get_session_progress(session_id)
+    cases["meta_prompt_controller.step_flow"] = meta_prompt_flow
+
+    def review_due():
+        with session_scope() as db:
+            controller = ReviewController(db)
+            due = controller.due_items(user_id)
+            if due:
+                controller.record_review(due[0]["id"], next(counter) % 6)
+    cases["review_controller.due_items+record_review"] = review_due
+
+    def controller_crud():
+        with session_scope() as db:
+            users = UserController(db)
+            objectives = ObjectiveController(db)
+            user = users.create_user(name=f"user {next(counter)}", age=25, occupation="Analyst",
+                                     language_preference="English")
+            users.get_user(user.id)
+            users.update_user_profile(user.id, occupation="Manager")
+            objective = objectives.create_objective(user_id=user.id, name="crud", description="crud",
+                                                    priority=1, current_level="Beginner",
+                                                    target_level="Advanced")
+            objectives.update_objective(objective.id, priority=2)
+            objectives.get_objectives_by_user(user.id)
+    cases["controllers.crud"] = controller_crud
+    return cases
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--objectives", type=int, default=200, help="seeded objectives for the test user")
+    parser.add_argument("--review-items", type=int, default=20000, help="seeded review items for the test user")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="median fake LLM latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--only", help="run benchmarks whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true", help="exit with status 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    configure_fake_llm(FakeLLMConfig(latency_median_s=args.latency_ms / 1000,
+                                     tokens_per_second=args.tokens_per_second))
+
+    user_id, objective_id = _seed(args.objectives, args.review_items)
+    results = [
+        measure(name, fn, iterations=args.iterations, warmup=args.warmup)
+        for name, fn in build_cases(user_id, objective_id).items()
+        if not args.only or args.only in name
+    ]
+    print(format_table(results))
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"baseline saved to {args.baseline}")
+    if args.compare:
+        baseline = load_baseline(args.baseline)
+        if baseline is None:
+            print(f"no baseline at {args.baseline}", file=sys.stderr)
+            return 1
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
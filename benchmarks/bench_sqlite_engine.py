@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+对比 SQLAlchemy 默认 SQLite 配置与 utils.engine 调优配置在并发读写下的吞吐量。
+
+用法:
+    python -m benchmarks.bench_sqlite_engine --threads 8 --duration 5 --write-ratio 0.2
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from models.base import Base
+from models.learning_session import LearningSessionModel  # noqa: F401  # pylint: disable=unused-import
+from models.meta_prompt_session import MetaPromptSession  # noqa: F401  # pylint: disable=unused-import
+from models.objective import ObjectiveModel
+from models.user import UserModel
+from utils.engine import build_engine
+
+
+def _seed(session_factory, users: int, objectives_per_user: int) -> None:
+    db = session_factory()
+    try:
+        db.add_all(UserModel(name=f"user-{i}", age=30, occupation="Engineer") for i in range(users))
+        db.flush()
+        db.add_all(
+            ObjectiveModel(user_id=user_id, name=f"objective-{j}", description="seed", priority=j,
+                           current_level="Beginner", target_level="Intermediate")
+            for user_id in range(1, users + 1) for j in range(objectives_per_user)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run(tuned: bool, threads: int, duration: float, write_ratio: float, users: int) -> Dict[str, float]:
+    directory = tempfile.mkdtemp(prefix="bench_sqlite_")
+    engine = build_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", tuned=tuned)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    _seed(session_factory, users, objectives_per_user=5)
+
+    counters = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        local = {"reads": 0, "writes": 0, "errors": 0}
+        while time.perf_counter() < deadline:
+            db = session_factory()
+            try:
+                user_id = rng.randint(1, users)
+                if rng.random() < write_ratio:
+                    db.add(ObjectiveModel(user_id=user_id, name="bench", description="write",
+                                          priority=rng.randint(1, 5), current_level="Beginner",
+                                          target_level="Intermediate"))
+                    db.commit()
+                    local["writes"] += 1
+                else:
+                    db.query(ObjectiveModel).filter(ObjectiveModel.user_id == user_id).all()
+                    local["reads"] += 1
+            except OperationalError:
+                # 默认配置下常见的 "database is locked"
+                db.rollback()
+                local["errors"] += 1
+            finally:
+                db.close()
+        with lock:
+            for key, value in local.items():
+                counters[key] += value
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+
+    return {
+        "reads_per_s": counters["reads"] / elapsed,
+        "writes_per_s": counters["writes"] / elapsed,
+        "errors": counters["errors"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per configuration")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'profile':<8} {'reads/s':>10} {'writes/s':>10} {'errors':>8}")
+    for label, tuned in (("default", False), ("tuned", True)):
+        result = run(tuned, args.threads, args.duration, args.write_ratio, args.users)
+        print(f"{label:<8} {result['reads_per_s']:>10.1f} {result['writes_per_s']:>10.1f} "
+              f"{result['errors']:>8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+冷启动基准：``python -X importtime`` 的导入耗时与 Gradio 服务器开始监听所需的时间。
+
+- import: 在子进程中执行 ``import main`` (未安装 gradio 时改为导入各控制器与 Agent)，
+  解析 importtime 输出，报告总导入耗时与累计耗时最高的模块，并标出已加载的重量级依赖；
+- listen: 以空闲端口启动 ``main.py``，轮询直到端口可连接，记录从进程启动到开始监听的时间。
+
+每项运行 ``--runs`` 次取中位数；超出 ``--import-budget-ms`` / ``--budget-ms`` 时返回非零退出码。
+
+用法:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 5 --top 15
+    python -m benchmarks.bench_startup --import-budget-ms 1500 --budget-ms 6000
+"""
+import argparse
+import importlib.util
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 未安装 gradio 时 main 无法导入，退而测量应用自身的模块
+FALLBACK_MODULES = ("controllers.user_controller", "controllers.objective_controller",
+                    "ai_agents.learning_agent", "ai_agents.meta_prompt_agent")
+# 冷启动时应当不被导入 (或只应由 gradio 间接导入) 的重量级依赖
+HEAVY_MODULES = ("openai", "numpy", "gradio", "fastapi", "sqlalchemy", "httpx", "langchain")
+
+_IMPORT_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def _child_env(**extra: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "bench")
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env.update(extra)
+    return env
+
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, float]]:
+    """返回 (顶层导入的总耗时 ms, 各模块的累计耗时 ms)。"""
+    total_us = 0
+    cumulative: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _, cumulative_us, indent, name = match.groups()
+        cumulative[name] = int(cumulative_us) / 1000
+        if not indent:
+            total_us += int(cumulative_us)
+    return total_us / 1000, cumulative
+
+
+def measure_imports(modules: List[str]) -> Tuple[float, Dict[str, float]]:
+    statement = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT_DIR,
+                            env=_child_env(), capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"import failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_listen(timeout: float) -> Optional[float]:
+    """启动 main.py 到 Gradio 端口可连接所需的秒数；超时或进程提前退出时返回 None。"""
+    port = _free_port()
+    data_dir = tempfile.mkdtemp(prefix="bench_startup_")
+    env = _child_env(GRADIO_HOST="127.0.0.1", GRADIO_PORT=str(port), METRICS_ENABLED="false",
+                     DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'startup.db')}")
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT_DIR, "main.py")], cwd=ROOT_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                print(f"main.py exited with {process.returncode}:\n{process.stderr.read().decode()[-2000:]}",
+                      file=sys.stderr)
+                return None
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.05):
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="modules with the highest cumulative import time")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the server to listen")
+    parser.add_argument("--import-budget-ms", type=float, help="exit with status 1 above this import time")
+    parser.add_argument("--budget-ms", type=float, help="exit with status 1 above this time-to-listening")
+    args = parser.parse_args()
+
+    has_gradio = importlib.util.find_spec("gradio") is not None
+    modules = ["main"] if has_gradio else list(FALLBACK_MODULES)
+    if not has_gradio:
+        print("gradio is not installed: measuring application imports only, skipping time-to-listening",
+              file=sys.stderr)
+
+    runs = [measure_imports(modules) for _ in range(args.runs)]
+    import_ms = float(np.median([total for total, _ in runs]))
+    cumulative = runs[-1][1]
+    print(f"import {', '.join(modules)}: {import_ms:.1f} ms (median of {args.runs})")
+    print(f"{'module':<52} {'cumul. ms':>10}")
+    for name, elapsed in sorted(cumulative.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<52} {elapsed:>10.1f}")
+    loaded = [name for name in HEAVY_MODULES if name in cumulative]
+    print(f"heavy modules loaded: {', '.join(f'{name} ({cumulative[name]:.0f} ms)' for name in loaded) or 'none'}")
+
+    failures = []
+    if args.import_budget_ms is not None and import_ms > args.import_budget_ms:
+        failures.append(f"import time {import_ms:.1f} ms > budget {args.import_budget_ms:.1f} ms")
+
+    if has_gradio:
+        listen = [measure_listen(args.timeout) for _ in range(args.runs)]
+        if any(seconds is None for seconds in listen):
+            failures.append(f"server did not start listening within {args.timeout:.0f}s")
+        else:
+            listen_ms = float(np.median(listen)) * 1000
+            print(f"time to listening: {listen_ms:.0f} ms (median of {args.runs})")
+            if args.budget_ms is not None and listen_ms > args.budget_ms:
+                failures.append(f"time to listening {listen_ms:.0f} ms > budget {args.budget_ms:.0f} ms")
+
+    for failure in failures:
+        print(f"BUDGET EXCEEDED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+微基准测试工具：延迟分位数、tracemalloc 内存分配统计，以及基线的保存与对比。
+"""
+import asyncio
+import inspect
+import json
+import os
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+@dataclass
+class BenchResult:
+    name: str
+    iterations: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    # 单次调用期间的峰值内存增量与调用结束后仍保留的内存 (KiB)
+    peak_alloc_kib: float
+    retained_kib: float
+
+
+def _runner(fn: Callable, loop: asyncio.AbstractEventLoop) -> Callable[[], object]:
+    if inspect.iscoroutinefunction(fn):
+        return lambda: loop.run_until_complete(fn())
+    return fn
+
+
+def measure(name: str, fn: Callable, iterations: int = 200, warmup: int = 10,
+            alloc_iterations: int = 50) -> BenchResult:
+    """
+    先预热，再计时 ``iterations`` 次；内存分配在单独的 ``alloc_iterations`` 次调用中统计，
+    避免 tracemalloc 的开销影响计时。``fn`` 可以是普通函数或协程函数。
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        call = _runner(fn, loop)
+        for _ in range(warmup):
+            call()
+
+        timings = np.empty(iterations)
+        for index in range(iterations):
+            started = time.perf_counter()
+            call()
+            timings[index] = time.perf_counter() - started
+
+        tracemalloc.start()
+        peaks = []
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _ in range(alloc_iterations):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            call()
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+    finally:
+        loop.close()
+
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+    return BenchResult(
+        name=name,
+        iterations=iterations,
+        mean_ms=float(timings.mean() * 1000),
+        p50_ms=float(p50),
+        p95_ms=float(p95),
+        p99_ms=float(p99),
+        peak_alloc_kib=float(np.mean(peaks) / 1024) if peaks else 0.0,
+        retained_kib=retained / 1024 / max(alloc_iterations, 1),
+    )
+
+
+def format_table(results: List[BenchResult]) -> str:
+    header = f"{'benchmark':<52} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>9} {'kept KiB':>9}"
+    rows = [header, "-" * len(header)]
+    for result in results:
+        rows.append(f"{result.name:<52} {result.p50_ms:>9.3f} {result.p95_ms:>9.3f} {result.p99_ms:>9.3f} "
+                    f"{result.peak_alloc_kib:>9.1f} {result.retained_kib:>9.2f}")
+    return "\n".join(rows)
+
+
+def save_baseline(results: List[BenchResult], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({result.name: asdict(result) for result in results}, file, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Dict]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def compare(results: List[BenchResult], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """与基线对比 p95 延迟和峰值内存，返回超过 ``tolerance`` (比例) 的回归描述。"""
+    regressions = []
+    for result in results:
+        previous = baseline.get(result.name)
+        if not previous:
+            continue
+        for metric in ("p95_ms", "peak_alloc_kib"):
+            old, new = previous[metric], getattr(result, metric)
+            if old > 0 and new > old * (1 + tolerance):
+                regressions.append(f"{result.name}: {metric} {old:.3f} -> {new:.3f} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk import/export CLI.
+
+    python bulk.py import users cohort.csv
+    python bulk.py import objectives objectives.jsonl --chunk-size 2000
+    python bulk.py export objectives out.csv --user-ids 1,2,3
+    python bulk.py onboard-batch --create-sessions
+    python bulk.py ingest-batch batch_abc123
+
+Files are streamed in chunks; each chunk is inserted with one executemany inside its own
+transaction, so the database is never locked for the whole import.
+"""
+import argparse
+import time
+
+from loguru import logger
+
+from controllers import learning_controller
+from controllers.objective_controller import ObjectiveController
+from controllers.onboarding_batch_controller import OnboardingBatchController
+from controllers.user_controller import UserController
+from settings import BATCH_LOCAL_DIR, BULK_CHUNK_SIZE
+from utils.bulk_io import FIELDS_BY_KIND, read_records, write_records
+from utils.database import init_db, session_scope
+
+
+def import_records(kind: str, path: str, chunk_size: int = BULK_CHUNK_SIZE, fmt: str = None) -> int:
+    records = read_records(path, kind, fmt)
+    with session_scope() as db:
+        if kind == "users":
+            return UserController(db).bulk_create_users(records, chunk_size)
+        if kind == "objectives":
+            return ObjectiveController(db).bulk_create_objectives(records, chunk_size)
+        return learning_controller.bulk_create_learning_sessions(db, records, chunk_size)
+
+
+def export_records(kind: str, path: str, user_ids=None, chunk_size: int = BULK_CHUNK_SIZE, fmt: str = None) -> int:
+    with session_scope() as db:
+        if kind == "users":
+            records = UserController(db).iter_users(chunk_size)
+        elif kind == "objectives":
+            records = ObjectiveController(db).iter_objectives(user_ids, chunk_size)
+        else:
+            records = learning_controller.iter_learning_sessions(db, chunk_size)
+        return write_records(path, kind, records, fmt)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import/export GrowledgePilot data as CSV or JSONL")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("import", "export"):
+        sub = subparsers.add_parser(command)
+        sub.add_argument("kind", choices=list(FIELDS_BY_KIND))
+        sub.add_argument("path")
+        sub.add_argument("--format", choices=["csv", "jsonl"], help="默认根据文件扩展名判断")
+        sub.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE)
+        if command == "export":
+            sub.add_argument("--user-ids", help="逗号分隔的用户 id，仅导出这些用户的目标")
+    onboard = subparsers.add_parser("onboard-batch",
+                                    help="通过 Batch API 为待完成的 meta prompt session 生成个性化 prompt 与学习路径")
+    onboard.add_argument("--workdir", default=BATCH_LOCAL_DIR, help="请求文件的存放目录")
+    onboard.add_argument("--limit", type=int)
+    onboard.add_argument("--create-sessions", action="store_true", help="先为没有 session 的用户创建 session")
+    onboard.add_argument("--no-wait", action="store_true", help="提交后立即返回，稍后用 ingest-batch 导入结果")
+    ingest = subparsers.add_parser("ingest-batch", help="导入已完成批次的结果")
+    ingest.add_argument("batch_id")
+    args = parser.parse_args(argv)
+
+    init_db()
+    started = time.perf_counter()
+    if args.command in ("onboard-batch", "ingest-batch"):
+        with session_scope() as db:
+            controller = OnboardingBatchController(db)
+            if args.command == "ingest-batch":
+                result = controller.ingest(args.batch_id)
+            else:
+                if args.create_sessions:
+                    logger.info(f"Created {controller.create_missing_sessions()} meta prompt sessions")
+                result = controller.run(args.workdir, args.limit, wait=not args.no_wait)
+        logger.info(f"{args.command}: {result} in {time.perf_counter() - started:.2f}s")
+        return
+    if args.command == "import":
+        count = import_records(args.kind, args.path, args.chunk_size, args.format)
+    else:
+        user_ids = [int(uid) for uid in args.user_ids.split(",")] if args.user_ids else None
+        count = export_records(args.kind, args.path, user_ids, args.chunk_size, args.format)
+    logger.info(f"{args.command}ed {count} {args.kind} in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Process-wide read-through cache of user and objective snapshots.
+
+Neither row changes during a tutoring session, so LearningAgent reads them (and
+the system prompt rendered from them) from here instead of issuing SELECTs on
+every turn. Snapshots are immutable copies detached from any ORM session. The
+controllers' update methods invalidate entries after they commit; rendered
+prompts are additionally keyed by both rows' ``updated_at``, so a prompt is never
+served for a stale snapshot.
+
+Only writes made through this process are seen; with several processes writing
+the same database, keep IDENTITY_CACHE_MAX_ENTRIES at 0 to disable the cache.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, Hashable, Optional
+
+from sqlalchemy.orm import Session
+
+from models.objective import ObjectiveModel
+from models.user import UserModel
+from settings import IDENTITY_CACHE_MAX_ENTRIES
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    name: str
+    age: int
+    occupation: str
+    language_preference: Optional[str]
+    preferred_learning_style: Optional[str]
+    personalized_prompt: Optional[str]
+    meta_prompt_complete: bool
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, user: UserModel) -> "UserSnapshot":
+        return cls(id=user.id, name=user.name, age=user.age, occupation=user.occupation,
+                   language_preference=user.language_preference,
+                   preferred_learning_style=user.preferred_learning_style,
+                   personalized_prompt=user.personalized_prompt,
+                   meta_prompt_complete=bool(user.meta_prompt_complete),
+                   updated_at=user.updated_at)
+
+
+@dataclass(frozen=True)
+class ObjectiveSnapshot:
+    id: int
+    user_id: int
+    name: str
+    description: str
+    priority: int
+    current_level: str
+    target_level: str
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, objective: ObjectiveModel) -> "ObjectiveSnapshot":
+        return cls(id=objective.id, user_id=objective.user_id, name=objective.name,
+                   description=objective.description, priority=objective.priority,
+                   current_level=objective.current_level, target_level=objective.target_level,
+                   updated_at=objective.updated_at)
+
+
+class IdentityCache:
+    def __init__(self, max_entries: int = IDENTITY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        # Keys being loaded -> number of loads in flight, and how often each was invalidated meanwhile;
+        # a load that overlapped an invalidation may have read the old row and is not stored
+        self._loading: Dict[Hashable, int] = {}
+        self._generations: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_user(self, db: Session, user_id: int) -> Optional[UserSnapshot]:
+        return self._read_through(
+            ("user", user_id),
+            lambda: db.query(UserModel).filter(UserModel.id == user_id).first(),
+            UserSnapshot.from_model
+        )
+
+    def get_objective(self, db: Session, objective_id: int) -> Optional[ObjectiveSnapshot]:
+        return self._read_through(
+            ("objective", objective_id),
+            lambda: db.query(ObjectiveModel).filter(ObjectiveModel.id == objective_id).first(),
+            ObjectiveSnapshot.from_model
+        )
+
+    def get_rendered_prompt(self, template: str, user: UserSnapshot, objective: ObjectiveSnapshot,
+                            render: Callable[[], object]) -> object:
+        """Return the prompt rendered for this user/objective version, rendering it on a miss."""
+        key = ("prompt", hash(template), user.id, user.updated_at, objective.id, objective.updated_at)
+        return self._read_through(key, render, lambda rendered: rendered)
+
+    def invalidate_user(self, user_id: int) -> None:
+        self._invalidate(lambda key: key[:2] == ("user", user_id)
+                         or (key[0] == "prompt" and key[2] == user_id))
+
+    def invalidate_objective(self, objective_id: int) -> None:
+        self._invalidate(lambda key: key[:2] == ("objective", objective_id)
+                         or (key[0] == "prompt" and key[4] == objective_id))
+
+    def clear(self) -> None:
+        self._invalidate(lambda key: True)
+
+    def _read_through(self, key: Hashable, load: Callable[[], object], snapshot: Callable[[object], object]):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            generation = self._generations.get(key, 0)
+            self._loading[key] = self._loading.get(key, 0) + 1
+
+        value = None
+        try:
+            row = load()
+            if row is not None:
+                value = snapshot(row)
+        finally:
+            with self._lock:
+                invalidated = self._generations.get(key, 0) != generation
+                self._loading[key] -= 1
+                if not self._loading[key]:
+                    del self._loading[key]
+                    self._generations.pop(key, None)
+                if value is not None and not invalidated and self.max_entries > 0:
+                    self._entries[key] = value
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return value
+
+    def _invalidate(self, matches: Callable[[tuple], bool]) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if matches(key)]:
+                del self._entries[key]
+            for key in [key for key in self._loading if matches(key)]:
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+
+_cache = IdentityCache()
+
+
+def get_identity_cache() -> IdentityCache:
+    return _cache
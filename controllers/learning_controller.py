@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
 
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
 
+from controllers.identity_cache import get_identity_cache
+from controllers.turn_buffer import get_turn_buffer
+from models.conversation_turn import ConversationTurnModel
 from models.learning_session import LearningSessionModel
 from models.objective import ObjectiveModel
+from settings import BULK_CHUNK_SIZE
+from utils.bulk_io import SESSION_FIELDS, chunked
 
 
 def create_objective(db: Session, user_id: int, name: str, description: str,
@@ -30,7 +37,45 @@ def create_learning_session(db: Session, user_id: int, objective_id: int,
     return db_session
 
 
+def bulk_create_learning_sessions(db: Session, records: Iterable[Dict],
+                                  chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    total = 0
+    for chunk in chunked(records, chunk_size):
+        now = datetime.utcnow()
+        rows = [{"created_at": now, "updated_at": now, "start_time": now, **record} for record in chunk]
+        db.execute(insert(LearningSessionModel), rows)
+        db.commit()
+        total += len(rows)
+    return total
+
+
+def iter_learning_sessions(db: Session, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Dict]:
+    columns = [getattr(LearningSessionModel, name) for name in SESSION_FIELDS]
+    result = db.execute(
+        select(*columns).order_by(LearningSessionModel.id).execution_options(yield_per=chunk_size)
+    )
+    for row in result.mappings():
+        yield dict(row)
+
+
+def record_turn(session_id: int, role: str, content: str, prompt_tokens: int = None,
+                completion_tokens: int = None, latency_ms: float = None) -> int:
+    """Append a turn to the session transcript through the write-behind buffer."""
+    return get_turn_buffer().append(session_id, role, content, prompt_tokens=prompt_tokens,
+                                    completion_tokens=completion_tokens, latency_ms=latency_ms)
+
+
+def get_session_turns(db: Session, session_id: int) -> List[ConversationTurnModel]:
+    get_turn_buffer().flush(session_id)
+    return db.query(ConversationTurnModel).filter(
+        ConversationTurnModel.session_id == session_id
+    ).order_by(ConversationTurnModel.seq).all()
+
+
 def end_learning_session(db: Session, session_id: int, notes: str = None):
+    buffer = get_turn_buffer()
+    buffer.flush(session_id)
+    buffer.forget_session(session_id)
     session = db.query(LearningSessionModel).filter(LearningSessionModel.id == session_id).first()
     if session:
         session.end_time = datetime.utcnow()
@@ -66,4 +111,5 @@ def update_objective(db: Session, objective_id: int, name: str = None,
             objective.target_level = target_level
         db.commit()
         db.refresh(objective)
+        get_identity_cache().invalidate_objective(objective_id)
     return objective
@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 from enum import Enum
+from functools import cached_property
 from typing import Dict, Optional
 
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
 from ai_agents.meta_prompt_agent import MetaPromptAgent
+from controllers.identity_cache import get_identity_cache
 from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
 from models.user import UserModel
 from utils.database import get_db
+from utils.query_profiler import profile_methods
 
 
 class PromptCollectionStep(str, Enum):
@@ -20,10 +23,10 @@ class PromptCollectionStep(str, Enum):
     COMPLETE = "complete"
 
 
+@profile_methods
 class MetaPromptController:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
-        self.agent = MetaPromptAgent()
         self.collection_steps = [
             PromptCollectionStep.INIT,
             PromptCollectionStep.LEARNING_STYLE,
@@ -33,6 +36,11 @@ class MetaPromptController:
             PromptCollectionStep.COMPLETE
         ]
 
+    @cached_property
+    def agent(self) -> MetaPromptAgent:
+        # 只有分析步骤需要 Agent；建会话、查进度的请求不必构造它
+        return MetaPromptAgent()
+
     def create_session(self, user_id: int) -> MetaPromptSession:
         user = self.db.query(UserModel).filter(UserModel.id == user_id).first()
         if not user:
@@ -48,10 +56,11 @@ class MetaPromptController:
         self.db.refresh(session)
         return session
 
-    def get_session(self, session_id: int) -> MetaPromptSession:
-        session = self.db.query(MetaPromptSession).filter(
-            MetaPromptSession.id == session_id
-        ).first()
+    def get_session(self, session_id: int, with_user: bool = False) -> MetaPromptSession:
+        # Session.get answers from the identity map, so repeated lookups within one UI event
+        # cost no extra query; with_user loads session.user in the same SELECT
+        options = [joinedload(MetaPromptSession.user)] if with_user else None
+        session = self.db.get(MetaPromptSession, session_id, options=options)
         if not session:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -114,15 +123,15 @@ class MetaPromptController:
     ) -> Dict:
         if step == PromptCollectionStep.LEARNING_STYLE:
             preference = self.agent.collect_preferences(session.user, "learning_style")
-            session.add_preference("learning_style", preference)
+            session.add_preferences({"learning_style": preference})
 
         elif step == PromptCollectionStep.GOALS:
             goals = self.agent.collect_preferences(session.user, "goals")
-            session.add_preference("goals", goals)
+            session.add_preferences({"goals": goals})
 
         elif step == PromptCollectionStep.INTERESTS:
             interests = self.agent.collect_preferences(session.user, "interests")
-            session.add_preference("interests", interests)
+            session.add_preferences({"interests": interests})
 
         elif step == PromptCollectionStep.REVIEW:
             personalized_prompt = self.agent.generate_personalized_prompt(session)
@@ -131,6 +140,89 @@ class MetaPromptController:
 
         return session.collected_preferences
 
+    async def _acollect_step_data(
+            self,
+            session: MetaPromptSession,
+            step: PromptCollectionStep,
+            input_data: Dict
+    ) -> Dict:
+        if step in (PromptCollectionStep.LEARNING_STYLE,
+                    PromptCollectionStep.GOALS,
+                    PromptCollectionStep.INTERESTS):
+            preference = await self.agent.acollect_preferences(session.user, step.value)
+            # add_preference mutates the JSON dict in place, which the commit would not write
+            session.add_preferences({step.value: preference})
+
+        elif step == PromptCollectionStep.REVIEW:
+            personalized_prompt = await self.agent.agenerate_personalized_prompt(session)
+            session.set_generated_prompt(personalized_prompt)
+            session.user.set_personalized_prompt(personalized_prompt)
+
+        return session.collected_preferences
+
+    async def acollect_step(
+            self,
+            session_id: int,
+            step: PromptCollectionStep,
+            input_data: Optional[Dict] = None
+    ) -> Dict:
+        """Run the LLM work for a step without blocking the event loop, then commit."""
+        session = self.get_session(session_id, with_user=True)
+        user_id = session.user_id  # read before the commit expires the session
+        preferences = await self._acollect_step_data(session, step, input_data or {})
+        self.db.commit()
+        if step == PromptCollectionStep.REVIEW:
+            # The user's personalized prompt changed
+            get_identity_cache().invalidate_user(user_id)
+        return preferences
+
+    def store_generated_prompt(self, session_id: int, prompt: str) -> MetaPromptSession:
+        """
+        Store a personalized prompt generated while no DB session was open, completing
+        the session; see MetaPromptPage.update_review_prompt.
+        """
+        session = self.get_session(session_id, with_user=True)
+        session.set_generated_prompt(prompt)
+        session.user.set_personalized_prompt(prompt)
+        user_id = session.user_id
+        self.db.commit()
+        get_identity_cache().invalidate_user(user_id)
+        return session
+
+    def collect_all_preferences(self, session_id: int, timeout: Optional[float] = None) -> Dict:
+        """Onboarding mode: collect all preferences concurrently and store them in one commit."""
+        session = self.get_session(session_id, with_user=True)
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        preferences, errors = self.agent.collect_all_preferences(session.user, **kwargs)
+        return self._store_collected_preferences(session, preferences, errors)
+
+    async def acollect_all_preferences(self, session_id: int, timeout: Optional[float] = None) -> Dict:
+        """Async variant of collect_all_preferences for event-loop based handlers."""
+        session = self.get_session(session_id, with_user=True)
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        preferences, errors = await self.agent.acollect_all_preferences(session.user, **kwargs)
+        return self._store_collected_preferences(session, preferences, errors)
+
+    def _store_collected_preferences(
+            self,
+            session: MetaPromptSession,
+            preferences: Dict,
+            errors: Dict
+    ) -> Dict:
+        # Failed preference types stay uncollected, so the step-by-step flow resumes there
+        if preferences:
+            session.add_preferences(preferences)
+            session.update_status(MetaPromptStatus.COLLECTING)
+            self.db.commit()
+
+        return {
+            "session_id": session.id,
+            "collected": sorted(preferences),
+            "errors": errors,
+            "current_step": self.get_current_step(session),
+            "status": session.status
+        }
+
     def _get_next_step(self, current_step: PromptCollectionStep) -> PromptCollectionStep:
         current_index = self.collection_steps.index(current_step)
         if current_index + 1 < len(self.collection_steps):
@@ -147,7 +239,10 @@ class MetaPromptController:
         return session.generated_prompt
 
     def get_session_progress(self, session_id: int) -> Dict:
-        session = self.get_session(session_id)
+        return self.session_progress(self.get_session(session_id))
+
+    def session_progress(self, session: MetaPromptSession) -> Dict:
+        """Progress of an already loaded session, for callers that also need the session itself."""
         current_step = self.get_current_step(session)
         total_steps = len(self.collection_steps) - 2  # Excluding INIT and COMPLETE
         completed_steps = self.collection_steps.index(current_step)
@@ -1,13 +1,58 @@
 # -*- coding: utf-8 -*-
-from typing import Optional, List
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, Optional, List, Tuple
 
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.orm import Session
 
+from controllers.identity_cache import ObjectiveSnapshot, get_identity_cache
 from models.objective import ObjectiveModel
+from settings import BULK_CHUNK_SIZE, OBJECTIVES_PAGE_SIZE
+from utils.bulk_io import OBJECTIVE_FIELDS, chunked
 from utils.database import get_db
+from utils.query_profiler import profile_methods
 
+# Stay well below SQLite's limit on bound parameters per statement
+_IN_CLAUSE_BATCH = 500
 
+# Columns shown in the dashboard table; pages select only these
+PAGE_COLUMNS = (
+    ObjectiveModel.id,
+    ObjectiveModel.name,
+    ObjectiveModel.description,
+    ObjectiveModel.priority,
+    ObjectiveModel.current_level,
+    ObjectiveModel.target_level,
+)
+
+
+def objectives_page_query(user_id: Optional[int] = None,
+                          page_size: int = OBJECTIVES_PAGE_SIZE,
+                          after: Optional[Tuple[int, int]] = None,
+                          name_contains: Optional[str] = None,
+                          current_level: Optional[str] = None,
+                          descending: bool = False):
+    """Keyset query behind ObjectiveController.get_objectives_page; fetches one extra row to detect a next page."""
+    key = tuple_(ObjectiveModel.priority, ObjectiveModel.id)
+    statement = select(*PAGE_COLUMNS)
+    if user_id is not None:
+        statement = statement.where(ObjectiveModel.user_id == user_id)
+    if name_contains:
+        statement = statement.where(ObjectiveModel.name.contains(name_contains, autoescape=True))
+    if current_level:
+        statement = statement.where(ObjectiveModel.current_level == current_level)
+    if after is not None:
+        statement = statement.where(key < tuple(after) if descending else key > tuple(after))
+    if descending:
+        statement = statement.order_by(ObjectiveModel.priority.desc(), ObjectiveModel.id.desc())
+    else:
+        statement = statement.order_by(ObjectiveModel.priority, ObjectiveModel.id)
+    return statement.limit(page_size + 1)
+
+
+@profile_methods
 class ObjectiveController:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
@@ -32,9 +77,74 @@ class ObjectiveController:
         self.db.refresh(db_obj)
         return db_obj
 
+    def bulk_create_objectives(self, records: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """Insert objectives from a stream of dicts, one executemany and one transaction per chunk."""
+        total = 0
+        for chunk in chunked(records, chunk_size):
+            now = datetime.utcnow()
+            # priority is part of the dashboard's keyset cursor, so it must never be NULL
+            rows = [{"created_at": now, "updated_at": now, "priority": 0, **record} for record in chunk]
+            self.db.execute(insert(ObjectiveModel), rows)
+            self.db.commit()
+            total += len(rows)
+        return total
+
+    def get_objectives_by_users(self, user_ids: Iterable[int]) -> Dict[int, List[ObjectiveModel]]:
+        """Fetch the objectives of many users with one IN query per 500 ids."""
+        objectives = defaultdict(list)
+        for batch in chunked(sorted(set(user_ids)), _IN_CLAUSE_BATCH):
+            for objective in self.db.query(ObjectiveModel).filter(
+                    ObjectiveModel.user_id.in_(batch)
+            ).order_by(ObjectiveModel.user_id, ObjectiveModel.priority):
+                objectives[objective.user_id].append(objective)
+        return dict(objectives)
+
+    def get_objectives_page(self,
+                            user_id: Optional[int] = None,
+                            page_size: int = OBJECTIVES_PAGE_SIZE,
+                            after: Optional[Tuple[int, int]] = None,
+                            name_contains: Optional[str] = None,
+                            current_level: Optional[str] = None,
+                            descending: bool = False) -> Tuple[List[Tuple], Optional[Tuple[int, int]]]:
+        """
+        One page of objectives ordered by (priority, id).
+
+        Seeks past the ``after`` cursor instead of using OFFSET, so the cost is bounded by
+        ``page_size`` rather than by how many objectives precede the page. ``user_id=None``
+        pages across all users (admin view).
+
+        Returns:
+            The rows as tuples of PAGE_COLUMNS, and the cursor of the next page (None on the last page).
+        """
+        statement = objectives_page_query(user_id, page_size, after, name_contains,
+                                          current_level, descending)
+        rows = [tuple(row) for row in self.db.execute(statement)]
+        if len(rows) <= page_size:
+            return rows, None
+        rows = rows[:page_size]
+        last = rows[-1]
+        return rows, (last[3], last[0])
+
+    def iter_objectives(self, user_ids: Optional[Iterable[int]] = None,
+                        chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Dict]:
+        """Stream objectives (optionally of some users) as dicts of the exported columns."""
+        columns = [getattr(ObjectiveModel, name) for name in OBJECTIVE_FIELDS]
+        batches = chunked(sorted(set(user_ids)), _IN_CLAUSE_BATCH) if user_ids is not None else [None]
+        for batch in batches:
+            statement = select(*columns).order_by(ObjectiveModel.user_id, ObjectiveModel.id)
+            if batch is not None:
+                statement = statement.where(ObjectiveModel.user_id.in_(batch))
+            result = self.db.execute(statement.execution_options(yield_per=chunk_size))
+            for row in result.mappings():
+                yield dict(row)
+
     def get_objective(self, objective_id: int) -> Optional[ObjectiveModel]:
         return self.db.query(ObjectiveModel).filter(ObjectiveModel.id == objective_id).first()
 
+    def get_objective_snapshot(self, objective_id: int) -> Optional[ObjectiveSnapshot]:
+        """Retrieve a cached, read-only snapshot of the objective."""
+        return get_identity_cache().get_objective(self.db, objective_id)
+
     def get_objectives_by_user(self, user_id: int) -> List[ObjectiveModel]:
         return self.db.query(ObjectiveModel).filter(ObjectiveModel.user_id == user_id).all()
 
@@ -65,4 +175,5 @@ class ObjectiveController:
 
         self.db.commit()
         self.db.refresh(objective)
+        get_identity_cache().invalidate_objective(objective_id)
         return objective
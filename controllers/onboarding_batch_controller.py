@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Collection, Dict, Iterator, List, Optional
+
+from fastapi import Depends
+from loguru import logger
+from sqlalchemy import and_, exists, insert, or_, select, update
+from sqlalchemy.orm import Session, joinedload
+
+from ai_agents.batch import BatchBackend, get_batch_backend, result_content, result_error
+from ai_agents.meta_prompt_agent import BATCH_LEARNING_PATH, BATCH_PERSONALIZED_PROMPT, MetaPromptAgent
+from ai_agents.structured_output import LEARNING_PATH_SCHEMA, StructuredOutputError, parse_json_response
+from controllers.identity_cache import get_identity_cache
+from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
+from models.user import UserModel
+from settings import BULK_CHUNK_SIZE, ONBOARDING_BATCH_IDLE_HOURS
+from utils.bulk_io import chunked
+from utils.database import get_db
+
+
+def _pending(idle_hours: float):
+    """
+    Sessions without a prompt that are not already in a batch: not yet started, or
+    left in the interactive flow (COLLECTING) for more than ``idle_hours``.
+    """
+    idle_since = datetime.utcnow() - timedelta(hours=idle_hours)
+    return and_(
+        or_(MetaPromptSession.status == MetaPromptStatus.STARTED,
+            and_(MetaPromptSession.status == MetaPromptStatus.COLLECTING,
+                 MetaPromptSession.updated_at < idle_since)),
+        MetaPromptSession.generated_prompt.is_(None),
+        MetaPromptSession.batch_id.is_(None)
+    )
+
+
+def _request_session_id(line: str) -> int:
+    return int(json.loads(line)["custom_id"].partition(":")[0])
+
+
+class OnboardingBatchController:
+    """
+    Overnight onboarding: personalized prompts and learning paths for every pending
+    MetaPromptSession, generated through a batch backend instead of interactive calls.
+
+    Submitted sessions record the batch id and are skipped by later runs; results
+    are only applied to sessions still waiting for that batch, so a session the user
+    has since continued in the UI is left alone.
+    """
+
+    def __init__(self, db: Session = Depends(get_db), backend: Optional[BatchBackend] = None,
+                 agent: Optional[MetaPromptAgent] = None):
+        self.db = db
+        self.agent = agent or MetaPromptAgent()
+        self.backend = backend or get_batch_backend(self.agent.client)
+
+    def create_missing_sessions(self, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """Bulk-create a meta prompt session for every user who has none (e.g. a freshly imported cohort)."""
+        user_ids = self.db.execute(
+            select(UserModel.id).where(~exists().where(MetaPromptSession.user_id == UserModel.id))
+        ).scalars().all()
+        for chunk in chunked(user_ids, chunk_size):
+            now = datetime.utcnow()
+            self.db.execute(insert(MetaPromptSession), [
+                {"user_id": user_id, "status": MetaPromptStatus.STARTED, "collected_preferences": {},
+                 "created_at": now, "updated_at": now}
+                for user_id in chunk
+            ])
+            self.db.commit()
+        return len(user_ids)
+
+    def iter_pending_sessions(self, limit: Optional[int] = None, chunk_size: int = BULK_CHUNK_SIZE,
+                              idle_hours: float = ONBOARDING_BATCH_IDLE_HOURS) -> Iterator[MetaPromptSession]:
+        """The sessions an onboarding batch may take over (see ``_pending``)."""
+        query = self.db.query(MetaPromptSession).options(joinedload(MetaPromptSession.user)).filter(
+            _pending(idle_hours)
+        ).order_by(MetaPromptSession.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.yield_per(chunk_size)
+
+    def write_requests(self, path: str, limit: Optional[int] = None) -> int:
+        """Write the batch request file for the pending sessions; returns the number of sessions."""
+        count = 0
+        with open(path, "w", encoding="utf-8") as file:
+            for session in self.iter_pending_sessions(limit):
+                for request in self.agent.onboarding_batch_requests(session):
+                    file.write(json.dumps(request, ensure_ascii=False) + "\n")
+                count += 1
+        return count
+
+    def submit(self, path: str, chunk_size: int = BULK_CHUNK_SIZE,
+               idle_hours: float = ONBOARDING_BATCH_IDLE_HOURS) -> Optional[str]:
+        """
+        Claim the sessions of a request file, submit the requests of the claimed ones
+        and mark them with the batch id, so later runs skip them.
+
+        The claim re-checks that each session is still pending: one the user resumed in
+        the UI after the file was written is not claimed, and its requests are removed
+        from the file before it is uploaded.
+
+        Returns:
+            The batch id, or None when no session of the file could be claimed.
+        """
+        claim = f"claim_{uuid.uuid4().hex}"
+        for session_ids in chunked(self._session_ids(path), chunk_size):
+            self.db.execute(
+                update(MetaPromptSession).where(MetaPromptSession.id.in_(session_ids), _pending(idle_hours))
+                .values(batch_id=claim).execution_options(synchronize_session=False)
+            )
+            self.db.commit()
+        claimed = set(self.db.execute(
+            select(MetaPromptSession.id).where(MetaPromptSession.batch_id == claim)
+        ).scalars())
+        if not claimed:
+            return None
+        self._keep_requests(path, claimed)
+        try:
+            batch_id = self.backend.submit(path)
+        except Exception:
+            self._set_batch_id(claim, None)
+            raise
+        self._set_batch_id(claim, batch_id)
+        return batch_id
+
+    def _set_batch_id(self, current: str, batch_id: Optional[str]) -> None:
+        self.db.execute(
+            update(MetaPromptSession).where(MetaPromptSession.batch_id == current)
+            .values(batch_id=batch_id).execution_options(synchronize_session=False)
+        )
+        self.db.commit()
+
+    @staticmethod
+    def _session_ids(path: str) -> List[int]:
+        with open(path, encoding="utf-8") as file:
+            return sorted({_request_session_id(line) for line in file if line.strip()})
+
+    @staticmethod
+    def _keep_requests(path: str, session_ids: Collection[int]) -> None:
+        with open(path, encoding="utf-8") as file:
+            lines = [line for line in file if line.strip() and _request_session_id(line) in session_ids]
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(lines)
+
+    def ingest(self, batch_id: str, chunk_size: int = BULK_CHUNK_SIZE) -> Dict:
+        """
+        Store the results of a finished batch: the personalized prompt on the session and
+        its user (completing the session) and the learning path in the session's
+        preferences. Results are applied in chunks, one commit per chunk. Sessions of
+        the batch left without a prompt (failed requests) are released for the next run.
+        """
+        summary = {"prompts": 0, "learning_paths": 0, "errors": {}}
+        cache = get_identity_cache()
+        for results in chunked(self.backend.results(batch_id), chunk_size):
+            outputs = defaultdict(dict)
+            for result in results:
+                content = result_content(result)
+                if content is None:
+                    summary["errors"][result["custom_id"]] = result_error(result)
+                    continue
+                session_id, _, kind = result["custom_id"].partition(":")
+                outputs[int(session_id)][kind] = content
+
+            sessions = self.db.query(MetaPromptSession).options(joinedload(MetaPromptSession.user)).filter(
+                MetaPromptSession.id.in_(list(outputs)),
+                MetaPromptSession.batch_id == batch_id
+            ).all()
+            for session in sessions:
+                self._apply(session, outputs[session.id], summary)
+            self.db.commit()
+            for session in sessions:
+                cache.invalidate_user(session.user_id)
+        released = self.db.execute(
+            update(MetaPromptSession).where(MetaPromptSession.batch_id == batch_id,
+                                            MetaPromptSession.generated_prompt.is_(None))
+            .values(batch_id=None).execution_options(synchronize_session=False)
+        ).rowcount
+        self.db.commit()
+        summary["released"] = released
+        logger.info(f"Ingested batch {batch_id}: {summary['prompts']} prompts, "
+                    f"{summary['learning_paths']} learning paths, {len(summary['errors'])} errors, "
+                    f"{released} sessions released for the next run")
+        return summary
+
+    @staticmethod
+    def _apply(session: MetaPromptSession, outputs: Dict[str, str], summary: Dict) -> None:
+        if BATCH_LEARNING_PATH in outputs:
+            try:
+                learning_path, _ = parse_json_response(outputs[BATCH_LEARNING_PATH], LEARNING_PATH_SCHEMA)
+                session.add_preferences({"learning_path": learning_path})
+                summary["learning_paths"] += 1
+            except StructuredOutputError as e:
+                summary["errors"][f"{session.id}:{BATCH_LEARNING_PATH}"] = f"Invalid JSON: {e}"
+        if BATCH_PERSONALIZED_PROMPT in outputs:
+            prompt = outputs[BATCH_PERSONALIZED_PROMPT]
+            session.set_generated_prompt(prompt)
+            session.user.set_personalized_prompt(prompt)
+            summary["prompts"] += 1
+
+    def run(self, workdir: str, limit: Optional[int] = None, wait: bool = True,
+            timeout: Optional[float] = None) -> Dict:
+        """Write, submit and (unless ``wait`` is False) wait for and ingest one onboarding batch."""
+        os.makedirs(workdir, exist_ok=True)
+        path = os.path.join(workdir, f"onboarding_{datetime.utcnow():%Y%m%d_%H%M%S}.jsonl")
+        batch_id = self.submit(path) if self.write_requests(path, limit) else None
+        if batch_id is None:
+            return {"sessions": 0, "batch_id": None}
+        result = {"sessions": len(self._session_ids(path)), "batch_id": batch_id}
+        if wait:
+            result["status"] = self.backend.wait(batch_id, timeout=timeout)
+            result.update(self.ingest(batch_id))
+        return result
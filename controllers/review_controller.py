@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from models.review_item import ReviewItemModel
+from settings import BULK_CHUNK_SIZE, REVIEW_DUE_LIMIT, REVIEW_INITIAL_EASE
+from utils.bulk_io import chunked
+from utils.database import get_db
+from utils.query_profiler import profile_methods
+from utils.spaced_repetition import (MAX_GRADE, MIN_GRADE, ReviewState, due_at, due_dates, rescale_intervals,
+                                     sm2_batch, sm2_step)
+
+# Stay well below SQLite's limit on bound parameters per statement
+_IN_CLAUSE_BATCH = 500
+
+# Columns returned by due_items; the review card needs nothing else
+DUE_COLUMNS = (
+    ReviewItemModel.id,
+    ReviewItemModel.objective_id,
+    ReviewItemModel.prompt,
+    ReviewItemModel.answer,
+    ReviewItemModel.due_at,
+    ReviewItemModel.repetitions,
+    ReviewItemModel.interval_days,
+)
+
+
+def due_items_query(user_id: int, now: datetime, limit: int = REVIEW_DUE_LIMIT,
+                    objective_id: Optional[int] = None):
+    """Query behind ReviewController.due_items: a range scan of ix_review_items_user_due, most overdue first."""
+    statement = select(*DUE_COLUMNS).where(ReviewItemModel.user_id == user_id, ReviewItemModel.due_at <= now)
+    if objective_id is not None:
+        statement = statement.where(ReviewItemModel.objective_id == objective_id)
+    return statement.order_by(ReviewItemModel.due_at).limit(limit)
+
+
+def _is_valid_grade(grade) -> bool:
+    # bool is an int subclass but not a grade; floats, strings and None must not reach the scheduler
+    return isinstance(grade, int) and not isinstance(grade, bool) and MIN_GRADE <= grade <= MAX_GRADE
+
+
+def _invalid_grade(grade) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Review grade must be an integer between {MIN_GRADE} and {MAX_GRADE}, got {grade!r}"
+    )
+
+
+@profile_methods
+class ReviewController:
+    """
+    Spaced-repetition review items (SM-2).
+
+    Single reviews update one row; record_reviews and recalibrate update whole
+    batches with the vectorized scheduler and one executemany per chunk, so they
+    stay cheap with millions of items across the user base.
+    """
+
+    def __init__(self, db: Session = Depends(get_db)):
+        self.db = db
+
+    def create_item(self, user_id: int, objective_id: int, prompt: str, answer: Optional[str] = None,
+                    due: Optional[datetime] = None) -> ReviewItemModel:
+        """New items are due immediately unless ``due`` says otherwise."""
+        item = ReviewItemModel(user_id=user_id, objective_id=objective_id, prompt=prompt, answer=answer,
+                               ease=REVIEW_INITIAL_EASE, due_at=due or datetime.utcnow())
+        self.db.add(item)
+        self.db.commit()
+        self.db.refresh(item)
+        return item
+
+    def bulk_create_items(self, records: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """Insert review items from a stream of dicts, one executemany and one transaction per chunk."""
+        total = 0
+        for chunk in chunked(records, chunk_size):
+            now = datetime.utcnow()
+            rows = [{"created_at": now, "updated_at": now, "due_at": now, "ease": REVIEW_INITIAL_EASE,
+                     "interval_days": 0.0, "repetitions": 0, "lapses": 0, **record} for record in chunk]
+            self.db.execute(insert(ReviewItemModel), rows)
+            self.db.commit()
+            total += len(rows)
+        return total
+
+    def get_item(self, item_id: int) -> Optional[ReviewItemModel]:
+        return self.db.get(ReviewItemModel, item_id)
+
+    def due_items(self, user_id: int, limit: int = REVIEW_DUE_LIMIT, objective_id: Optional[int] = None,
+                  now: Optional[datetime] = None) -> List[Dict]:
+        """
+        The ``limit`` most overdue items of the user, as dicts of DUE_COLUMNS.
+
+        One index seek plus ``limit`` rows: the cost does not grow with the number of
+        items the user (or anyone else) has.
+        """
+        statement = due_items_query(user_id, now or datetime.utcnow(), limit, objective_id)
+        return [dict(row) for row in self.db.execute(statement).mappings()]
+
+    def count_due(self, user_id: int, now: Optional[datetime] = None) -> int:
+        return self.db.execute(
+            select(func.count()).select_from(ReviewItemModel).where(
+                ReviewItemModel.user_id == user_id, ReviewItemModel.due_at <= (now or datetime.utcnow()))
+        ).scalar_one()
+
+    def record_review(self, item_id: int, grade: int, now: Optional[datetime] = None) -> ReviewItemModel:
+        """Grade one review (0-5) and schedule the next one."""
+        if not _is_valid_grade(grade):
+            raise _invalid_grade(grade)
+        item = self.get_item(item_id)
+        if not item:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Review item not found"
+            )
+
+        now = now or datetime.utcnow()
+        state = sm2_step(ReviewState(item.interval_days, item.ease, item.repetitions, item.lapses), grade)
+        item.interval_days = state.interval_days
+        item.ease = state.ease
+        item.repetitions = state.repetitions
+        item.lapses = state.lapses
+        item.last_reviewed_at = now
+        item.due_at = due_at(now, state.interval_days)
+        self.db.commit()
+        self.db.refresh(item)
+        return item
+
+    def record_reviews(self, grades: Mapping[int, int], now: Optional[datetime] = None) -> int:
+        """
+        Grade many reviews at once ({item_id: grade}), e.g. a finished review session
+        or an offline sync. Unknown ids are skipped.
+
+        Returns:
+            The number of items updated.
+        """
+        bad = [grade for grade in grades.values() if not _is_valid_grade(grade)]
+        if bad:
+            raise _invalid_grade(bad[0])
+        import numpy as np  # pylint: disable=import-outside-toplevel
+
+        now = now or datetime.utcnow()
+        total = 0
+        for batch in chunked(sorted(grades), _IN_CLAUSE_BATCH):
+            rows = self.db.execute(
+                select(ReviewItemModel.id, ReviewItemModel.interval_days, ReviewItemModel.ease,
+                       ReviewItemModel.repetitions, ReviewItemModel.lapses)
+                .where(ReviewItemModel.id.in_(batch))
+            ).all()
+            if not rows:
+                continue
+            ids, interval_days, ease, repetitions, lapses = (np.array(column) for column in zip(*rows))
+            interval_days, ease, repetitions, lapses = sm2_batch(
+                interval_days, ease, repetitions, lapses, np.array([grades[item_id] for item_id in ids.tolist()]))
+            due = due_dates([now] * len(ids), interval_days, now)
+            self.db.execute(update(ReviewItemModel), [
+                {"id": item_id, "interval_days": interval, "ease": item_ease, "repetitions": reps,
+                 "lapses": item_lapses, "due_at": item_due, "last_reviewed_at": now, "updated_at": now}
+                for item_id, interval, item_ease, reps, item_lapses, item_due in zip(
+                    ids.tolist(), interval_days.tolist(), ease.tolist(), repetitions.tolist(), lapses.tolist(), due)
+            ])
+            total += len(rows)
+        self.db.commit()
+        return total
+
+    def recalibrate(self, factor: float, user_id: Optional[int] = None, objective_id: Optional[int] = None,
+                    max_interval_days: Optional[float] = None, chunk_size: int = BULK_CHUNK_SIZE,
+                    now: Optional[datetime] = None) -> int:
+        """
+        Multiply the intervals of every reviewed item (optionally of one user or
+        objective) by ``factor`` and move their due dates accordingly, e.g. to
+        shorten all intervals when measured retention falls below target.
+
+        Walks the table in id order, ``chunk_size`` rows per vectorized update and
+        transaction, so the write lock is never held for long.
+
+        Returns:
+            The number of items rescheduled.
+        """
+        if factor <= 0:
+            raise ValueError(f"factor must be positive, got {factor}")
+        now = now or datetime.utcnow()
+        statement = select(ReviewItemModel.id, ReviewItemModel.interval_days, ReviewItemModel.last_reviewed_at) \
+            .where(ReviewItemModel.interval_days > 0)
+        if user_id is not None:
+            statement = statement.where(ReviewItemModel.user_id == user_id)
+        if objective_id is not None:
+            statement = statement.where(ReviewItemModel.objective_id == objective_id)
+
+        total = 0
+        last_id = 0
+        while True:
+            rows = self.db.execute(
+                statement.where(ReviewItemModel.id > last_id).order_by(ReviewItemModel.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                return total
+            ids, interval_days, reviewed_at = zip(*rows)
+            interval_days = rescale_intervals(interval_days, factor, max_days=max_interval_days)
+            due = due_dates(reviewed_at, interval_days, now)
+            self.db.execute(update(ReviewItemModel), [
+                {"id": item_id, "interval_days": interval, "due_at": item_due, "updated_at": now}
+                for item_id, interval, item_due in zip(ids, interval_days.tolist(), due)
+            ])
+            self.db.commit()
+            total += len(rows)
+            last_id = ids[-1]
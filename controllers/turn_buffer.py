@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+Write-behind buffer for conversation turns.
+
+Turns are queued in memory and inserted in one executemany batch when the
+buffer reaches TURN_BUFFER_MAX_BATCH rows or every TURN_BUFFER_FLUSH_INTERVAL
+seconds, whichever comes first. Sequence numbers are allocated in memory, so a
+chat turn costs no database round trip on the request path.
+
+Transient failures (OperationalError, e.g. a locked database) put the batch back
+and are retried up to TURN_BUFFER_MAX_RETRIES times. Any other failure, or running
+out of retries, inserts the rows one by one and appends the ones that still fail
+to the TURN_BUFFER_DEAD_LETTER_PATH JSONL file, so one bad row never blocks the
+buffer for every other session.
+"""
+import atexit
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from loguru import logger
+from sqlalchemy import func, insert
+from sqlalchemy.exc import OperationalError
+
+from models.conversation_turn import ConversationTurnModel
+from settings import (TURN_BUFFER_DEAD_LETTER_PATH, TURN_BUFFER_FLUSH_INTERVAL, TURN_BUFFER_MAX_BATCH,
+                      TURN_BUFFER_MAX_RETRIES)
+from utils.database import SessionLocal
+
+
+class TurnWriteBuffer:
+    def __init__(self, session_factory=SessionLocal,
+                 max_batch: int = TURN_BUFFER_MAX_BATCH,
+                 flush_interval: float = TURN_BUFFER_FLUSH_INTERVAL,
+                 max_retries: int = TURN_BUFFER_MAX_RETRIES,
+                 dead_letter_path: Optional[str] = TURN_BUFFER_DEAD_LETTER_PATH):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self._pending: List[Dict] = []
+        # Consecutive transient failures of the rows at the head of _pending
+        self._attempts = 0
+        self._next_seq: Dict[int, int] = {}
+        # Rows queued or being flushed, per session; a session's seq counter is kept until they are written
+        self._unwritten: Dict[int, int] = defaultdict(int)
+        self._forgotten: Set[int] = set()
+        self.dead_letters = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def append(self,
+               session_id: int,
+               role: str,
+               content: str,
+               prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None,
+               latency_ms: Optional[float] = None) -> int:
+        """Queue a turn and return its sequence number within the session."""
+        last_seq = None
+        while True:
+            with self._lock:
+                # A session without a counter has no unwritten rows, so the database max(seq) is exact
+                if session_id not in self._next_seq and last_seq is not None:
+                    self._next_seq[session_id] = last_seq + 1
+                if session_id in self._next_seq:
+                    seq = self._next_seq[session_id]
+                    self._next_seq[session_id] = seq + 1
+                    self._unwritten[session_id] += 1
+                    self._forgotten.discard(session_id)
+                    now = datetime.utcnow()
+                    self._pending.append({
+                        "session_id": session_id,
+                        "seq": seq,
+                        "role": role,
+                        "content": content,
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "latency_ms": latency_ms,
+                        "created_at": now,
+                        "updated_at": now,
+                    })
+                    full = len(self._pending) >= self.max_batch
+                    self._ensure_worker()
+                    break
+            # First turn of the session: query outside the lock, so appends of other sessions do not wait
+            last_seq = self._last_written_seq(session_id)
+        if full:
+            self._wakeup.set()
+        return seq
+
+    def flush(self, session_id: Optional[int] = None) -> int:
+        """
+        Insert all pending turns in a single transaction.
+
+        ``session_id`` is accepted for call-site readability (e.g. before ending a
+        session); the whole buffer is flushed either way so ordering is preserved.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+
+            db = self.session_factory()
+            try:
+                db.execute(insert(ConversationTurnModel), rows)
+                db.commit()
+                written = len(rows)
+            except OperationalError:
+                db.rollback()
+                self._attempts += 1
+                if self._attempts <= self.max_retries:
+                    logger.warning(f"Failed to flush {len(rows)} conversation turns "
+                                   f"(attempt {self._attempts}/{self.max_retries}), will retry")
+                    with self._lock:
+                        self._pending[:0] = rows
+                    return 0
+                logger.exception(f"Giving up on flushing {len(rows)} conversation turns as a batch")
+                written = self._insert_one_by_one(db, rows)
+            except Exception:  # pylint: disable=broad-except
+                db.rollback()
+                logger.exception(f"Failed to flush {len(rows)} conversation turns as a batch")
+                written = self._insert_one_by_one(db, rows)
+            finally:
+                db.close()
+            self._attempts = 0
+            self._done(rows)
+            return written
+
+    def _insert_one_by_one(self, db, rows: List[Dict]) -> int:
+        """Insert rows separately so one bad row does not take the batch down; dead-letter the failures."""
+        written = 0
+        failed = []
+        for row in rows:
+            try:
+                db.execute(insert(ConversationTurnModel), [row])
+                db.commit()
+                written += 1
+            except Exception:  # pylint: disable=broad-except
+                db.rollback()
+                failed.append(row)
+        if failed:
+            self._dead_letter(failed)
+        return written
+
+    def _dead_letter(self, rows: List[Dict]) -> None:
+        self.dead_letters += len(rows)
+        logger.error(f"Dropping {len(rows)} conversation turns that could not be written"
+                     + (f"; saved to {self.dead_letter_path}" if self.dead_letter_path else ""))
+        if not self.dead_letter_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.dead_letter_path) or ".", exist_ok=True)
+            with open(self.dead_letter_path, "a", encoding="utf-8") as file:
+                for row in rows:
+                    file.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
+        except OSError:
+            logger.exception(f"Failed to write dead letters to {self.dead_letter_path}")
+
+    def _done(self, rows: List[Dict]) -> None:
+        """Rows left the buffer (written or dead-lettered): release seq counters of forgotten sessions."""
+        with self._lock:
+            for row in rows:
+                self._unwritten[row["session_id"]] -= 1
+            for session_id in {row["session_id"] for row in rows}:
+                if self._unwritten[session_id] <= 0:
+                    del self._unwritten[session_id]
+                    if session_id in self._forgotten:
+                        self._forgotten.discard(session_id)
+                        self._next_seq.pop(session_id, None)
+
+    def close(self) -> None:
+        """Stop the background flusher and write out everything still queued."""
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def forget_session(self, session_id: int) -> None:
+        """
+        Drop the session's seq counter. While some of its rows are still unwritten the
+        counter is kept (the database does not know those seqs yet) and dropped once they are.
+        """
+        with self._lock:
+            if self._unwritten.get(session_id):
+                self._forgotten.add(session_id)
+            else:
+                self._next_seq.pop(session_id, None)
+
+    def _last_written_seq(self, session_id: int) -> int:
+        db = self.session_factory()
+        try:
+            return db.query(func.max(ConversationTurnModel.seq)).filter(
+                ConversationTurnModel.session_id == session_id
+            ).scalar() or 0
+        finally:
+            db.close()
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="turn-write-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+_buffer: Optional[TurnWriteBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_turn_buffer() -> TurnWriteBuffer:
+    """Return the process-wide buffer, created (and registered for exit flush) on first use."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = TurnWriteBuffer()
+                atexit.register(_buffer.close)
+    return _buffer
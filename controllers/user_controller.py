@@ -1,20 +1,31 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
-from typing import Dict, Optional, List
+from functools import cached_property
+from typing import Dict, Iterable, Iterator, Optional, List
 
 from fastapi import Depends, HTTPException, status
+from sqlalchemy import and_, insert, select
 from sqlalchemy.orm import Session
 
+from controllers.identity_cache import UserSnapshot, get_identity_cache
 from controllers.meta_prompt_controller import MetaPromptController
 from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
 from models.user import UserModel
+from settings import BULK_CHUNK_SIZE
+from utils.bulk_io import USER_FIELDS, chunked
 from utils.database import get_db
+from utils.query_profiler import profile_methods
 
 
+@profile_methods
 class UserController:
     def __init__(self, db: Session = Depends(get_db)):
         self.db = db
-        self.meta_prompt_controller = MetaPromptController(db)
+
+    @cached_property
+    def meta_prompt_controller(self) -> MetaPromptController:
+        # 只有 start_meta_prompt_flow 用到；LearningAgent 每个请求都会构造 UserController
+        return MetaPromptController(self.db)
 
     def create_user(
             self,
@@ -37,9 +48,40 @@ class UserController:
         self.db.refresh(db_user)
         return db_user
 
+    def bulk_create_users(self, records: Iterable[Dict], chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """Insert users from a stream of dicts, one executemany and one transaction per chunk."""
+        total = 0
+        for chunk in chunked(records, chunk_size):
+            now = datetime.utcnow()
+            rows = [{
+                "created_at": now,
+                "updated_at": now,
+                "last_login": now,
+                "learning_goals": {},
+                "meta_prompt_complete": False,
+                **record
+            } for record in chunk]
+            self.db.execute(insert(UserModel), rows)
+            self.db.commit()
+            total += len(rows)
+        return total
+
+    def iter_users(self, chunk_size: int = BULK_CHUNK_SIZE) -> Iterator[Dict]:
+        """Stream users as dicts of the exported columns, fetching chunk_size rows at a time."""
+        columns = [getattr(UserModel, name) for name in USER_FIELDS]
+        result = self.db.execute(
+            select(*columns).order_by(UserModel.id).execution_options(yield_per=chunk_size)
+        )
+        for row in result.mappings():
+            yield dict(row)
+
     def get_user(self, user_id: int) -> Optional[UserModel]:
         """Retrieve user by ID."""
-        return self.db.query(UserModel).filter(UserModel.id == user_id).first()
+        return self.db.get(UserModel, user_id)
+
+    def get_user_snapshot(self, user_id: int) -> Optional[UserSnapshot]:
+        """Retrieve a cached, read-only snapshot of the user."""
+        return get_identity_cache().get_user(self.db, user_id)
 
     def get_user_by_name(self, name: str) -> Optional[UserModel]:
         """Retrieve user by name."""
@@ -72,6 +114,7 @@ class UserController:
 
         self.db.commit()
         self.db.refresh(user)
+        get_identity_cache().invalidate_user(user_id)
         return user
 
     def update_learning_preferences(
@@ -102,6 +145,7 @@ class UserController:
 
         self.db.commit()
         self.db.refresh(user)
+        get_identity_cache().invalidate_user(user_id)
         return user
 
     def start_meta_prompt_flow(self, user_id: int) -> MetaPromptSession:
@@ -133,28 +177,30 @@ class UserController:
         user.set_personalized_prompt(prompt)
         self.db.commit()
         self.db.refresh(user)
+        get_identity_cache().invalidate_user(user_id)
         return user
 
     def get_user_progress(self, user_id: int) -> Dict:
         """Get user's onboarding and learning progress."""
-        user = self.get_user(user_id)
-        if not user:
+        # One round trip: the user together with the id of an unfinished meta prompt session
+        row = self.db.query(UserModel, MetaPromptSession.id).outerjoin(
+            MetaPromptSession,
+            and_(MetaPromptSession.user_id == UserModel.id,
+                 MetaPromptSession.status != MetaPromptStatus.COMPLETED)
+        ).filter(UserModel.id == user_id).first()
+        if not row:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
             )
 
-        active_session = self.db.query(MetaPromptSession).filter(
-            MetaPromptSession.user_id == user_id,
-            MetaPromptSession.status != MetaPromptStatus.COMPLETED
-        ).first()
-
+        user, active_session_id = row
         return {
             "onboarding_complete": user.meta_prompt_complete,
             "has_learning_style": bool(user.preferred_learning_style),
             "has_learning_goals": bool(user.learning_goals),
             "has_personalized_prompt": bool(user.personalized_prompt),
-            "active_session_id": active_session.id if active_session else None
+            "active_session_id": active_session_id
         }
 
     def reset_user_preferences(self, user_id: int) -> UserModel:
@@ -173,4 +219,5 @@ class UserController:
 
         self.db.commit()
         self.db.refresh(user)
+        get_identity_cache().invalidate_user(user_id)
         return user
@@ -3,7 +3,7 @@ import sys
 
 from loguru import logger
 
-from settings import LOG_LEVEL, LOGS_DIR
+from settings import LOG_LEVEL, LOGS_DIR, TELEMETRY_LOG_ENABLED, TELEMETRY_LOG_PATH
 
 # 日志格式
 LOG_FORMAT = (
@@ -17,3 +17,8 @@ logger.remove()  # 移除默认的 handler
 logger.add(sys.stderr, format=LOG_FORMAT, level=LOG_LEVEL)  # 添加到标准错误输出
 logger.add(f"{LOGS_DIR}/app_{{time}}.log", format=LOG_FORMAT,
            level=LOG_LEVEL, rotation="500 MB")  # 添加到文件
+
+if TELEMETRY_LOG_ENABLED:
+    # LLM 调用遥测记录 (utils/telemetry.py) 序列化为 JSON，每行一条，字段位于 record.extra
+    logger.add(TELEMETRY_LOG_PATH, serialize=True, level="DEBUG", rotation="500 MB",
+               filter=lambda record: record["extra"].get("event") in ("llm_call", "llm_cache_hit"))
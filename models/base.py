@@ -1,17 +1,11 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
 
-from sqlalchemy import create_engine, Column, Integer, DateTime
+from sqlalchemy import Column, Integer, DateTime
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
-from settings import DATABASE_URL
-
-# 创建数据库引擎
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-
-# 创建会话类
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 数据库引擎和会话类由 utils.engine 统一创建
+from utils.engine import engine, SessionLocal  # pylint: disable=unused-import
 
 # 创建声明基类
 Base = declarative_base()
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import relationship
+
+from .base import Base, BaseMixin
+
+
+class ConversationTurnModel(Base, BaseMixin):
+    """One message of a learning session transcript; rows are only ever appended."""
+    __tablename__ = "conversation_turns"
+    __table_args__ = (
+        Index("ix_conversation_turns_session_seq", "session_id", "seq", unique=True),
+    )
+
+    session_id = Column(Integer, ForeignKey("learning_sessions.id"), nullable=False)
+    seq = Column(Integer, nullable=False)
+    role = Column(String, nullable=False)  # "user" / "assistant"
+    content = Column(Text, nullable=False)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Float, nullable=True)
+
+    session = relationship("LearningSessionModel")
+
+    def to_message(self) -> dict:
+        """Convert the turn to a chat completion message"""
+        return {"role": self.role, "content": self.content}
@@ -7,8 +7,8 @@ from .base import Base, BaseMixin
 
 class LearningSessionModel(Base, BaseMixin):
     __tablename__ = "learning_sessions"
-    user_id = Column(Integer, ForeignKey("users.id"))
-    objective_id = Column(Integer, ForeignKey("objectives.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    objective_id = Column(Integer, ForeignKey("objectives.id"), index=True)
     # sub_objective_id = Column(Integer, ForeignKey("subobjectives.id"), nullable=True)
     start_time = Column(DateTime)
     end_time = Column(DateTime)
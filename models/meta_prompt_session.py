@@ -3,7 +3,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Dict, Optional
 
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Index, JSON, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 
 from .base import Base, BaseMixin
@@ -18,12 +18,17 @@ class MetaPromptStatus(str, Enum):
 
 class MetaPromptSession(Base, BaseMixin):
     __tablename__ = "meta_prompt_sessions"
+    __table_args__ = (
+        Index("ix_meta_prompt_sessions_user_status", "user_id", "status"),
+    )
 
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     status = Column(SQLEnum(MetaPromptStatus), default=MetaPromptStatus.STARTED, nullable=False)
     collected_preferences = Column(JSON, default={})
     generated_prompt = Column(String, nullable=True)
     completed_at = Column(DateTime, nullable=True)
+    # Onboarding batch the session was submitted in; such sessions are not submitted again
+    batch_id = Column(String, nullable=True)
 
     # Relationships
     user = relationship("UserModel", back_populates="meta_prompt_sessions")
@@ -37,6 +42,9 @@ class MetaPromptSession(Base, BaseMixin):
         self.status = new_status
         if new_status == MetaPromptStatus.COMPLETED:
             self.completed_at = datetime.utcnow()
+        else:
+            # The interactive flow (or a reset) takes the session over from a pending batch
+            self.batch_id = None
 
     def add_preference(self, key: str, value: any) -> None:
         """Add or update a user preference"""
@@ -44,6 +52,11 @@ class MetaPromptSession(Base, BaseMixin):
             self.collected_preferences = {}
         self.collected_preferences[key] = value
 
+    def add_preferences(self, preferences: Dict) -> None:
+        """Add or update several preferences at once"""
+        # Assign a new dict so the JSON column change is picked up on commit
+        self.collected_preferences = {**(self.collected_preferences or {}), **preferences}
+
     def set_generated_prompt(self, prompt: str) -> None:
         """Set the generated personalized prompt"""
         self.generated_prompt = prompt
@@ -65,6 +78,7 @@ class MetaPromptSession(Base, BaseMixin):
             'status': self.status.value,
             'collected_preferences': self.collected_preferences,
             'generated_prompt': self.generated_prompt,
+            'batch_id': self.batch_id,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
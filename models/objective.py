@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from sqlalchemy import Column, String, Integer, ForeignKey
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from .base import Base, BaseMixin
@@ -7,11 +7,16 @@ from .base import Base, BaseMixin
 
 class ObjectiveModel(Base, BaseMixin):
     __tablename__ = "objectives"
+    __table_args__ = (
+        # get_objectives_by_user filters on user_id and the dashboard orders by priority
+        Index("ix_objectives_user_priority", "user_id", "priority"),
+    )
 
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String, index=True)
     description = Column(String)
-    priority = Column(Integer)
+    # Part of the dashboard's keyset cursor (priority, id), where a NULL would end paging early
+    priority = Column(Integer, nullable=False, default=0, server_default="0")
     current_level = Column(String)
     target_level = Column(String)
     user = relationship("UserModel", back_populates="objectives")
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, Text
+from sqlalchemy.orm import relationship
+
+from .base import Base, BaseMixin
+
+
+class ReviewItemModel(Base, BaseMixin):
+    """One concept a user reviews on a spaced-repetition (SM-2) schedule."""
+    __tablename__ = "review_items"
+    __table_args__ = (
+        # ReviewController.due_items: WHERE user_id = ? AND due_at <= ? ORDER BY due_at LIMIT k
+        # is a range scan on this index, O(log n + k) however many items the user base holds
+        Index("ix_review_items_user_due", "user_id", "due_at"),
+    )
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    objective_id = Column(Integer, ForeignKey("objectives.id"), nullable=False, index=True)
+    prompt = Column(Text, nullable=False)
+    answer = Column(Text, nullable=True)
+    # SM-2 state
+    interval_days = Column(Float, nullable=False, default=0.0)
+    ease = Column(Float, nullable=False)
+    repetitions = Column(Integer, nullable=False, default=0)
+    lapses = Column(Integer, nullable=False, default=0)
+    due_at = Column(DateTime, nullable=False)
+    last_reviewed_at = Column(DateTime, nullable=True)
+
+    user = relationship("UserModel")
+    objective = relationship("ObjectiveModel")
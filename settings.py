@@ -6,8 +6,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(ROOT_DIR, "data")
-LOGS_DIR = os.path.join(ROOT_DIR, "logs")
+# 运行时数据 (SQLite 数据库、缓存、死信文件) 与日志的目录；测试把它们指到临时目录
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(ROOT_DIR, "data"))
+LOGS_DIR = os.getenv("LOGS_DIR", os.path.join(ROOT_DIR, "logs"))
 
 if not os.path.exists(LOGS_DIR):
     os.makedirs(LOGS_DIR)
@@ -15,12 +16,133 @@ if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
 # 数据库配置
-DATABASE_URL = "sqlite:///./data/learning_assistant.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/learning_assistant.db")
+
+# SQLite 连接参数，在每个新连接上通过 PRAGMA 设置
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")  # WAL 模式下读写互不阻塞
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")  # WAL 下 NORMAL 已足够安全
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-65536"))  # 负数表示 KiB，即 64 MiB
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # 毫秒
+DB_TEMP_STORE = os.getenv("DB_TEMP_STORE", "MEMORY")
+
+# 连接池配置
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # 秒
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "-1"))  # 秒，-1 表示不回收
+
+# 学习对话记忆：最近若干轮原文保留在 token 预算内，更早的轮次由后台折叠为摘要
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "2000"))
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "8"))
+MEMORY_SUMMARY_MAX_WORDS = int(os.getenv("MEMORY_SUMMARY_MAX_WORDS", "200"))
+MEMORY_MAX_SESSIONS = int(os.getenv("MEMORY_MAX_SESSIONS", "1000"))
+
+# 用户/学习目标快照及渲染后提示词的进程内缓存条目上限，0 表示关闭
+IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv("IDENTITY_CACHE_MAX_ENTRIES", "10000"))
+
+# Dashboard 目标列表每页行数
+OBJECTIVES_PAGE_SIZE = int(os.getenv("OBJECTIVES_PAGE_SIZE", "20"))
+
+# 间隔重复复习 (SM-2): 新条目的初始难度系数 (ease) 及其下限，"到期复习" 默认返回的条数
+REVIEW_INITIAL_EASE = float(os.getenv("REVIEW_INITIAL_EASE", "2.5"))
+REVIEW_MIN_EASE = float(os.getenv("REVIEW_MIN_EASE", "1.3"))
+REVIEW_DUE_LIMIT = int(os.getenv("REVIEW_DUE_LIMIT", "20"))
+
+# LLM 请求调度: 最大并发数，每分钟请求数/token 数上限 (0 表示不限制)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+# 估算 token 用量时为回复预留的 token 数
+LLM_COMPLETION_TOKEN_RESERVE = int(os.getenv("LLM_COMPLETION_TOKEN_RESERVE", "512"))
+
+# LLM 调用的截止时间与重试: 整体截止时间/单次超时 (秒)，最大尝试次数，指数退避的基础/最大延迟 (秒)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+LLM_ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# 对冲请求: 请求耗时超过近期 P95 (至少积累 LLM_HEDGE_MIN_SAMPLES 个样本) 后再发一个相同请求，取先返回者
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# 对冲请求使用的备用 base URL，不设置时发往同一个服务
+OPENAI_HEDGE_BASE_URL = os.getenv("OPENAI_HEDGE_BASE_URL")
+
+# 离线批量生成 (OpenAI Batch API): 后端 "openai" 或本地文件替身 "local"，本地后端目录，完成时限，轮询间隔 (秒)
+BATCH_BACKEND = os.getenv("BATCH_BACKEND", "openai")
+BATCH_LOCAL_DIR = os.getenv("BATCH_LOCAL_DIR", "data/batches")
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "60"))
+# 正在界面中填写的 (COLLECTING) onboarding 会话，闲置超过该小时数后才交给批量生成
+ONBOARDING_BATCH_IDLE_HOURS = float(os.getenv("ONBOARDING_BATCH_IDLE_HOURS", "24"))
+
+# 批量导入/导出时每个事务处理的行数
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+
+# 对话记录的批量写入：攒够条数或到达时间间隔 (秒) 时写入数据库
+TURN_BUFFER_MAX_BATCH = int(os.getenv("TURN_BUFFER_MAX_BATCH", "50"))
+TURN_BUFFER_FLUSH_INTERVAL = float(os.getenv("TURN_BUFFER_FLUSH_INTERVAL", "1.0"))
+# 写入失败 (数据库被锁等暂时性错误) 时的最大重试次数；超过后或遇到非暂时性错误时，写不进去的记录转存到死信文件
+TURN_BUFFER_MAX_RETRIES = int(os.getenv("TURN_BUFFER_MAX_RETRIES", "5"))
+TURN_BUFFER_DEAD_LETTER_PATH = os.getenv("TURN_BUFFER_DEAD_LETTER_PATH",
+                                         os.path.join(DATA_DIR, "turn_dead_letters.jsonl"))
 
 # OpenAI API 密钥
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
 MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
+# 流式请求时要求返回 usage (stream_options.include_usage)，不支持该参数的兼容服务可关闭
+OPENAI_STREAM_USAGE = os.getenv("OPENAI_STREAM_USAGE", "true").lower() == "true"
+# 所有 OpenAI 客户端共用的 HTTP 连接池: 最大连接数、空闲保活的连接数及其过期时间 (秒)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2: 并发请求复用同一连接 (需要 h2: pip install "httpx[http2]"，未安装时退回 HTTP/1.1)
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"
+
+# LLM 后端: "openai" 为真实服务；"fake" 使用进程内的确定性替身 (ai_agents/fake_llm.py)，用于基准测试
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+# fake 后端的首 token 延迟中位数 (毫秒)、生成速度 (token/秒，0 表示立即返回) 与错误注入概率
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+
+# 模型路由: 默认 profile 的多个 endpoint (逗号分隔，可用 "url|权重" 指定权重)，未设置时仅使用 OPENAI_BASE_URL
+OPENAI_BASE_URLS = os.getenv("OPENAI_BASE_URLS", "")
+# 短小的分类类任务 (偏好收集、风格调整、目标分析) 使用的小模型及其 endpoint 与采样参数。
+# 都未设置时这些任务与其他调用完全相同；设置了任意一项才启用 "fast" profile (max_tokens 默认 512，temperature 默认 0)
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "")
+FAST_MODEL_BASE_URLS = os.getenv("FAST_MODEL_BASE_URLS", "")
+FAST_MODEL_MAX_TOKENS = int(os.getenv("FAST_MODEL_MAX_TOKENS")) if os.getenv("FAST_MODEL_MAX_TOKENS") else None
+FAST_MODEL_TEMPERATURE = float(os.getenv("FAST_MODEL_TEMPERATURE")) if os.getenv("FAST_MODEL_TEMPERATURE") else None
+# 完整路由表的 JSON 文件路径，设置后覆盖上面的配置 (格式见 ai_agents/routing.py)
+LLM_ROUTING_FILE = os.getenv("LLM_ROUTING_FILE")
+# 每条路由每隔多少次请求输出一次延迟统计
+LLM_ROUTE_LOG_EVERY = int(os.getenv("LLM_ROUTE_LOG_EVERY", "100"))
+# 结构化输出模式: "json_schema" (严格 schema)、"json_object" (JSON 模式) 或 "none" (endpoint 不支持时)
+# 路由表中的 profile 可通过 "structured_output" 单独设置
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "json_object")
+# 容错解析仍失败时重新请求的次数
+LLM_STRUCTURED_OUTPUT_RETRIES = int(os.getenv("LLM_STRUCTURED_OUTPUT_RETRIES", "1"))
+
+# 并发收集用户偏好时单个 LLM 调用的超时时间 (秒)
+PREFERENCE_COLLECTION_TIMEOUT = float(os.getenv("PREFERENCE_COLLECTION_TIMEOUT", "30"))
+
+# LLM 响应缓存配置 (默认关闭，需显式开启)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(DATA_DIR, "llm_response_cache.db"))
+LLM_CACHE_MAX_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MAX_MEMORY_ENTRIES", "1024"))
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "100000"))
+META_PROMPT_CACHE_TTL = int(os.getenv("META_PROMPT_CACHE_TTL", str(7 * 24 * 3600)))  # 秒
+
+# 学习问答的语义近似缓存 (按学习目标和水平划分作用域，默认关闭)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+# 内存上限约为 MAX_SCOPES * MAX_ENTRIES * DIM * 4 字节，默认约 64 MB
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))  # 每个作用域
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv("SEMANTIC_CACHE_MAX_SCOPES", "32"))
 
 # 其他 API 密钥 (根据需要添加)
 # NEWS_API_KEY = os.getenv("NEWS_API_KEY")
@@ -29,6 +151,19 @@ MODEL_NAME = os.getenv("MODEL_NAME", "gpt-3.5-turbo")
 # 日志配置
 LOG_LEVEL = "DEBUG"  # 可以根据需要调整日志级别 (DEBUG, INFO, WARNING, ERROR, CRITICAL)
 
+# LLM 调用遥测: 每次调用输出一条结构化日志 (JSONL，写入 TELEMETRY_LOG_PATH)
+TELEMETRY_LOG_ENABLED = os.getenv("TELEMETRY_LOG_ENABLED", "false").lower() == "true"
+TELEMETRY_LOG_PATH = os.getenv("TELEMETRY_LOG_PATH", os.path.join(LOGS_DIR, "llm_calls.jsonl"))
+# SQL 查询分析 (utils/query_profiler.py): 按 UI 事件/控制器调用统计语句并提示 N+1 模式
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "false").lower() == "true"
+QUERY_PROFILER_SLOW_MS = float(os.getenv("QUERY_PROFILER_SLOW_MS", "50"))  # 慢查询阈值 (毫秒)
+QUERY_PROFILER_N_PLUS_ONE = int(os.getenv("QUERY_PROFILER_N_PLUS_ONE", "5"))  # 同一语句重复多少次视为 N+1
+QUERY_PROFILER_TOP = int(os.getenv("QUERY_PROFILER_TOP", "5"))  # 汇总中列出的最慢语句条数
+# Prometheus 文本格式的 /metrics 端点，开启后与 Gradio 服务一同启动 (端口被占用时仅记录警告)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", os.getenv("GRADIO_HOST", "127.0.0.1"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9465"))
+
 # Gradio 配置
 GRADIO_HOST = os.getenv("GRADIO_HOST", "127.0.0.1")  # 默认值为 "127.0.0.1"
 GRADIO_PORT = int(os.getenv("GRADIO_PORT", "7865"))  # 默认值为 7860，并转换为整数
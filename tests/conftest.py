@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+# settings 在导入时读取环境变量：测试使用临时目录下的 SQLite 数据库与日志、fake LLM，并关闭各类缓存
+_TEST_DIR = tempfile.mkdtemp(prefix="growledgepilot_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ["DATA_DIR"] = _TEST_DIR
+os.environ["LOGS_DIR"] = _TEST_DIR
+os.environ["TELEMETRY_LOG_PATH"] = os.path.join(_TEST_DIR, "llm_calls.jsonl")
+os.environ["LLM_BACKEND"] = "fake"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ["SEMANTIC_CACHE_ENABLED"] = "false"
+os.environ["METRICS_ENABLED"] = "false"
+
+import pytest  # noqa: E402
+
+from models.base import Base  # noqa: E402
+from utils.database import SessionLocal, engine, init_db  # noqa: E402
+
+init_db()
+
+
+@pytest.fixture
+def db():
+    """每个测试一个会话，结束后清空所有表。"""
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+
+
+@pytest.fixture
+def user_id(db):
+    from controllers.user_controller import UserController  # pylint: disable=import-outside-toplevel
+
+    return UserController(db).create_user(name="Test User", age=30, occupation="Engineer",
+                                          language_preference="English").id
+
+
+@pytest.fixture
+def objective_id(db, user_id):
+    from controllers.objective_controller import ObjectiveController  # pylint: disable=import-outside-toplevel
+
+    return ObjectiveController(db).create_objective(user_id=user_id, name="Spanish", description="travel",
+                                                    priority=1, current_level="Beginner",
+                                                    target_level="Intermediate").id
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import delete
+
+from controllers.user_controller import UserController
+from models.user import UserModel
+from utils.bulk_io import read_records, write_records
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_user_export_import_keeps_onboarding(db, user_id, tmp_path, fmt):
+    user = db.get(UserModel, user_id)
+    user.learning_goals = {"goals": [{"goal": "Order food, in Spanish", "timeframe": "3 months"}]}
+    user.set_personalized_prompt('Tutor with "short" examples,\nthen a quiz.')
+    db.commit()
+    controller = UserController(db)
+    exported = list(controller.iter_users())
+
+    path = str(tmp_path / f"users.{fmt}")
+    assert write_records(path, "users", exported) == 1
+    db.execute(delete(UserModel))
+    db.commit()
+    assert controller.bulk_create_users(read_records(path, "users")) == 1
+
+    assert list(controller.iter_users()) == exported
+    assert exported[0]["meta_prompt_complete"] is True
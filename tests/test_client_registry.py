@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+from openai import InternalServerError
+
+from ai_agents import client_registry
+from ai_agents.client_registry import ClientRegistry
+from ai_agents.fake_llm import FakeLLM, FakeLLMConfig, serve
+from ai_agents.resilience import RetryPolicy, aretry_call, retry_call
+from settings import LLM_MAX_ATTEMPTS
+
+MESSAGES = [{"role": "user", "content": "What is a verb?"}]
+POLICY = RetryPolicy(base_delay=0, max_delay=0)
+
+
+@pytest.fixture
+def failing_server(monkeypatch):
+    # The real OpenAI clients against the HTTP fake, which answers every request with a 503
+    pytest.importorskip("httpx")
+    monkeypatch.setattr(client_registry, "LLM_BACKEND", "openai")
+    server = serve(port=0, llm=FakeLLM(FakeLLMConfig(error_rate=1.0, error_status=503)))
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def test_only_the_retry_policy_retries(failing_server):
+    registry = ClientRegistry(http2=False)
+    client = registry.client(failing_server, "test")
+    with pytest.raises(InternalServerError):
+        retry_call(lambda timeout: client.chat.completions.create(model="fake", messages=MESSAGES, timeout=timeout),
+                   POLICY)
+    assert registry.stats.snapshot()["127.0.0.1"]["requests"] == LLM_MAX_ATTEMPTS
+
+
+def test_only_the_retry_policy_retries_async(failing_server):
+    registry = ClientRegistry(http2=False)
+
+    async def call():
+        client = registry.async_client(failing_server, "test")
+        return await aretry_call(
+            lambda timeout: client.chat.completions.create(model="fake", messages=MESSAGES, timeout=timeout), POLICY)
+
+    with pytest.raises(InternalServerError):
+        asyncio.run(call())
+    assert registry.stats.snapshot()["127.0.0.1"]["requests"] == LLM_MAX_ATTEMPTS
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from controllers.identity_cache import IdentityCache
+from controllers.user_controller import UserController
+from models.user import UserModel
+
+
+def test_update_between_load_and_store_is_not_lost(db, user_id):
+    cache = IdentityCache(max_entries=10)
+    controller = UserController(db)
+
+    def load_then_update():
+        name = db.get(UserModel, user_id).name
+        # Another request commits an update (and invalidates) before this load stores its snapshot
+        controller.update_user_profile(user_id, name="Renamed")
+        cache.invalidate_user(user_id)
+        return name
+
+    stale = cache._read_through(("user", user_id), load_then_update, lambda name: name)
+    assert stale == "Test User"
+    assert cache.get_user(db, user_id).name == "Renamed"
+    assert cache.misses == 2
+
+
+def test_hits_after_store_and_invalidation(db, user_id):
+    cache = IdentityCache(max_entries=10)
+    assert cache.get_user(db, user_id).name == "Test User"
+    assert cache.get_user(db, user_id).name == "Test User"
+    cache.invalidate_user(user_id)
+    cache.get_user(db, user_id)
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert not cache._loading and not cache._generations
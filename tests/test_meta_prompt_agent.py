@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+from ai_agents.meta_prompt_agent import MetaPromptAgent
+from ai_agents.resilience import DeadlineExceeded
+from models.user import UserModel
+
+
+def test_collect_all_preferences_from_sync_and_async_callers(db, user_id):
+    agent = MetaPromptAgent()
+    user = db.get(UserModel, user_id)
+    preferences, errors = agent.collect_all_preferences(user)
+    assert sorted(preferences) == sorted(agent.collection_prompts) and not errors
+
+    async def handler():
+        # A sync helper called from inside a running loop, where asyncio.run would fail
+        return agent.collect_all_preferences(user)
+
+    assert asyncio.run(handler()) == (preferences, errors)
+
+
+def test_deadline_is_reported_as_such(db, user_id, monkeypatch):
+    agent = MetaPromptAgent()
+
+    async def collect(user, preference_type):
+        if preference_type == "goals":
+            raise DeadlineExceeded("Deadline of 5s exceeded after 3 attempts")
+        if preference_type == "interests":
+            await asyncio.sleep(1)
+        return "ok"
+
+    monkeypatch.setattr(agent, "acollect_preferences", collect)
+    preferences, errors = agent.collect_all_preferences(db.get(UserModel, user_id), timeout=0.05)
+    assert preferences == {"learning_style": "ok"}
+    assert errors == {"goals": "Deadline of 5s exceeded after 3 attempts", "interests": "Timed out after 0.05s"}
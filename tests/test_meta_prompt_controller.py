@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from ai_agents.meta_prompt_agent import MetaPromptAgent
+from controllers.meta_prompt_controller import MetaPromptController, PromptCollectionStep
+from models.meta_prompt_session import MetaPromptStatus
+from utils.database import session_scope, update_prompt_session
+
+
+@pytest.fixture
+def session_id(db, user_id):
+    return MetaPromptController(db).create_session(user_id).id
+
+
+def test_async_steps_are_persisted(db, session_id):
+    controller = MetaPromptController(db)
+    for step in (PromptCollectionStep.LEARNING_STYLE, PromptCollectionStep.GOALS):
+        asyncio.run(controller.acollect_step(session_id, step))
+        db.expire_all()
+        assert step.value in controller.get_session(session_id).collected_preferences
+
+    assert controller.get_current_step(controller.get_session(session_id)) == PromptCollectionStep.INTERESTS
+
+
+def test_update_prompt_session_is_persisted(db, session_id):
+    assert update_prompt_session(session_id, {"learning_style": "visual"})
+    db.expire_all()
+    assert MetaPromptController(db).get_session(session_id).collected_preferences == {"learning_style": "visual"}
+
+
+def test_review_prompt_is_generated_without_an_open_db_session(session_id):
+    # The MetaPromptPage flow: load in one short session, call the LLM, store in another
+    with session_scope() as db:
+        controller = MetaPromptController(db)
+        controller.process_step(session_id, PromptCollectionStep.INIT)
+        session = controller.get_session(session_id, with_user=True)
+
+    prompt = asyncio.run(MetaPromptAgent().agenerate_personalized_prompt(session))
+    with session_scope() as db:
+        MetaPromptController(db).store_generated_prompt(session_id, prompt)
+
+    with session_scope() as db:
+        session = MetaPromptController(db).get_session(session_id, with_user=True)
+        assert session.status == MetaPromptStatus.COMPLETED
+        assert session.generated_prompt == session.user.personalized_prompt == prompt
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import create_engine
+
+from models.base import Base
+from utils import migrations
+from utils.migrations import (applied_versions, backfill_in_batches, column_exists, column_not_null, hot_queries,
+                              run_migrations, verify_query_plans)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE items (id INTEGER PRIMARY KEY, flag INTEGER, label VARCHAR NOT NULL)")
+        conn.exec_driver_sql("INSERT INTO items (label) VALUES " + ", ".join(["('x')"] * 10))
+    return engine
+
+
+def _null_flags(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("SELECT COUNT(*) FROM items WHERE flag IS NULL").scalar()
+
+
+def test_column_checks(engine):
+    with engine.connect() as conn:
+        assert column_exists(conn, "items", "flag") and not column_exists(conn, "items", "missing")
+        assert column_not_null(conn, "items", "label") and not column_not_null(conn, "items", "flag")
+
+
+def test_failed_migration_keeps_committed_batches_and_reruns(engine, monkeypatch):
+    def upgrade(conn):
+        backfill_in_batches(conn, "items", "flag = 1", "flag IS NULL", batch_size=4)
+        conn.exec_driver_sql("UPDATE items SET label = 'half done'")
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [migrations.Migration(1, "backfill items", upgrade)])
+    with pytest.raises(RuntimeError):
+        run_migrations(engine)
+    assert _null_flags(engine) == 0
+    assert applied_versions(engine) == []
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("SELECT COUNT(*) FROM items WHERE label = 'half done'").scalar() == 0
+
+    monkeypatch.setattr(migrations, "MIGRATIONS", [
+        migrations.Migration(1, "backfill items",
+                             lambda conn: backfill_in_batches(conn, "items", "flag = 1", "flag IS NULL"))])
+    assert run_migrations(engine) == [1]
+    assert run_migrations(engine) == []
+
+
+@pytest.fixture
+def app_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'app.db'}")
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    return engine
+
+
+def test_hot_queries_use_indexes(app_engine):
+    assert set(verify_query_plans(app_engine)) == set(hot_queries())
+
+
+def test_lost_index_fails_the_plan_check(app_engine):
+    with app_engine.begin() as conn:
+        conn.exec_driver_sql("DROP INDEX ix_objectives_user_priority")
+    with pytest.raises(AssertionError, match="ObjectiveController.* does not use an index"):
+        verify_query_plans(app_engine)
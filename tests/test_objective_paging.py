@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+from controllers.objective_controller import ObjectiveController, objectives_page_query
+from utils.migrations import _objective_priority_not_null
+
+
+def _all_pages(fetch, **kwargs):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page, cursor = fetch(after=cursor, **kwargs)
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return rows, pages
+
+
+@pytest.fixture
+def controller(db, user_id):
+    controller = ObjectiveController(db)
+    # Many duplicate priorities, so most page boundaries fall inside a run of equal keys
+    controller.bulk_create_objectives({"user_id": user_id, "name": f"o{i}", "description": "",
+                                       "priority": i % 3, "current_level": "A1", "target_level": "B1"}
+                                      for i in range(25))
+    controller.bulk_create_objectives([{"user_id": user_id, "name": "no priority", "description": "",
+                                        "current_level": "A1", "target_level": "B1"}])
+    return controller
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_cover_every_row_once(controller, user_id, descending):
+    rows, pages = _all_pages(controller.get_objectives_page, user_id=user_id, page_size=4, descending=descending)
+    keys = [(row[3], row[0]) for row in rows]
+    assert len(keys) == 26 and pages == 7
+    assert keys == sorted(keys, reverse=descending)
+
+
+def test_priority_is_never_null(controller, db, user_id):
+    assert controller.get_objectives_page(user_id=user_id, page_size=1)[0][0][3] == 0
+    with pytest.raises(IntegrityError):
+        db.execute(text("INSERT INTO objectives (user_id, name, priority) VALUES (:user_id, 'x', NULL)"),
+                   {"user_id": user_id})
+    db.rollback()
+
+
+def test_migration_repairs_legacy_null_priorities(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.connect() as conn:
+        conn.exec_driver_sql("CREATE TABLE objectives (id INTEGER PRIMARY KEY, user_id INTEGER, name VARCHAR, "
+                             "description VARCHAR, priority INTEGER, current_level VARCHAR, target_level VARCHAR)")
+        conn.exec_driver_sql("INSERT INTO objectives (user_id, name, priority) VALUES "
+                             "(1, 'a', 1), (1, 'b', NULL), (1, 'c', 2), (1, 'd', NULL), (1, 'e', 1)")
+        # Before the migration a NULL priority ends paging early
+        assert len(conn.execute(objectives_page_query(user_id=1, page_size=10, after=(1, 1))).all()) == 2
+
+        _objective_priority_not_null(conn)
+
+        assert len(conn.execute(objectives_page_query(user_id=1, page_size=10, after=(0, 2))).all()) == 4
+        with pytest.raises(IntegrityError):
+            conn.exec_driver_sql("UPDATE objectives SET priority = NULL WHERE id = 1")
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from ai_agents.batch import LocalBatchBackend, echo_responder
+from controllers.onboarding_batch_controller import OnboardingBatchController
+from controllers.user_controller import UserController
+from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
+
+
+@pytest.fixture
+def users(db):
+    controller = UserController(db)
+    return [controller.create_user(name=f"u{i}", age=30, occupation="Engineer", language_preference="English").id
+            for i in range(4)]
+
+
+def _controller(db, tmp_path, responder=echo_responder):
+    return OnboardingBatchController(db, backend=LocalBatchBackend(str(tmp_path / "batches"), responder))
+
+
+def _session(db, user_id):
+    db.expire_all()
+    return db.query(MetaPromptSession).filter(MetaPromptSession.user_id == user_id).one()
+
+
+def test_submitted_sessions_are_not_submitted_again(db, users, tmp_path):
+    controller = _controller(db, tmp_path)
+    controller.create_missing_sessions()
+
+    first = controller.run(str(tmp_path), wait=False)
+    assert first["sessions"] == 4
+    assert {_session(db, user_id).batch_id for user_id in users} == {first["batch_id"]}
+    assert controller.run(str(tmp_path), wait=False) == {"sessions": 0, "batch_id": None}
+
+    summary = controller.ingest(first["batch_id"])
+    assert summary["prompts"] == 4 and summary["released"] == 0
+    assert all(_session(db, user_id).status == MetaPromptStatus.COMPLETED for user_id in users)
+
+
+def test_sessions_in_use_are_left_to_the_ui(db, users, tmp_path):
+    controller = _controller(db, tmp_path)
+    controller.create_missing_sessions()
+    active, idle, taken_over = (_session(db, user_id) for user_id in users[:3])
+    for session in (active, idle):
+        session.update_status(MetaPromptStatus.COLLECTING)
+    db.commit()
+    db.execute(update(MetaPromptSession).where(MetaPromptSession.id == idle.id)
+               .values(updated_at=datetime.utcnow() - timedelta(days=2)))
+    db.commit()
+
+    assert {session.id for session in controller.iter_pending_sessions()} == \
+        {idle.id, taken_over.id, _session(db, users[3]).id}
+
+    result = controller.run(str(tmp_path), wait=False)
+    # The user continues onboarding in the UI after the batch was submitted
+    session = _session(db, users[2])
+    session.update_status(MetaPromptStatus.COLLECTING)
+    db.commit()
+
+    controller.ingest(result["batch_id"])
+    assert _session(db, users[0]).generated_prompt is None
+    assert _session(db, users[1]).status == MetaPromptStatus.COMPLETED
+    assert _session(db, users[2]).status == MetaPromptStatus.COLLECTING
+    assert _session(db, users[2]).generated_prompt is None
+
+
+def test_failed_sessions_are_released_for_the_next_run(db, users, tmp_path):
+    def fail_for_u0(body):
+        if any("u0" in (message["content"] or "") for message in body["messages"]):
+            raise RuntimeError("upstream error")
+        return echo_responder(body)
+
+    controller = _controller(db, tmp_path, fail_for_u0)
+    controller.create_missing_sessions()
+    result = controller.run(str(tmp_path))
+
+    assert result["prompts"] == 3 and result["released"] == 1
+    assert _session(db, users[0]).batch_id is None
+    assert [session.user_id for session in controller.iter_pending_sessions()] == [users[0]]
+
+
+def test_sessions_resumed_before_upload_are_not_submitted(db, users, tmp_path):
+    controller = _controller(db, tmp_path)
+    controller.create_missing_sessions()
+    path = str(tmp_path / "requests.jsonl")
+    assert controller.write_requests(path) == 4
+
+    # The user resumes onboarding in the UI while the request file is being uploaded
+    resumed = _session(db, users[0])
+    resumed.update_status(MetaPromptStatus.COLLECTING)
+    db.commit()
+
+    batch_id = controller.submit(path)
+    assert controller._session_ids(path) == sorted(_session(db, user_id).id for user_id in users[1:])
+    assert _session(db, users[0]).batch_id is None
+    assert {_session(db, user_id).batch_id for user_id in users[1:]} == {batch_id}
+
+    controller.ingest(batch_id)
+    assert _session(db, users[0]).status == MetaPromptStatus.COLLECTING
+
+
+def test_failed_upload_releases_the_claimed_sessions(db, users, tmp_path):
+    controller = _controller(db, tmp_path)
+    controller.create_missing_sessions()
+    path = str(tmp_path / "requests.jsonl")
+    controller.write_requests(path)
+
+    def upload_error(_path):
+        raise RuntimeError("upload failed")
+
+    controller.backend.submit = upload_error
+    with pytest.raises(RuntimeError):
+        controller.submit(path)
+    assert all(_session(db, user_id).batch_id is None for user_id in users)
+    assert len(list(controller.iter_pending_sessions())) == 4
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from ai_agents import routing
+from ai_agents.routing import DEFAULT_PROFILE, FAST_ROUTES, Router
+
+UNCONFIGURED = {"FAST_MODEL_NAME": "", "FAST_MODEL_BASE_URLS": "", "FAST_MODEL_MAX_TOKENS": None,
+                "FAST_MODEL_TEMPERATURE": None}
+
+
+def _router(monkeypatch, **settings):
+    for name, value in {**UNCONFIGURED, **settings}.items():
+        monkeypatch.setattr(routing, name, value)
+    return Router.from_dict(routing.default_routing_table())
+
+
+def test_unconfigured_fast_routes_use_the_default_profile(monkeypatch):
+    router = _router(monkeypatch)
+    for route in FAST_ROUTES:
+        profile = router.profile_for(route)
+        assert profile.name == DEFAULT_PROFILE
+        assert profile.params() == router.profile_for("LearningAgent.generate_learning_response").params()
+
+
+def test_fast_model_gets_fast_sampling(monkeypatch):
+    profile = _router(monkeypatch, FAST_MODEL_NAME="small-model").profile_for(FAST_ROUTES[0])
+    assert (profile.name, profile.model, profile.max_tokens, profile.temperature) == ("fast", "small-model", 512, 0)
+
+
+def test_overrides_alone_apply_to_the_strong_model(monkeypatch):
+    profile = _router(monkeypatch, FAST_MODEL_MAX_TOKENS=128, FAST_MODEL_TEMPERATURE=0.3).profile_for(FAST_ROUTES[0])
+    assert (profile.model, profile.max_tokens, profile.temperature) == (routing.MODEL_NAME, 128, 0.3)
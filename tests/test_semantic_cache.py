@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+from ai_agents import prompt_templates
+from ai_agents.learning_agent import LearningAgent
+from ai_agents.semantic_cache import SemanticCache, _ScopeIndex
+from controllers.identity_cache import ObjectiveSnapshot, UserSnapshot
+from controllers.user_controller import UserController
+
+QUESTION = "How do I conjugate ser in the present tense?"
+
+
+def _user(user_id=1, name="Ana", age=30, occupation="Engineer"):
+    return UserSnapshot(id=user_id, name=name, age=age, occupation=occupation, language_preference=None,
+                        preferred_learning_style=None, personalized_prompt=None, meta_prompt_complete=False,
+                        updated_at=None)
+
+
+OBJECTIVE = ObjectiveSnapshot(id=1, user_id=1, name="Spanish", description="travel", priority=1,
+                              current_level="Beginner", target_level="Intermediate", updated_at=None)
+
+
+def test_hit_on_paraphrase_and_miss_in_other_scope():
+    cache = SemanticCache(threshold=0.8)
+    cache.store("a", QUESTION, "answer")
+    assert cache.lookup("a", QUESTION.lower() + " ") == "answer"
+    assert cache.lookup("b", QUESTION) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_rejects_empty_capacity():
+    with pytest.raises(ValueError):
+        _ScopeIndex(dim=8, max_entries=0)
+    with pytest.raises(ValueError):
+        SemanticCache(max_entries_per_scope=0)
+
+
+def test_ring_buffer_overwrites_oldest():
+    cache = SemanticCache(max_entries_per_scope=2)
+    for number in range(3):
+        cache.store("a", f"question number {number} about verbs", f"answer {number}")
+    assert cache.lookup("a", "question number 0 about verbs") != "answer 0"
+    assert cache.lookup("a", "question number 2 about verbs") == "answer 2"
+
+
+def test_answer_overwritten_during_search_is_not_returned(monkeypatch):
+    cache = SemanticCache(max_entries_per_scope=1)
+    cache.store("a", QUESTION, "old answer")
+
+    from ai_agents import semantic_cache  # pylint: disable=import-outside-toplevel
+    search = semantic_cache._search
+
+    def search_while_storing(vectors, queries):
+        # Another thread replaces the only slot while the similarity is computed outside the lock
+        cache.store("a", "a completely different question", "new answer")
+        return search(vectors, queries)
+
+    monkeypatch.setattr(semantic_cache, "_search", search_while_storing)
+    assert cache.lookup("a", QUESTION) is None
+
+
+def test_scope_covers_every_prompt_field():
+    scope = LearningAgent._semantic_scope(_user(), OBJECTIVE)
+    assert scope == LearningAgent._semantic_scope(_user(user_id=2), OBJECTIVE)
+    assert scope == LearningAgent._semantic_scope(_user(), OBJECTIVE, prompt_templates.GENERAL_LEARNING_PROMPT)
+    assert scope != LearningAgent._semantic_scope(_user(name="Bo"), OBJECTIVE)
+    assert scope != LearningAgent._semantic_scope(_user(age=12), OBJECTIVE)
+    assert scope != LearningAgent._semantic_scope(_user(occupation="Nurse"), OBJECTIVE)
+    assert scope != LearningAgent._semantic_scope(_user(), OBJECTIVE, "Tutor {user_name} in {objective_name}")
+
+
+def test_reply_is_not_shared_with_a_different_learner(db, user_id, objective_id):
+    cache = SemanticCache()
+    agent = LearningAgent(user_id, objective_id, db, semantic_cache=cache)
+    first = agent.generate_learning_response(QUESTION)
+
+    UserController(db).update_user_profile(user_id, name="Someone Else")
+    agent.generate_learning_response(QUESTION)
+    assert cache.stats() == {"hits": 0, "misses": 2, "scopes": 2, "entries": 2}
+
+    UserController(db).update_user_profile(user_id, name="Test User")
+    assert asyncio.run(agent.agenerate_learning_response(QUESTION)) == first
+    assert cache.stats()["hits"] == 1
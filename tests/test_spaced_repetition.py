@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from controllers.review_controller import ReviewController
+from utils.query_profiler import assert_query_budget
+from utils.spaced_repetition import MAX_GRADE, MIN_GRADE, ReviewState, sm2_batch, sm2_step
+
+NOW = datetime(2030, 1, 1)
+
+
+def _random_states(count, seed=7):
+    rng = random.Random(seed)
+    return [ReviewState(float(rng.choice([0, 1, 6, rng.randint(2, 400)])), rng.uniform(1.3, 3.0),
+                        rng.randint(0, 8), rng.randint(0, 5)) for _ in range(count)], \
+        [rng.randint(MIN_GRADE, MAX_GRADE) for _ in range(count)]
+
+
+def test_batch_matches_step():
+    states, grades = _random_states(2000)
+    expected = [sm2_step(state, grade) for state, grade in zip(states, grades)]
+    interval_days, ease, repetitions, lapses = sm2_batch(
+        *(np.array(column) for column in zip(*((s.interval_days, s.ease, s.repetitions, s.lapses) for s in states))),
+        np.array(grades))
+
+    assert interval_days.tolist() == [state.interval_days for state in expected]
+    assert ease.tolist() == pytest.approx([state.ease for state in expected])
+    assert repetitions.tolist() == [state.repetitions for state in expected]
+    assert lapses.tolist() == [state.lapses for state in expected]
+
+
+@pytest.fixture
+def controller(db, user_id, objective_id):
+    controller = ReviewController(db)
+    controller.bulk_create_items({"user_id": user_id, "objective_id": objective_id, "prompt": f"card {i}",
+                                  "due_at": NOW - timedelta(days=i)} for i in range(6))
+    return controller
+
+
+def test_single_and_batch_reviews_agree(controller, user_id):
+    ids = sorted(item["id"] for item in controller.due_items(user_id, now=NOW))
+    single, batch = ids[:3], ids[3:]
+    for round_grades in ([5, 3, 1], [4, 2, 5], [3, 5, 4], [5, 5, 0]):
+        for item_id, grade in zip(single, round_grades):
+            controller.record_review(item_id, grade, now=NOW)
+        assert controller.record_reviews(dict(zip(batch, round_grades)), now=NOW) == 3
+
+    def state(item_id):
+        item = controller.get_item(item_id)
+        return item.interval_days, item.ease, item.repetitions, item.lapses, item.due_at, item.last_reviewed_at
+
+    assert [state(item_id) for item_id in single] == [state(item_id) for item_id in batch]
+
+
+@pytest.mark.parametrize("grade", [6, -1, 3.5, "4", True, None])
+def test_invalid_grades_are_rejected(controller, user_id, grade):
+    item_id = controller.due_items(user_id, now=NOW)[0]["id"]
+    for record in (lambda: controller.record_review(item_id, grade, now=NOW),
+                   lambda: controller.record_reviews({item_id: grade}, now=NOW)):
+        with pytest.raises(HTTPException) as error:
+            record()
+        assert error.value.status_code == 400
+    assert controller.get_item(item_id).repetitions == 0
+
+
+def test_due_items_is_one_query_most_overdue_first(controller, user_id):
+    with assert_query_budget(1):
+        items = controller.due_items(user_id, limit=4, now=NOW)
+    assert [item["due_at"] for item in items] == [NOW - timedelta(days=i) for i in (5, 4, 3, 2)]
+    assert controller.due_items(user_id, now=NOW - timedelta(days=10)) == []
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from ai_agents.fake_llm import FakeOpenAI, FakeLLM
+from ai_agents.structured_output import (LEARNING_PATH_SCHEMA, USER_PREFERENCES_SCHEMA, IncrementalJSONParser,
+                                         StructuredOutputError, iter_fields, parse_json_response,
+                                         schema_from_instructions, schema_instructions, validate)
+
+DOCUMENT = {
+    "summary": 'Braces {like} these, "quotes", commas, and \\ backslashes',
+    "stages": [{"name": "basics", "weeks": 2}, {"name": "[nested]", "weeks": 3}],
+    "level": 4,
+    "ready": False,
+    "notes": "überall ✓",
+}
+TEXT = "Here is the plan:\n```json\n" + json.dumps(DOCUMENT, ensure_ascii=False, indent=2) + "\n```\nGood luck!"
+
+
+def test_every_split_point_gives_the_same_fields():
+    for split in range(len(TEXT) + 1):
+        parser = IncrementalJSONParser()
+        completed = parser.feed(TEXT[:split]) + parser.feed(TEXT[split:])
+        assert completed == list(DOCUMENT.items()), split
+        assert parser.result() == DOCUMENT
+
+
+def test_fields_are_returned_as_soon_as_complete():
+    parser = IncrementalJSONParser()
+    head = TEXT[:TEXT.index('"stages"')]
+    assert parser.feed(head) == [("summary", DOCUMENT["summary"])]
+    assert not parser.done
+    assert [key for key, _ in parser.feed(TEXT[len(head):])] == ["stages", "level", "ready", "notes"]
+
+
+def test_iter_fields_streams_single_characters():
+    assert dict(iter_fields(iter(TEXT))) == DOCUMENT
+
+
+def test_parse_reports_whether_recovery_was_needed():
+    assert parse_json_response(json.dumps(DOCUMENT)) == (DOCUMENT, True)
+    assert parse_json_response(TEXT) == (DOCUMENT, False)
+
+
+@pytest.mark.parametrize("text", ["no json here", '{"summary": "cut off', '{"a": 1, "b": nope}'])
+def test_incomplete_or_invalid_objects_raise(text):
+    with pytest.raises(StructuredOutputError):
+        parse_json_response(text)
+
+
+def test_schema_round_trips_through_instructions():
+    text = "Analyze the user. " + schema_instructions(LEARNING_PATH_SCHEMA)
+    assert schema_from_instructions(text) == LEARNING_PATH_SCHEMA
+    assert schema_from_instructions("Analyze the user.") is None
+
+
+@pytest.mark.parametrize("response_format", [
+    {"type": "json_object"},
+    {"type": "json_schema", "json_schema": {"name": "prefs", "schema": USER_PREFERENCES_SCHEMA, "strict": True}},
+])
+def test_fake_llm_answers_json_modes_with_a_schema_instance(response_format):
+    messages = [{"role": "system", "content": "Analyze the user. " + schema_instructions(USER_PREFERENCES_SCHEMA)},
+                {"role": "user", "content": "I am a nurse who likes videos."}]
+    response = FakeOpenAI(FakeLLM()).chat.completions.create("fake", messages, response_format=response_format)
+    value, strict = parse_json_response(response.choices[0].message.content)
+    assert strict
+    validate(value, USER_PREFERENCES_SCHEMA)
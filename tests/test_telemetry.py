@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import socket
+from types import SimpleNamespace
+
+from ai_agents.learning_agent import LearningAgent
+from utils.telemetry import LLMCall, Telemetry, get_telemetry, start_metrics_server
+
+
+def _usage(prompt_tokens, cached_tokens):
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=5,
+                           prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens))
+
+
+def test_prefix_cache_latency_split():
+    telemetry = Telemetry()
+    for cached, latency in ((0, 1.0), (80, 0.25), (80, 0.75)):
+        telemetry.record_call(LLMCall(agent="A", method="m", model="x"), _usage(100, cached), "ok", latency)
+
+    row = telemetry.snapshot()["A.m"]
+    assert row["prefix_cache_hit_calls"] == 2 and row["prefix_cache_miss_calls"] == 1
+    assert row["avg_prefix_cache_hit_latency_ms"] == 500.0
+    assert row["prefix_cache_token_rate"] == 160 / 300
+    assert 'llm_prefix_cache_request_duration_seconds_count{agent="A",method="m",prefix_cache="hit"} 2' \
+        in telemetry.render_prometheus()
+
+
+def test_metrics_include_scheduler_and_router(db, user_id, objective_id):
+    LearningAgent(user_id, objective_id, db).generate_learning_response("What is a verb?")
+
+    text = get_telemetry().render_prometheus()
+    for metric in ("llm_scheduler_in_flight 0", 'llm_scheduler_queue_depth{priority="INTERACTIVE"} 0',
+                   'llm_scheduler_granted_total{priority="INTERACTIVE"}',
+                   'llm_route_requests_total{route="LearningAgent.generate_learning_response"',
+                   "llm_route_endpoint_requests_total", "# TYPE app_cache_hits_total counter"):
+        assert metric in text
+
+
+def test_metrics_server_survives_busy_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        assert start_metrics_server("127.0.0.1", sock.getsockname()[1]) is None
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+
+from controllers import learning_controller
+from controllers.turn_buffer import TurnWriteBuffer
+from models.conversation_turn import ConversationTurnModel
+from utils.database import SessionLocal
+
+
+class FlakySession:
+    """A real session whose first ``failures`` executes raise OperationalError ("database is locked")."""
+
+    def __init__(self, counter):
+        self._session = SessionLocal()
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        if self._counter["failures"] > 0:
+            self._counter["failures"] -= 1
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return self._session.execute(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+
+@pytest.fixture
+def session_ids(db, user_id, objective_id):
+    return [learning_controller.create_learning_session(db, user_id, objective_id, content=f"s{i}").id
+            for i in range(2)]
+
+
+def _seqs(db, session_id):
+    return [turn.seq for turn in db.query(ConversationTurnModel).filter(
+        ConversationTurnModel.session_id == session_id).order_by(ConversationTurnModel.seq)]
+
+
+def test_integrity_error_dead_letters_only_the_bad_row(db, session_ids, tmp_path):
+    dead_letters = tmp_path / "dead.jsonl"
+    buffer = TurnWriteBuffer(max_batch=1000, dead_letter_path=str(dead_letters))
+    first, second = session_ids
+    assert buffer.append(first, "user", "hello") == 1
+    buffer.append(second, "user", "hi")
+    # Another writer took seq 1 of the first session: the batch insert hits the unique index
+    db.execute(insert(ConversationTurnModel), [{"session_id": first, "seq": 1, "role": "user", "content": "x"}])
+    db.commit()
+
+    assert buffer.flush() == 1
+    assert buffer.dead_letters == 1
+    assert [json.loads(line)["content"] for line in dead_letters.read_text().splitlines()] == ["hello"]
+    assert _seqs(db, second) == [1]
+
+    # The buffer is not blocked afterwards
+    buffer.append(second, "assistant", "reply")
+    assert buffer.flush() == 1
+    db.expire_all()
+    assert _seqs(db, second) == [1, 2]
+
+
+def test_transient_errors_are_retried_then_dead_lettered(db, session_ids, tmp_path):
+    counter = {"failures": 2}
+    buffer = TurnWriteBuffer(session_factory=lambda: FlakySession(counter), max_batch=1000, max_retries=3,
+                             dead_letter_path=str(tmp_path / "dead.jsonl"))
+    buffer.append(session_ids[0], "user", "hello")
+    assert buffer.flush() == 0
+    assert buffer.flush() == 0
+    assert buffer.flush() == 1
+    assert _seqs(db, session_ids[0]) == [1]
+
+    counter["failures"] = 100
+    buffer.append(session_ids[0], "user", "again")
+    for _ in range(4):
+        assert buffer.flush() == 0
+    assert buffer.dead_letters == 1
+    assert buffer.flush() == 0  # nothing left to retry
+
+
+def test_forget_session_keeps_seq_while_rows_are_pending(db, session_ids, tmp_path):
+    counter = {"failures": 1}
+    buffer = TurnWriteBuffer(session_factory=lambda: FlakySession(counter), max_batch=1000,
+                             dead_letter_path=str(tmp_path / "dead.jsonl"))
+    session_id = session_ids[0]
+    assert buffer.append(session_id, "user", "one") == 1
+    assert buffer.flush() == 0  # still pending
+    buffer.forget_session(session_id)
+    # The database has no turn yet; the in-memory counter must still be used
+    assert buffer.append(session_id, "user", "two") == 2
+    assert buffer.flush() == 2
+    assert buffer.dead_letters == 0
+
+    # Once everything is written the counter can go, and the database max(seq) takes over
+    buffer.forget_session(session_id)
+    assert buffer.append(session_id, "user", "three") == 3
+    assert buffer.flush() == 1
+    assert _seqs(db, session_id) == [1, 2, 3]
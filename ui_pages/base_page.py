@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
-from settings import GRADIO_HOST, GRADIO_PORT
+from settings import GRADIO_HOST, GRADIO_PORT, METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+from utils.telemetry import start_metrics_server
 
 
 class BasePage:
@@ -18,4 +19,6 @@ class BasePage:
 
     def launch(self):
         if self.interface:  # 避免重复 launch
+            if METRICS_ENABLED:
+                start_metrics_server(METRICS_HOST, METRICS_PORT)
             self.interface.launch(server_name=GRADIO_HOST, server_port=GRADIO_PORT)
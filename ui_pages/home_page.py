@@ -1,25 +1,24 @@
 import gradio as gr
-from sqlalchemy.orm import Session
 
 from controllers.meta_prompt_controller import MetaPromptController
 from controllers.objective_controller import ObjectiveController
 from controllers.user_controller import UserController
 from ui_pages.base_page import BasePage
+from ui_pages.session_state import UserSessionState
+from utils.database import session_scope
+from utils.query_profiler import profiled
 from .learning_page import LearningPage  # type: ignore
 
 
 class HomePage(BasePage):
-    def __init__(self, db: Session, learning_page: LearningPage):
+    def __init__(self, learning_page: LearningPage):
         super().__init__()
-        self.db = db
         self.learning_page = learning_page
-        self.user_id = None
-        self.objective_id = None
-        self.user_controller = UserController(db)
-        self.objective_controller = ObjectiveController(db)
-        self.meta_prompt_controller = MetaPromptController(db)
 
         with gr.Blocks() as self.interface:
+            # 每个浏览器会话独立的用户状态
+            self.state = gr.State(UserSessionState())
+
             self.tab_home = gr.TabItem("Home", id="home")
             self.tab_register = gr.TabItem("Register", id="register", visible=True)
             self.tab_learning = gr.TabItem("Learning", id="learning", visible=False)
@@ -34,7 +33,7 @@ class HomePage(BasePage):
                 self.create_registration_tab()
 
             with self.tab_learning:
-                self.learning_page.render_content()  # 将 LearningPage 的内容渲染到这里
+                self.learning_page.render_content(self.state)  # 将 LearningPage 的内容渲染到这里
 
     def create_dashboard_tab(self):
         with gr.Row():
@@ -46,12 +45,25 @@ class HomePage(BasePage):
             self.add_objective_button = gr.Button("Add Objective")
             self.objective_message = gr.Markdown()
 
+        with gr.Row():
+            self.objectives_name_filter = gr.Textbox(label="Filter by Name")
+            self.objectives_sort = gr.Dropdown(
+                label="Sort by Priority",
+                choices=["Ascending", "Descending"],
+                value="Ascending"
+            )
+
         with gr.Row():
             self.objectives_list = gr.Dataframe(
                 headers=["id", "name", "description", "priority", "current_level", "target_level"],
                 label="Your Objectives")
             self.refresh_objectives_button = gr.Button("Refresh Objectives")
 
+        with gr.Row():
+            self.prev_objectives_button = gr.Button("Previous Page")
+            self.objectives_page_info = gr.Markdown()
+            self.next_objectives_button = gr.Button("Next Page")
+
         with gr.Row():
             self.start_learning_button = gr.Button("Start Learning")
             self.objective_selected = gr.Textbox(label="Objective Selected")
@@ -59,47 +71,76 @@ class HomePage(BasePage):
         self.add_objective_button.click(
             self.add_objective,
             inputs=[self.objective_name, self.objective_description, self.objective_priority,
-                    self.objective_current_level, self.objective_target_level],
+                    self.objective_current_level, self.objective_target_level, self.state],
             outputs=[self.objective_message]
         )
 
-        self.refresh_objectives_button.click(
-            self.refresh_objectives,
-            inputs=[],
-            outputs=[self.objectives_list]
-        )
+        # 过滤、排序与分页都在 SQL 中完成，每次只加载一页
+        page_inputs = [self.objectives_name_filter, self.objectives_sort, self.state]
+        page_outputs = [self.objectives_list, self.objectives_page_info, self.state]
+        self.refresh_objectives_button.click(self.refresh_objectives, inputs=page_inputs, outputs=page_outputs)
+        self.objectives_name_filter.submit(self.refresh_objectives, inputs=page_inputs, outputs=page_outputs)
+        self.objectives_sort.change(self.refresh_objectives, inputs=page_inputs, outputs=page_outputs)
+        self.next_objectives_button.click(self.next_objectives_page, inputs=page_inputs, outputs=page_outputs)
+        self.prev_objectives_button.click(self.prev_objectives_page, inputs=page_inputs, outputs=page_outputs)
         self.start_learning_button.click(
             self.start_learning,
-            inputs=[self.objective_selected],
-            outputs=[self.tab_home, self.tab_learning]  # 改为更新两个 TabItem 的 visible 属性
+            inputs=[self.objective_selected, self.state],
+            outputs=[self.tab_home, self.tab_learning, self.state]  # 改为更新两个 TabItem 的 visible 属性
         )
 
-    def add_objective(self, name, description, priority, current_level, target_level):
+    @profiled
+    def add_objective(self, name, description, priority, current_level, target_level,
+                      state: UserSessionState):
         try:
             priority = int(priority)
         except ValueError:
             return "Priority must be an integer."
 
-        objective = self.objective_controller.create_objective(
-            user_id=self.user_id,
-            name=name,
-            description=description,
-            priority=priority,
-            current_level=current_level,
-            target_level=target_level
-        )
-        return f"Objective '{objective.name}' added successfully."
-
-    def refresh_objectives(self):
-        objectives = self.objective_controller.get_objectives_by_user(self.user_id)
-        if objectives:
-            data = []
-            for obj in objectives:
-                data.append([obj.id, obj.name, obj.description, obj.priority,
-                             obj.current_level, obj.target_level])
-            return data
-        else:
-            return []
+        with session_scope() as db:
+            objective = ObjectiveController(db).create_objective(
+                user_id=state.user_id,
+                name=name,
+                description=description,
+                priority=priority,
+                current_level=current_level,
+                target_level=target_level
+            )
+            return f"Objective '{objective.name}' added successfully."
+
+    @profiled
+    def refresh_objectives(self, name_filter, sort, state: UserSessionState):
+        state.objectives_cursors = [None]
+        return self._load_objectives_page(name_filter, sort, state)
+
+    @profiled
+    def next_objectives_page(self, name_filter, sort, state: UserSessionState):
+        if state.objectives_next_cursor is not None:
+            state.objectives_cursors.append(state.objectives_next_cursor)
+        return self._load_objectives_page(name_filter, sort, state)
+
+    @profiled
+    def prev_objectives_page(self, name_filter, sort, state: UserSessionState):
+        if len(state.objectives_cursors) > 1:
+            state.objectives_cursors.pop()
+        return self._load_objectives_page(name_filter, sort, state)
+
+    @staticmethod
+    def _load_objectives_page(name_filter, sort, state: UserSessionState):
+        if not state.user_id:
+            # user_id=None 会分页查询所有用户的目标，仅供管理视图使用
+            return [], "", state
+        with session_scope() as db:
+            rows, state.objectives_next_cursor = ObjectiveController(db).get_objectives_page(
+                user_id=state.user_id,
+                after=state.objectives_cursors[-1],
+                name_contains=name_filter or None,
+                descending=sort == "Descending"
+            )
+        page_info = f"Page {len(state.objectives_cursors)}"
+        if state.objectives_next_cursor is None:
+            page_info += " (last)"
+        return [list(row) for row in rows], page_info, state
 
     def create_registration_tab(self):
         with gr.Column():
@@ -141,31 +182,37 @@ class HomePage(BasePage):
 
         self.reg_submit.click(
             self.handle_registration,
-            inputs=[self.reg_name, self.reg_age, self.reg_occupation, self.reg_language],
+            inputs=[self.reg_name, self.reg_age, self.reg_occupation, self.reg_language, self.state],
             outputs=[self.reg_message, self.learning_style, self.learning_goals,
-                     self.prompt_preview, self.progress_bar]
+                     self.prompt_preview, self.progress_bar, self.state]
         )
 
-    def handle_registration(self, name, age, occupation, language):
+    @profiled
+    def handle_registration(self, name, age, occupation, language, state: UserSessionState):
         try:
-            user = self.user_controller.create_user(
-                name=name,
-                age=int(age),
-                occupation=occupation,
-                language_preference=language
-            )
-            self.user_id = user.id
+            with session_scope() as db:
+                user = UserController(db).create_user(
+                    name=name,
+                    age=int(age),
+                    occupation=occupation,
+                    language_preference=language
+                )
 
-            # Initialize meta prompt session
-            session = self.meta_prompt_controller.create_session(user.id)
-            progress = self.meta_prompt_controller.get_session_progress(session.id)
+                # Initialize meta prompt session
+                meta_prompt_controller = MetaPromptController(db)
+                session = meta_prompt_controller.create_session(user.id)
+                progress = meta_prompt_controller.session_progress(session)
+
+                state.user_id = user.id
+                state.meta_prompt_session_id = session.id
 
             return (
                 f"Registration successful! Welcome {name}!",
                 gr.update(visible=True),
                 gr.update(visible=True),
                 gr.update(visible=True),
-                progress["progress_percentage"]
+                progress["progress_percentage"],
+                state
             )
         except Exception as e:
             return (
@@ -173,20 +220,25 @@ class HomePage(BasePage):
                 gr.update(visible=False),
                 gr.update(visible=False),
                 gr.update(visible=False),
-                0
+                0,
+                state
             )
 
-    def start_learning(self, objective_selected):
-        if not self.user_id:
-            return gr.update(visible=False), gr.update(visible=False)
+    @profiled
+    def start_learning(self, objective_selected, state: UserSessionState):
+        if not state.user_id:
+            return gr.update(visible=False), gr.update(visible=False), state
 
         if objective_selected:
             try:
                 objective_id = int(objective_selected)
-            except:
-                return "objective id must be a integer"
-            self.learning_page.objective_id = objective_id
-            self.learning_page.init_agent()
-
-            return gr.update(visible=False), gr.update(visible=True)
-        return gr.update(visible=True), gr.update(visible=False)
+            except ValueError:
+                return gr.update(visible=True), gr.update(visible=False), state
+            if state.objective_id != objective_id:
+                # 切换学习目标时开启新的学习会话
+                state.objective_id = objective_id
+                state.learning_session_id = None
+            self.learning_page.init_agent(state)
+
+            return gr.update(visible=False), gr.update(visible=True), state
+        return gr.update(visible=True), gr.update(visible=False), state
@@ -1,27 +1,41 @@
+import time
+
 import gradio as gr
-from sqlalchemy.orm import Session
+from loguru import logger
 
 from ai_agents import prompt_templates
+from ai_agents.conversation_memory import get_memory_store
 from ai_agents.learning_agent import LearningAgent
 from controllers import learning_controller
 from controllers.user_controller import UserController
 from ui_pages.base_page import BasePage
+from ui_pages.session_state import UserSessionState
+from utils.database import session_scope
+from utils.query_profiler import profiled
 
 
 class LearningPage(BasePage):
-    def __init__(self, db: Session):
+    def __init__(self):
         super().__init__()
-        self.db = db
-        self.user_controller = UserController(db)
-        self.learning_agent = None
-        self.objective_id = None
-        self.learning_session_id = None
-        self.user_id = None
+        self._interface = None
+        self._rendered = False
+
+    @property
+    def interface(self) -> gr.Blocks:
+        # 单独启动时才构建自己的 gr.Blocks；嵌入 HomePage 时组件树只由 HomePage 渲染一次
+        if self._interface is None:
+            with gr.Blocks() as self._interface:
+                self.render_content()
+        return self._interface
 
-        with gr.Blocks() as self.interface:  # 将 self.interface 赋值给 gr.Blocks() 实例
-            self.render_content()  # 将内容渲染移到 render_content 方法中
+    def render_content(self, state: gr.State = None):
+        # 组件与事件绑定在 self 上，渲染第二次会覆盖第一次的引用
+        if self._rendered:
+            raise RuntimeError("LearningPage has already been rendered")
+        self._rendered = True
+        # 嵌入 HomePage 时共用其 gr.State，单独启动时自建一个
+        state = state if state is not None else gr.State(UserSessionState())
 
-    def render_content(self):
         gr.Markdown("# Learning Page")
         with gr.Row():
             self.user_input = gr.Textbox(label="Your Input")
@@ -31,58 +45,88 @@ class LearningPage(BasePage):
 
         self.send_button.click(
             self.respond,
-            inputs=[self.user_input],
+            inputs=[self.user_input, state],
             outputs=[self.ai_output]
         )
 
         self.end_session_button = gr.Button("End Session")
-        self.end_session_button.click(self.end_session, inputs=[], outputs=[])
-
-    def init_agent(self, user_id: int = None):
-        if not self.learning_agent:
-            if self.objective_id:
-                self.user_id = user_id or self.user_id
-                if not self.user_id:
-                    return False
-
-                user = self.user_controller.get_user(self.user_id)
-                if not user:
-                    return False
-
-                self.learning_agent = LearningAgent(
-                    user_id=self.user_id,
-                    objective_id=self.objective_id,
-                    db=self.db
-                )
-
-                # Create learning session
-                self.learning_session_id = learning_controller.create_learning_session(
-                    db=self.db,
-                    user_id=self.user_id,
-                    objective_id=self.objective_id,
-                    content=f"Start learning objective {self.objective_id}",
-                    ai_prompt=prompt_templates.GENERAL_LEARNING_PROMPT
-                ).id
-
-    def respond(self, user_input):
-        if self.learning_agent:
-            response = self.learning_agent.generate_learning_response(
+        self.end_session_button.click(self.end_session, inputs=[state], outputs=[state])
+
+    @staticmethod
+    @profiled
+    def init_agent(state: UserSessionState) -> bool:
+        """Start a learning session for the objective selected in ``state``."""
+        if state.learning_session_id or not state.objective_id or not state.user_id:
+            return bool(state.learning_session_id)
+
+        with session_scope() as db:
+            user = UserController(db).get_user_snapshot(state.user_id)
+            if not user:
+                return False
+
+            # Create learning session
+            state.learning_session_id = learning_controller.create_learning_session(
+                db=db,
+                user_id=state.user_id,
+                objective_id=state.objective_id,
+                content=f"Start learning objective {state.objective_id}",
+                ai_prompt=prompt_templates.GENERAL_LEARNING_PROMPT
+            ).id
+        return True
+
+    async def respond(self, user_input, state: UserSessionState):
+        if not state.learning_session_id:
+            yield "Learning agent not initialized."
+            return
+
+        started = time.perf_counter()
+        # 上下文查询只占用一个短生命周期的 DB session，流式输出期间不持有连接
+        with session_scope() as db:
+            session_id = state.learning_session_id
+            memory = get_memory_store().get(
+                session_id,
+                loader=lambda: [turn.to_message() for turn in learning_controller.get_session_turns(db, session_id)]
+            )
+            learning_agent = LearningAgent(
+                user_id=state.user_id,
+                objective_id=state.objective_id,
+                db=db
+            )
+            stream = await learning_agent.agenerate_learning_response(
                 user_input,
-                prompt_templates.GENERAL_LEARNING_PROMPT
+                prompt_templates.GENERAL_LEARNING_PROMPT,
+                stream=True,
+                memory=memory
             )
 
-            # 更新学习会话内容
-            if self.learning_session_id:
-                learning_controller.end_learning_session(
-                    db=self.db,  # type: ignore
-                    session_id=self.learning_session_id,
-                    notes=f"{user_input}\n{response}"
-                )
-
-            return response
-        return "Learning agent not initialized."
-
-    def end_session(self):
-        if self.learning_session_id:
-            learning_controller.end_learning_session(db=self.db, session_id=self.learning_session_id,
-                                                     notes="End Session")  # type: ignore
+        # 逐块渲染模型输出，首个 token 到达即可展示；等待期间不占用 Gradio 工作线程
+        response = ""
+        try:
+            async for delta in stream:
+                response += delta
+                yield response
+        except Exception as e:  # pylint: disable=broad-except
+            # 重试和截止时间都已用尽：提示用户重试，而不是让异常中断 Gradio 事件
+            logger.error(f"Learning response failed for session {state.learning_session_id}: {e}")
+            yield response + "\n\n*The tutor is not responding right now, please try again.*"
+            return
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        # 流结束后追加本轮对话，由后台批量写入，不在请求路径上访问数据库
+        usage = learning_agent.last_usage
+        learning_controller.record_turn(state.learning_session_id, "user", user_input,
+                                        prompt_tokens=usage.prompt_tokens if usage else None)
+        learning_controller.record_turn(state.learning_session_id, "assistant", response.strip(),
+                                        completion_tokens=usage.completion_tokens if usage else None,
+                                        latency_ms=latency_ms)
+
+    @staticmethod
+    @profiled
+    def end_session(state: UserSessionState) -> UserSessionState:
+        if state.learning_session_id:
+            with session_scope() as db:
+                learning_controller.end_learning_session(db=db, session_id=state.learning_session_id,
+                                                         notes="End Session")
+            get_memory_store().discard(state.learning_session_id)
+            state.learning_session_id = None
+        return state
@@ -1,25 +1,23 @@
 # -*- coding: utf-8 -*-
-from typing import Dict
+from typing import Callable, Dict
 
 import gradio as gr
-from fastapi import Depends
-from sqlalchemy.orm import Session
 
+from ai_agents.meta_prompt_agent import MetaPromptAgent
 from controllers.meta_prompt_controller import MetaPromptController, PromptCollectionStep
-from utils.database import get_db
+from models.meta_prompt_session import MetaPromptSession
+from utils.database import session_scope
+from utils.query_profiler import profiled
 from .base_page import BasePage
+from .session_state import UserSessionState
 
 
 class MetaPromptPage(BasePage):
-    def __init__(self, db: Session = Depends(get_db)):
-        super().__init__()
-        self.db = db
-        self.controller = MetaPromptController(db)
-        self.current_session_id = None
-        self.current_step = None
-
-    def render_content(self, container=None):
+    def render_content(self, container=None, state: gr.State = None):
         with gr.Blocks() as self.interface:
+            # 当前 meta prompt session 的 id 保存在每个浏览器会话自己的 gr.State 中
+            self.state = state if state is not None else gr.State(UserSessionState())
+
             self.progress_bar = gr.Slider(
                 minimum=0,
                 maximum=100,
@@ -86,24 +84,25 @@ class MetaPromptPage(BasePage):
             # Event handlers
             self.learning_style_submit.click(
                 fn=self.handle_learning_style,
-                inputs=[self.learning_style],
+                inputs=[self.learning_style, self.state],
                 outputs=[self.step_message]
             )
 
             self.goals_submit.click(
                 fn=self.handle_goals,
-                inputs=[self.short_term_goals, self.long_term_goals],
+                inputs=[self.short_term_goals, self.long_term_goals, self.state],
                 outputs=[self.step_message]
             )
 
             self.interests_submit.click(
                 fn=self.handle_interests,
-                inputs=[self.interests, self.other_interests],
+                inputs=[self.interests, self.other_interests, self.state],
                 outputs=[self.step_message]
             )
 
             self.edit_button.click(
                 fn=self.reset_session,
+                inputs=[self.state],
                 outputs=[
                     self.learning_style_form,
                     self.goals_form,
@@ -116,55 +115,79 @@ class MetaPromptPage(BasePage):
 
             self.confirm_button.click(
                 fn=self.complete_session,
+                inputs=[self.state],
                 outputs=[self.step_message]
             )
 
-    def start_session(self, user_id: int):
+    @profiled
+    async def start_session(self, user_id: int, state: UserSessionState):
         """Initialize a new meta prompt session"""
-        session = self.controller.create_session(user_id)
-        self.current_session_id = session.id
-        self.current_step = PromptCollectionStep.INIT
-        progress = self.controller.get_session_progress(session.id)
-        return self.update_interface_for_step(progress["current_step"])
+        def start(controller: MetaPromptController) -> PromptCollectionStep:
+            session = controller.create_session(user_id)
+            state.user_id = user_id
+            state.meta_prompt_session_id = session.id
+            return controller.session_progress(session)["current_step"]
+
+        return await self.run_step(state, start)
 
-    def handle_learning_style(self, style: str) -> Dict:
+    @profiled
+    async def handle_learning_style(self, style: str, state: UserSessionState) -> Dict:
         """Process learning style input"""
-        result = self.controller.process_step(
-            self.current_session_id,
+        return await self.run_step(state, lambda controller: controller.process_step(
+            state.meta_prompt_session_id,
             PromptCollectionStep.LEARNING_STYLE,
             {"learning_style": style}
-        )
-        return self.update_interface_for_step(result["next_step"])
+        )["next_step"])
 
-    def handle_goals(self, short_term: str, long_term: str) -> Dict:
+    @profiled
+    async def handle_goals(self, short_term: str, long_term: str, state: UserSessionState) -> Dict:
         """Process goals input"""
         goals_data = {
             "short_term": short_term,
             "long_term": long_term
         }
-        result = self.controller.process_step(
-            self.current_session_id,
+        return await self.run_step(state, lambda controller: controller.process_step(
+            state.meta_prompt_session_id,
             PromptCollectionStep.GOALS,
             goals_data
-        )
-        return self.update_interface_for_step(result["next_step"])
+        )["next_step"])
 
-    def handle_interests(self, interests: list, other: str) -> Dict:
+    @profiled
+    async def handle_interests(self, interests: list, other: str, state: UserSessionState) -> Dict:
         """Process interests input"""
         interests_data = {
             "selected": interests,
             "other": other
         }
-        result = self.controller.process_step(
-            self.current_session_id,
+        return await self.run_step(state, lambda controller: controller.process_step(
+            state.meta_prompt_session_id,
             PromptCollectionStep.INTERESTS,
             interests_data
-        )
-        return self.update_interface_for_step(result["next_step"])
+        )["next_step"])
 
-    def update_interface_for_step(self, step: PromptCollectionStep) -> Dict:
+    async def run_step(self, state: UserSessionState,
+                       action: Callable[[MetaPromptController], PromptCollectionStep]) -> Dict:
+        """
+        Run ``action`` and update the UI for the step it returns in one short DB session.
+        The review prompt is generated after that session is closed, so no pooled
+        connection or transaction is held during the LLM call.
+        """
+        with session_scope() as db:
+            controller = MetaPromptController(db)
+            step = action(controller)
+            session = self.update_interface_for_step(controller, state, step)
+        if step == PromptCollectionStep.REVIEW:
+            await self.update_review_prompt(state, session)
+        return {"message": f"Proceeding to {step} step"}
+
+    def update_interface_for_step(self, controller: MetaPromptController, state: UserSessionState,
+                                  step: PromptCollectionStep) -> MetaPromptSession:
         """Update UI components based on current step"""
-        progress = self.controller.get_session_progress(self.current_session_id)
+        # One lookup per event: the review form reuses the session loaded for the progress bar.
+        # The review step also loads the user, which the prompt generation reads after the DB session is closed
+        session = controller.get_session(state.meta_prompt_session_id,
+                                         with_user=step == PromptCollectionStep.REVIEW)
+        progress = controller.session_progress(session)
         self.progress_bar.update(progress["progress_percentage"])
 
         visibility_map = {
@@ -178,13 +201,11 @@ class MetaPromptPage(BasePage):
             component.update(visible=visible)
 
         if step == PromptCollectionStep.REVIEW:
-            self.update_review_form()
-
-        return {"message": f"Proceeding to {step} step"}
+            self.update_review_form(session)
+        return session
 
-    def update_review_form(self):
+    def update_review_form(self, session: MetaPromptSession):
         """Update the review form with collected preferences"""
-        session = self.controller.get_session(self.current_session_id)
         preferences = session.collected_preferences
 
         summary_text = f"""
@@ -200,17 +221,31 @@ class MetaPromptPage(BasePage):
         """
 
         self.summary.update(value=summary_text)
-        prompt = self.controller.generate_final_prompt(self.current_session_id)
+
+    async def update_review_prompt(self, state: UserSessionState, session: MetaPromptSession):
+        """Show the personalized prompt, generating it first if the session has none"""
+        # session is detached here: only its loaded columns and user are read
+        prompt = session.generated_prompt
+        if not prompt:
+            prompt = await MetaPromptAgent().agenerate_personalized_prompt(session)
+            with session_scope() as db:
+                MetaPromptController(db).store_generated_prompt(state.meta_prompt_session_id, prompt)
         self.prompt_preview.update(value=prompt)
 
-    def reset_session(self):
+    @profiled
+    async def reset_session(self, state: UserSessionState):
         """Reset the current session and start over"""
-        self.controller.reset_session(self.current_session_id)
-        return self.update_interface_for_step(PromptCollectionStep.INIT)
+        def reset(controller: MetaPromptController) -> PromptCollectionStep:
+            controller.reset_session(state.meta_prompt_session_id)
+            return PromptCollectionStep.INIT
+
+        return await self.run_step(state, reset)
 
-    def complete_session(self):
+    @profiled
+    async def complete_session(self, state: UserSessionState):
         """Complete the meta prompt session"""
-        session = self.controller.get_session(self.current_session_id)
-        if session.generated_prompt:
-            return {"message": "Session completed successfully!"}
+        with session_scope() as db:
+            session = MetaPromptController(db).get_session(state.meta_prompt_session_id)
+            if session.generated_prompt:
+                return {"message": "Session completed successfully!"}
         return {"message": "Error: Could not complete session"}
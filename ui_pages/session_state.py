@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class UserSessionState:
+    """
+    Per-browser-session state, held in a ``gr.State``.
+
+    Gradio copies the initial value for every visitor, so concurrent learners
+    never see each other's ids. Only plain ids are stored here; ORM objects and
+    agents are rebuilt per event from a short-lived DB session.
+    """
+    user_id: Optional[int] = None
+    objective_id: Optional[int] = None
+    learning_session_id: Optional[int] = None
+    meta_prompt_session_id: Optional[int] = None
+    # Dashboard 分页: 已浏览各页的起始游标 (priority, id)，栈顶为当前页；以及下一页的游标
+    objectives_cursors: List[Optional[Tuple[int, int]]] = field(default_factory=lambda: [None])
+    objectives_next_cursor: Optional[Tuple[int, int]] = None
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming CSV/JSONL reader and writer for bulk import/export.
+
+Records are plain dicts. Files are read and written row by row, so memory use is
+bounded by the chunk size no matter how large the cohort is. The same field list
+is used in both directions, so an export can be imported again unchanged. JSON
+columns are nested values in JSONL and JSON-encoded strings in CSV.
+"""
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("true", "1", "yes")
+
+
+# Field name -> parser used when reading CSV, where every value arrives as a string
+USER_FIELDS: Dict[str, Callable] = {
+    "id": int,
+    "name": str,
+    "age": int,
+    "occupation": str,
+    "language_preference": str,
+    "preferred_learning_style": str,
+    "personalized_prompt": str,
+    "learning_goals": json.loads,
+    "meta_prompt_complete": parse_bool,
+    "created_at": datetime.fromisoformat,
+}
+OBJECTIVE_FIELDS: Dict[str, Callable] = {
+    "id": int,
+    "user_id": int,
+    "name": str,
+    "description": str,
+    "priority": int,
+    "current_level": str,
+    "target_level": str,
+}
+SESSION_FIELDS: Dict[str, Callable] = {
+    "id": int,
+    "user_id": int,
+    "objective_id": int,
+    "start_time": datetime.fromisoformat,
+    "end_time": datetime.fromisoformat,
+    "content": str,
+    "notes": str,
+    "ai_prompt": str,
+}
+
+FIELDS_BY_KIND = {"users": USER_FIELDS, "objectives": OBJECTIVE_FIELDS, "sessions": SESSION_FIELDS}
+
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def _coerce(record: Dict, fields: Dict[str, Callable]) -> Dict:
+    row = {}
+    for name, parse in fields.items():
+        value = record.get(name)
+        if value is None or value == "":
+            continue
+        row[name] = parse(value) if isinstance(value, str) and parse is not str else value
+    return row
+
+
+def read_records(path: str, kind: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """Yield typed records of ``kind`` ("users", "objectives", "sessions") from a CSV or JSONL file."""
+    fields = FIELDS_BY_KIND[kind]
+    fmt = fmt or detect_format(path)
+    with open(path, newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            for record in csv.DictReader(file):
+                yield _coerce(record, fields)
+        else:
+            for line in file:
+                if line.strip():
+                    yield _coerce(json.loads(line), fields)
+
+
+def _serialize(value, fmt: str):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if fmt == "csv" and isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def write_records(path: str, kind: str, records: Iterable[Dict], fmt: Optional[str] = None) -> int:
+    """Stream records to a CSV or JSONL file; returns the number of rows written."""
+    fieldnames = list(FIELDS_BY_KIND[kind])
+    fmt = fmt or detect_format(path)
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        for record in records:
+            row = {name: _serialize(record.get(name), fmt) for name in fieldnames}
+            if writer:
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
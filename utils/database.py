@@ -1,20 +1,21 @@
 # -*- coding: utf-8 -*-
-from typing import Dict, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
 
-from sqlalchemy import create_engine
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 
+from controllers.identity_cache import get_identity_cache
 from models.base import Base
+from models.conversation_turn import ConversationTurnModel  # noqa: F401  # pylint: disable=unused-import
+from models.learning_session import LearningSessionModel  # noqa: F401  # pylint: disable=unused-import
 from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
+from models.objective import ObjectiveModel  # noqa: F401  # pylint: disable=unused-import
+from models.review_item import ReviewItemModel  # noqa: F401  # pylint: disable=unused-import
 from models.user import UserModel
-from settings import DATABASE_URL
-
-# Create database engine
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-
-# Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+from utils.migrations import run_migrations
+# Shared engine and session factory, configured from settings.py
+from utils.engine import engine, SessionLocal
 
 
 def get_db():
@@ -26,28 +27,34 @@ def get_db():
         db.close()
 
 
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """Short-lived session for a single request or UI event; rolled back on error."""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
 def init_db():
     """Initialize database and create all tables."""
     # Import all models to ensure they're registered with metadata
     Base.metadata.create_all(bind=engine)
+    # Bring existing databases up to date (indexes, backfills); no-op when current
+    run_migrations(engine)
 
 
 def migrate_user_preferences():
-    """Migrate existing users to include new preference fields."""
-    db = SessionLocal()
-    try:
-        users = db.query(UserModel).all()
-        for user in users:
-            if not hasattr(user, 'learning_goals'):
-                user.learning_goals = {}
-            if not hasattr(user, 'meta_prompt_complete'):
-                user.meta_prompt_complete = False
-        db.commit()
-    except SQLAlchemyError as e:
-        db.rollback()
-        raise e
-    finally:
-        db.close()
+    """Migrate existing users to include new preference fields.
+
+    Kept for backwards compatibility; the work is done by the versioned
+    migrations in utils.migrations (batched SQL backfill, applied once).
+    """
+    return run_migrations(engine)
 
 
 def store_user_preferences(user_id: int, preferences: Dict) -> bool:
@@ -66,6 +73,7 @@ def store_user_preferences(user_id: int, preferences: Dict) -> bool:
             user.learning_goals = preferences['goals']
 
         db.commit()
+        get_identity_cache().invalidate_user(user_id)
         return True
     except SQLAlchemyError:
         db.rollback()
@@ -100,8 +108,7 @@ def update_prompt_session(session_id: int, preferences: Dict) -> bool:
         if not session:
             return False
 
-        for key, value in preferences.items():
-            session.add_preference(key, value)
+        session.add_preferences(preferences)
 
         session.update_status(MetaPromptStatus.COLLECTING)
         db.commit()
@@ -126,6 +133,7 @@ def complete_prompt_session(session_id: int, generated_prompt: str) -> bool:
         session.set_generated_prompt(generated_prompt)
         session.user.set_personalized_prompt(generated_prompt)
         db.commit()
+        get_identity_cache().invalidate_user(session.user_id)
         return True
     except SQLAlchemyError:
         db.rollback()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+数据库引擎工厂。
+
+整个进程只创建一个 Engine，models.base 和 utils.database 共用它。SQLite 连接
+建立时通过 connect 事件设置 WAL 等 PRAGMA，使读操作不再阻塞写操作。
+"""
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from settings import (DATABASE_URL, DB_BUSY_TIMEOUT, DB_CACHE_SIZE, DB_JOURNAL_MODE, DB_MAX_OVERFLOW,
+                      DB_MMAP_SIZE, DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_SYNCHRONOUS,
+                      DB_TEMP_STORE)
+
+
+def _sqlite_pragmas():
+    return {
+        "journal_mode": DB_JOURNAL_MODE,
+        "synchronous": DB_SYNCHRONOUS,
+        "cache_size": DB_CACHE_SIZE,
+        "mmap_size": DB_MMAP_SIZE,
+        "busy_timeout": DB_BUSY_TIMEOUT,
+        "temp_store": DB_TEMP_STORE,
+    }
+
+
+def build_engine(database_url: str = DATABASE_URL, tuned: bool = True) -> Engine:
+    """
+    按 settings.py 中的配置创建 Engine。
+
+    Args:
+        database_url: 数据库 URL，默认使用 settings.DATABASE_URL。
+        tuned: 为 False 时使用 SQLAlchemy 默认配置，仅供基准测试对比。
+
+    Returns:
+        配置好连接池和 PRAGMA 的 Engine。
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() != "sqlite":
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                             pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE,
+                             pool_pre_ping=True)
+
+    connect_args = {"check_same_thread": False}
+    if not tuned:
+        return create_engine(url, connect_args=connect_args)
+
+    if url.database in (None, "", ":memory:"):
+        # 内存数据库只存在于单个连接中，所有线程必须共用这一个连接
+        engine = create_engine(url, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        # 文件数据库：每个连接都需要执行一次 PRAGMA，复用连接可以摊薄这部分开销
+        engine = create_engine(url, connect_args=connect_args, poolclass=QueuePool,
+                               pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                               pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE)
+
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    return engine
+
+
+_engine: Optional[Engine] = None
+
+
+def get_engine() -> Engine:
+    """返回进程内共享的 Engine，首次调用时创建。"""
+    global _engine
+    if _engine is None:
+        _engine = build_engine()
+    return _engine
+
+
+engine = get_engine()
+
+# 创建会话类
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
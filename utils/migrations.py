@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+版本化的数据库迁移。
+
+已执行的版本记录在 schema_migrations 表中，每个迁移只执行一次，版本记录与迁移的最后一步一起提交；
+回填大表时每批单独提交，不会在整个迁移期间占着写锁。迁移本身也写成幂等的
+(IF NOT EXISTS / 检查列是否存在 / 只回填仍为 NULL 的行)，中途失败后重跑，
+或对已由 create_all 建好的新库执行，都是安全的。
+
+列检查走 SQLAlchemy inspector，回填按主键 id 分批，可用于 SQLite 和 PostgreSQL；
+--check 用的 EXPLAIN QUERY PLAN 只有 SQLite 支持。
+
+用法:
+    python -m utils.migrations          # 执行未应用的迁移
+    python -m utils.migrations --check  # 执行迁移并检查热点查询的执行计划是否走索引
+"""
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from loguru import logger
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+
+from models.conversation_turn import ConversationTurnModel
+from models.learning_session import LearningSessionModel
+from models.meta_prompt_session import MetaPromptSession, MetaPromptStatus
+from models.objective import ObjectiveModel
+from utils.engine import engine as default_engine
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+def column_exists(conn: Connection, table: str, column: str) -> bool:
+    return any(info["name"] == column for info in inspect(conn).get_columns(table))
+
+
+def column_not_null(conn: Connection, table: str, column: str) -> bool:
+    return any(info["name"] == column and not info["nullable"] for info in inspect(conn).get_columns(table))
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """ddl 为列定义，例如 "BOOLEAN DEFAULT 0"。"""
+    if not column_exists(conn, table, column):
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def backfill_in_batches(conn: Connection, table: str, assignments: str, condition: str,
+                        batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    分批执行 UPDATE 并逐批提交，避免长时间锁住整张表，也不把数据加载到 Python 里。
+
+    conn 必须是 engine.connect() 得到的连接 (commit-as-you-go)，不能在 engine.begin() 块里调用。
+    condition 应在回填后不再成立 (例如 "col IS NULL")，这样中断后重跑只处理剩下的行。
+    表需有整数主键 id。
+
+    Returns:
+        更新的总行数。
+    """
+    total = 0
+    while True:
+        result = conn.exec_driver_sql(
+            f"UPDATE {table} SET {assignments} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE {condition} LIMIT {int(batch_size)})"
+        )
+        conn.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+
+
+def _index_foreign_keys_and_status(conn: Connection) -> None:
+    # 名称与模型 __table_args__ 中的 Index 一致，新库由 create_all 创建时这里不会重复建
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_objectives_user_priority "
+                         "ON objectives (user_id, priority)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_learning_sessions_user_id "
+                         "ON learning_sessions (user_id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_learning_sessions_objective_id "
+                         "ON learning_sessions (objective_id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_meta_prompt_sessions_user_status "
+                         "ON meta_prompt_sessions (user_id, status)")
+
+
+def _backfill_user_preferences(conn: Connection) -> None:
+    # 取代旧的 migrate_user_preferences：不再逐个加载用户，也不依赖 hasattr 判断
+    add_column_if_missing(conn, "users", "learning_goals", "JSON")
+    add_column_if_missing(conn, "users", "meta_prompt_complete", "BOOLEAN")
+    updated = backfill_in_batches(conn, "users", "learning_goals = '{}'", "learning_goals IS NULL")
+    updated += backfill_in_batches(conn, "users", "meta_prompt_complete = FALSE", "meta_prompt_complete IS NULL")
+    logger.info(f"Backfilled user preference defaults on {updated} rows")
+
+
+def _objective_priority_not_null(conn: Connection) -> None:
+    # priority 是 Dashboard keyset 游标 (priority, id) 的一部分：行值比较遇到 NULL 结果为 NULL，
+    # 一旦翻到 priority 为 NULL 的行，之后的每一页都会是空的
+    updated = backfill_in_batches(conn, "objectives", "priority = 0", "priority IS NULL")
+    logger.info(f"Backfilled priority = 0 on {updated} objectives")
+    if conn.dialect.name != "sqlite":
+        conn.exec_driver_sql("ALTER TABLE objectives ALTER COLUMN priority SET DEFAULT 0")
+        conn.exec_driver_sql("ALTER TABLE objectives ALTER COLUMN priority SET NOT NULL")
+        return
+    if column_not_null(conn, "objectives", "priority"):
+        return
+    # SQLite 不能修改已有列的约束 (新库由 create_all 直接建成 NOT NULL)，用触发器做同样的检查
+    for name, event in (("insert", "INSERT"), ("update", "UPDATE OF priority")):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS objectives_priority_not_null_{name} BEFORE {event} ON objectives "
+            "WHEN NEW.priority IS NULL "
+            "BEGIN SELECT RAISE(ABORT, 'NOT NULL constraint failed: objectives.priority'); END"
+        )
+
+
+def _meta_prompt_session_batch_id(conn: Connection) -> None:
+    add_column_if_missing(conn, "meta_prompt_sessions", "batch_id", "VARCHAR")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Index objectives, learning_sessions and meta_prompt_sessions lookups",
+              _index_foreign_keys_and_status),
+    Migration(2, "Backfill user preference defaults", _backfill_user_preferences),
+    Migration(3, "Backfill objective priority and make it NOT NULL", _objective_priority_not_null),
+    Migration(4, "Record the onboarding batch of meta prompt sessions", _meta_prompt_session_batch_id),
+]
+
+
+def _ensure_version_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at DATETIME NOT NULL)"
+        )
+
+
+def applied_versions(engine: Engine = default_engine) -> List[int]:
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def run_migrations(engine: Engine = default_engine) -> List[int]:
+    """
+    按版本顺序执行尚未应用的迁移。
+
+    迁移在 commit-as-you-go 连接上执行：回填可以逐批提交，剩余的改动与版本记录在最后一起提交。
+    迁移失败时回滚未提交的部分且不写版本记录，已提交的回填批次保留，下次启动时重跑该迁移。
+
+    Returns:
+        本次执行的迁移版本列表。
+    """
+    done = set(applied_versions(engine))
+    executed = []
+    for migration in sorted(MIGRATIONS, key=lambda item: item.version):
+        if migration.version in done:
+            continue
+        with engine.connect() as conn:
+            migration.upgrade(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": migration.version, "description": migration.description,
+                 "applied_at": datetime.utcnow()}
+            )
+            conn.commit()
+        logger.info(f"Applied migration {migration.version}: {migration.description}")
+        executed.append(migration.version)
+    return executed
+
+
+def hot_queries() -> Dict[str, object]:
+    """控制器中的高频查询，与 controllers/ 里的过滤条件保持一致。"""
+    # controllers 依赖 utils.database，后者又导入本模块，因此在函数内导入
+    # pylint: disable=import-outside-toplevel
+    from controllers.objective_controller import objectives_page_query
+    from controllers.review_controller import due_items_query
+
+    return {
+        "ObjectiveController.get_objectives_by_user":
+            select(ObjectiveModel).where(ObjectiveModel.user_id == 1),
+        "ObjectiveController.get_objectives_page":
+            objectives_page_query(user_id=1, after=(2, 10)),
+        "learning sessions by user":
+            select(LearningSessionModel).where(LearningSessionModel.user_id == 1),
+        "learning sessions by objective":
+            select(LearningSessionModel).where(LearningSessionModel.objective_id == 1),
+        "UserController.get_user_progress (active session)":
+            select(MetaPromptSession).where(MetaPromptSession.user_id == 1,
+                                            MetaPromptSession.status != MetaPromptStatus.COMPLETED),
+        "learning_controller.get_session_turns":
+            select(ConversationTurnModel).where(ConversationTurnModel.session_id == 1)
+            .order_by(ConversationTurnModel.seq),
+        "ReviewController.due_items":
+            due_items_query(user_id=1, now=datetime(2030, 1, 1)),
+        "ReviewController.due_items (objective)":
+            due_items_query(user_id=1, now=datetime(2030, 1, 1), objective_id=1),
+    }
+
+
+def explain_query_plan(conn: Connection, statement) -> List[str]:
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")]
+
+
+def verify_query_plans(engine: Engine = default_engine) -> Dict[str, List[str]]:
+    """
+    检查热点查询的执行计划不包含全表扫描。仅支持 SQLite (EXPLAIN QUERY PLAN)。
+
+    Raises:
+        AssertionError: 某个查询的执行计划中出现 SCAN 或临时排序 (USE TEMP B-TREE)。
+    """
+    plans = {}
+    with engine.connect() as conn:
+        for name, statement in hot_queries().items():
+            plan = explain_query_plan(conn, statement)
+            plans[name] = plan
+            full_scans = [step for step in plan
+                          if (step.startswith("SCAN") and "USING" not in step) or "TEMP B-TREE" in step]
+            assert not full_scans, f"{name} does not use an index: {plan}"
+    return plans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations.")
+    parser.add_argument("--check", action="store_true", help="verify hot query plans after migrating")
+    args = parser.parse_args()
+
+    from utils.database import init_db  # pylint: disable=import-outside-toplevel
+
+    init_db()
+    if args.check:
+        for query_name, query_plan in verify_query_plans().items():
+            print(f"{query_name}: {' | '.join(query_plan)}")
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+SQL 查询分析：把每条语句归属到触发它的 UI 事件或控制器调用。
+
+``profile_queries(name)`` 打开一个作用域 (保存在 contextvar 中，可嵌套)，Engine 上的
+cursor 事件监听器把语句的耗时记到当前作用域；作用域结束时合并到外层作用域，最外层结束时
+输出汇总：语句数、总耗时、最慢的语句，以及同一语句的重复执行 (N+1 模式：同一 SQL
+不同参数重复多次；完全相同的参数重复执行则是冗余查询)。
+
+``@profiled`` 为函数/方法打开以其 ``__qualname__`` 命名的作用域，``profile_methods``
+为控制器类的公开方法逐个加上 ``@profiled``；二者仅在 QUERY_PROFILER_ENABLED 时生效。
+``assert_query_budget`` 不依赖该开关，供测试断言某个控制器方法的查询次数上限::
+
+    with assert_query_budget(2):
+        controller.get_session_progress(session_id)
+"""
+import functools
+import inspect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from settings import (QUERY_PROFILER_ENABLED, QUERY_PROFILER_N_PLUS_ONE, QUERY_PROFILER_SLOW_MS,
+                      QUERY_PROFILER_TOP)
+
+
+@dataclass
+class StatementStats:
+    count: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+    # 完全相同的参数重复执行的次数
+    duplicates: int = 0
+    scopes: Dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    _params: set = field(default_factory=set, repr=False)
+
+    def add(self, elapsed_s: float, params_key: str, scope: str) -> None:
+        self.count += 1
+        self.total_s += elapsed_s
+        self.max_s = max(self.max_s, elapsed_s)
+        if params_key in self._params:
+            self.duplicates += 1
+        else:
+            self._params.add(params_key)
+        self.scopes[scope] += 1
+
+    def merge(self, other: "StatementStats") -> None:
+        self.count += other.count
+        self.total_s += other.total_s
+        self.max_s = max(self.max_s, other.max_s)
+        self.duplicates += other.duplicates + len(self._params & other._params)
+        self._params |= other._params
+        for scope, count in other.scopes.items():
+            self.scopes[scope] += count
+
+
+class QueryProfile:
+    """一个作用域内执行的语句，按 SQL 文本聚合。"""
+
+    def __init__(self, name: str, parent: Optional["QueryProfile"] = None):
+        self.name = name
+        self.parent = parent
+        self.path = f"{parent.path} > {name}" if parent else name
+        self.statements: Dict[str, StatementStats] = defaultdict(StatementStats)
+
+    def record(self, statement: str, params_key: str, elapsed_s: float) -> None:
+        self.statements[statement].add(elapsed_s, params_key, self.path)
+
+    def merge(self, child: "QueryProfile") -> None:
+        for statement, stats in child.statements.items():
+            self.statements[statement].merge(stats)
+
+    @property
+    def query_count(self) -> int:
+        return sum(stats.count for stats in self.statements.values())
+
+    @property
+    def total_s(self) -> float:
+        return sum(stats.total_s for stats in self.statements.values())
+
+    def slowest(self, top: int = QUERY_PROFILER_TOP) -> List[Tuple[str, StatementStats]]:
+        return sorted(self.statements.items(), key=lambda item: item[1].max_s, reverse=True)[:top]
+
+    def repeated(self, threshold: int = QUERY_PROFILER_N_PLUS_ONE) -> List[Tuple[str, StatementStats]]:
+        """同一语句执行次数达到 ``threshold``，或以完全相同的参数执行了不止一次。"""
+        return [(statement, stats) for statement, stats in self.statements.items()
+                if stats.count >= threshold or stats.duplicates]
+
+    def report(self) -> str:
+        lines = [f"{self.path}: {self.query_count} queries, {self.total_s * 1000:.1f}ms"]
+        for statement, stats in self.statements.items():
+            lines.append(f"  {stats.count}x {stats.total_s * 1000:.1f}ms "
+                         f"(max {stats.max_s * 1000:.1f}ms, {stats.duplicates} duplicate) {_short(statement)}")
+        return "\n".join(lines)
+
+
+def _short(statement: str, limit: int = 200) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class QueryStats:
+    """每个最外层作用域 (UI 事件或控制器调用) 的累计统计。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def record(self, profile: QueryProfile) -> None:
+        with self._lock:
+            stats = self._stats[profile.name]
+            stats["calls"] += 1
+            stats["queries"] += profile.query_count
+            stats["total_s"] += profile.total_s
+            stats["max_queries"] = max(stats["max_queries"], profile.query_count)
+            stats["n_plus_one"] += 1 if profile.repeated() else 0
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {**stats, "avg_queries": stats["queries"] / stats["calls"],
+                       "avg_ms": stats["total_s"] / stats["calls"] * 1000}
+                for name, stats in self._stats.items()
+            }
+
+
+_query_stats = QueryStats()
+_current: ContextVar[Optional[QueryProfile]] = ContextVar("query_profile", default=None)
+_installed: set = set()
+_install_lock = threading.Lock()
+
+
+def get_query_stats() -> QueryStats:
+    return _query_stats
+
+
+def _before_cursor_execute(conn, _cursor, _statement, _parameters, _context, _executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("query_profiler_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, _cursor, statement, parameters, _context, executemany):
+    profile = _current.get()
+    if profile is None:
+        return
+    started = conn.info.get("query_profiler_started")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    profile.record(statement, "executemany" if executemany else repr(parameters), elapsed)
+    if elapsed * 1000 >= QUERY_PROFILER_SLOW_MS:
+        logger.warning(f"Slow query ({elapsed * 1000:.0f}ms) in {profile.path}: {_short(statement)}")
+
+
+def install(engine: Optional[Engine] = None) -> None:
+    """在 Engine 上注册监听器 (幂等)。没有活动作用域时监听器只做一次 contextvar 读取。"""
+    if engine is None:
+        from utils.engine import get_engine  # pylint: disable=import-outside-toplevel
+        engine = get_engine()
+    with _install_lock:
+        if id(engine) in _installed:
+            return
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        _installed.add(id(engine))
+
+
+@contextmanager
+def profile_queries(name: str, log: bool = QUERY_PROFILER_ENABLED) -> Iterator[QueryProfile]:
+    """统计作用域内执行的语句；最外层作用域结束时记入 QueryStats，``log`` 为 True 时输出汇总。"""
+    install()
+    parent = _current.get()
+    profile = QueryProfile(name, parent)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        if parent is not None:
+            parent.merge(profile)
+        else:
+            _query_stats.record(profile)
+            if log:
+                _log_profile(profile)
+
+
+def _log_profile(profile: QueryProfile) -> None:
+    if not profile.query_count:
+        return
+    slowest = "; ".join(f"{stats.max_s * 1000:.1f}ms {_short(statement, 80)}"
+                        for statement, stats in profile.slowest())
+    logger.debug(f"SQL {profile.name}: {profile.query_count} queries in {profile.total_s * 1000:.1f}ms; "
+                 f"slowest: {slowest}")
+    for statement, stats in profile.repeated():
+        callers = ", ".join(f"{scope} x{count}" for scope, count in stats.scopes.items())
+        logger.warning(f"Possible N+1 in {profile.name}: {stats.count}x ({stats.duplicates} identical) "
+                       f"{_short(statement)} [from {callers}]")
+
+
+def profiled(fn: Optional[Callable] = None, *, name: Optional[str] = None):
+    """为函数或协程函数打开查询作用域；QUERY_PROFILER_ENABLED 为 False 时原样返回。"""
+    if fn is None:
+        return functools.partial(profiled, name=name)
+    if not QUERY_PROFILER_ENABLED or inspect.isgeneratorfunction(fn) or inspect.isasyncgenfunction(fn):
+        # 生成器跨多次迭代执行，无法用单个上下文包住，保持原样
+        return fn
+    scope = name or fn.__qualname__
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with profile_queries(scope):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with profile_queries(scope):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def profile_methods(cls):
+    """类装饰器：为类中定义的公开方法加上 ``@profiled``。"""
+    if not QUERY_PROFILER_ENABLED:
+        return cls
+    for attr, value in list(vars(cls).items()):
+        if attr.startswith("_"):
+            continue
+        if isinstance(value, staticmethod):
+            setattr(cls, attr, staticmethod(profiled(value.__func__)))
+        elif inspect.isfunction(value):
+            setattr(cls, attr, profiled(value))
+    return cls
+
+
+@contextmanager
+def assert_query_budget(max_queries: int, name: str = "query budget") -> Iterator[QueryProfile]:
+    """测试辅助：作用域内执行的语句超过 ``max_queries`` 条时抛出 AssertionError。"""
+    with profile_queries(name, log=False) as profile:
+        yield profile
+    if profile.query_count > max_queries:
+        raise AssertionError(f"{name}: expected at most {max_queries} queries, got "
+                             f"{profile.query_count}\n{profile.report()}")
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+SM-2 间隔重复调度。
+
+每个复习条目保存 (interval_days, ease, repetitions, lapses)。每次复习给出 0-5 的评分:
+评分 >= 3 视为记住，间隔依次为 1 天、6 天，之后乘以 ease；评分 < 3 视为遗忘，重复次数清零、
+间隔回到 1 天。ease 按 SM-2 公式随评分调整，且不低于 REVIEW_MIN_EASE。
+
+``sm2_step`` 处理单个条目 (纯 Python，不导入 numpy)；``sm2_batch`` 与 ``rescale_intervals``
+对整批条目做同样的计算，供批量评分和重新校准使用 (一次处理上千条时避免逐条的 Python 循环)。
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Optional, Sequence, Tuple
+
+from settings import REVIEW_MIN_EASE
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MIN_GRADE = 0
+MAX_GRADE = 5
+# 评分达到该值即视为记住
+PASSING_GRADE = 3
+FIRST_INTERVAL_DAYS = 1.0
+SECOND_INTERVAL_DAYS = 6.0
+
+
+@dataclass(frozen=True)
+class ReviewState:
+    interval_days: float
+    ease: float
+    repetitions: int
+    lapses: int
+
+
+def check_grade(grade: int) -> int:
+    if not MIN_GRADE <= grade <= MAX_GRADE:
+        raise ValueError(f"Review grade must be between {MIN_GRADE} and {MAX_GRADE}, got {grade}")
+    return grade
+
+
+def sm2_step(state: ReviewState, grade: int, min_ease: float = REVIEW_MIN_EASE) -> ReviewState:
+    """一次复习后的新状态。"""
+    check_grade(grade)
+    miss = MAX_GRADE - grade
+    ease = max(min_ease, state.ease + 0.1 - miss * (0.08 + miss * 0.02))
+    if grade < PASSING_GRADE:
+        return ReviewState(FIRST_INTERVAL_DAYS, ease, 0, state.lapses + 1)
+    if state.repetitions == 0:
+        interval = FIRST_INTERVAL_DAYS
+    elif state.repetitions == 1:
+        interval = SECOND_INTERVAL_DAYS
+    else:
+        # 使用复习前的 ease，与 sm2_batch 一致
+        interval = round(state.interval_days * state.ease)
+    return ReviewState(float(interval), ease, state.repetitions + 1, state.lapses)
+
+
+def sm2_batch(interval_days: "np.ndarray", ease: "np.ndarray", repetitions: "np.ndarray", lapses: "np.ndarray",
+              grades: "np.ndarray", min_ease: float = REVIEW_MIN_EASE
+              ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray", "np.ndarray"]:
+    """
+    ``sm2_step`` 的向量化版本：各数组等长，第 i 个元素是第 i 个条目的状态与评分。
+
+    Returns:
+        新的 (interval_days, ease, repetitions, lapses) 数组。
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    grades = np.asarray(grades)
+    if grades.size and (grades.min() < MIN_GRADE or grades.max() > MAX_GRADE):
+        raise ValueError(f"Review grades must be between {MIN_GRADE} and {MAX_GRADE}")
+    interval_days = np.asarray(interval_days, dtype=np.float64)
+    ease = np.asarray(ease, dtype=np.float64)
+    repetitions = np.asarray(repetitions, dtype=np.int64)
+    lapses = np.asarray(lapses, dtype=np.int64)
+
+    miss = MAX_GRADE - grades
+    new_ease = np.maximum(min_ease, ease + 0.1 - miss * (0.08 + miss * 0.02))
+    passed = grades >= PASSING_GRADE
+    grown = np.select([repetitions == 0, repetitions == 1],
+                      [FIRST_INTERVAL_DAYS, SECOND_INTERVAL_DAYS],
+                      np.round(interval_days * ease))
+    new_interval = np.where(passed, grown, FIRST_INTERVAL_DAYS)
+    new_repetitions = np.where(passed, repetitions + 1, 0)
+    new_lapses = np.where(passed, lapses, lapses + 1)
+    return new_interval, new_ease, new_repetitions, new_lapses
+
+
+def due_at(reviewed_at: datetime, interval_days: float) -> datetime:
+    return reviewed_at + timedelta(days=interval_days)
+
+
+def due_dates(reviewed_at: Sequence[Optional[datetime]], interval_days: "np.ndarray",
+              default: datetime) -> list:
+    """向量化的 ``due_at``；从未复习过的条目 (reviewed_at 为 None) 以 ``default`` 为起点。"""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    start = np.array([value or default for value in reviewed_at], dtype="datetime64[us]")
+    offsets = np.round(np.asarray(interval_days, dtype=np.float64) * 86_400_000_000).astype("timedelta64[us]")
+    return (start + offsets).tolist()
+
+
+def rescale_intervals(interval_days: "np.ndarray", factor: float, min_days: float = FIRST_INTERVAL_DAYS,
+                      max_days: Optional[float] = None) -> "np.ndarray":
+    """
+    重新校准：把间隔整体乘以 ``factor`` (例如实际保持率低于目标时缩短间隔)，结果限制在
+    [min_days, max_days] 内；间隔为 0 (尚未复习) 的条目保持不变。
+    """
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    interval_days = np.asarray(interval_days, dtype=np.float64)
+    scaled = np.clip(np.round(interval_days * factor), min_days, max_days)
+    return np.where(interval_days > 0, scaled, interval_days)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调用遥测。
+
+每次 LLM 调用生成一条 LLMCall 记录 (Agent 类、方法、模型、endpoint、token 用量、总延迟、
+首 token 延迟、结果以及用户/目标 id)，在进程内聚合为直方图与计数器：
+
+- ``render_prometheus()`` 输出 Prometheus 文本格式，``start_metrics_server()`` 在 Gradio
+  旁边的独立端口上提供 /metrics；
+- TELEMETRY_LOG_ENABLED 开启时，每次调用另外输出一条 ``event="llm_call"`` 的结构化
+  loguru 记录 (logger_conf.py 将其序列化写入 JSONL 文件)，这是每次调用唯一的一条日志。
+
+调度器、路由、响应缓存与语义缓存各自维护计数，/metrics 在抓取时读取它们的 snapshot/stats，
+不在这里重复记录。
+
+用户/目标 id 只出现在结构化日志中，不作为指标标签，避免标签基数无限增长。
+"""
+import asyncio
+import bisect
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+from settings import TELEMETRY_LOG_ENABLED
+
+# 延迟直方图的桶上界 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+# 单次调用 token 数直方图的桶上界
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+
+def cached_prompt_tokens(usage: Any) -> int:
+    """OpenAI 风格 usage 中命中提供方前缀缓存的 prompt token 数 (prompt_tokens_details.cached_tokens)。"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None and isinstance(usage, dict):
+        details = usage.get("prompt_tokens_details")
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def outcome_of(error: BaseException) -> str:
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    return "error"
+
+
+@dataclass
+class LLMCall:
+    """一次 LLM 调用的遥测记录，由 BaseAIAgent 创建并在调用结束时提交。"""
+    agent: str
+    method: str
+    model: str
+    stream: bool = False
+    endpoint: Optional[str] = None
+    user_id: Optional[Hashable] = None
+    objective_id: Optional[int] = None
+    started: float = field(default_factory=time.perf_counter)
+    ttft_s: Optional[float] = None
+    _done: bool = field(default=False, repr=False)
+
+    def first_token(self) -> None:
+        if self.ttft_s is None:
+            self.ttft_s = time.perf_counter() - self.started
+
+    def finish(self, usage: Any = None, outcome: str = "ok") -> None:
+        # 只提交一次：流被提前关闭后又被垃圾回收时不会重复计数
+        if not self._done:
+            self._done = True
+            get_telemetry().record_call(self, usage, outcome, time.perf_counter() - self.started)
+
+    def fail(self, error: BaseException) -> None:
+        self.finish(outcome=outcome_of(error))
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return result
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+CALL_LABELS = ("agent", "method", "model", "endpoint", "outcome")
+STREAM_LABELS = ("agent", "method", "model", "endpoint")
+TOKEN_LABELS = ("agent", "method", "model", "kind")
+CACHE_LABELS = ("agent", "method", "cache")
+STRUCTURED_LABELS = ("agent", "method", "outcome")
+PREFIX_CACHE_LABELS = ("agent", "method", "prefix_cache")
+HTTP_LABELS = ("host",)
+PRIORITY_LABELS = ("priority",)
+ROUTE_LABELS = ("route", "profile")
+ROUTE_ENDPOINT_LABELS = ("route", "profile", "endpoint")
+APP_CACHE_LABELS = ("cache", "tier")
+
+
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations: Dict[Tuple, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._ttft: Dict[Tuple, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._completion_tokens: Dict[Tuple, Histogram] = defaultdict(lambda: Histogram(TOKEN_BUCKETS))
+        self._tokens: Dict[Tuple, int] = defaultdict(int)
+        self._cache_hits: Dict[Tuple, int] = defaultdict(int)
+        self._structured: Dict[Tuple, int] = defaultdict(int)
+        # 有 usage 的成功调用按是否命中提供方前缀缓存分开统计延迟，用于衡量前缀缓存的收益
+        self._prefix_cache: Dict[Tuple, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+
+    def record_call(self, call: LLMCall, usage: Any, outcome: str, latency_s: float) -> None:
+        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        completion_tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+        cached_tokens = cached_prompt_tokens(usage) if usage is not None else None
+        endpoint = call.endpoint or ""
+        with self._lock:
+            self._durations[(call.agent, call.method, call.model, endpoint, outcome)].observe(latency_s)
+            if call.ttft_s is not None:
+                self._ttft[(call.agent, call.method, call.model, endpoint)].observe(call.ttft_s)
+            if completion_tokens is not None:
+                self._completion_tokens[(call.agent, call.method, call.model, endpoint)].observe(completion_tokens)
+            for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens),
+                                ("cached", cached_tokens)):
+                if count:
+                    self._tokens[(call.agent, call.method, call.model, kind)] += count
+            if prompt_tokens and outcome == "ok":
+                prefix_cache = "hit" if cached_tokens else "miss"
+                self._prefix_cache[(call.agent, call.method, prefix_cache)].observe(latency_s)
+
+        if TELEMETRY_LOG_ENABLED:
+            logger.bind(
+                event="llm_call", agent=call.agent, method=call.method, model=call.model, endpoint=endpoint,
+                stream=call.stream, outcome=outcome, latency_ms=round(latency_s * 1000, 1),
+                ttft_ms=round(call.ttft_s * 1000, 1) if call.ttft_s is not None else None,
+                prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, cached_tokens=cached_tokens,
+                user_id=call.user_id, objective_id=call.objective_id
+            ).info(f"llm_call {call.agent}.{call.method} {outcome} {latency_s * 1000:.0f}ms")
+
+    def record_cache_hit(self, agent: str, method: str, cache: str) -> None:
+        """应用层缓存 (response / semantic) 命中，未发起 LLM 调用。"""
+        with self._lock:
+            self._cache_hits[(agent, method, cache)] += 1
+        if TELEMETRY_LOG_ENABLED:
+            logger.bind(event="llm_cache_hit", agent=agent, method=method, cache=cache).debug(
+                f"llm_cache_hit {agent}.{method} {cache}")
+
+    def record_structured_output(self, agent: str, method: str, outcome: str) -> None:
+        """
+        结构化输出的解析结果: strict (直接是合法 JSON)、recovered (容错解析器挽回，省下一次重新请求)、
+        invalid (将重新请求) 或 failed (放弃)。
+        """
+        with self._lock:
+            self._structured[(agent, method, outcome)] += 1
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            self._render_histograms(lines, "llm_request_duration_seconds",
+                                    "Total LLM call latency, including scheduler queueing and retries.",
+                                    CALL_LABELS, self._durations)
+            self._render_histograms(lines, "llm_time_to_first_token_seconds",
+                                    "Time until the first streamed token.", STREAM_LABELS, self._ttft)
+            self._render_histograms(lines, "llm_completion_tokens", "Completion tokens per LLM call.",
+                                    STREAM_LABELS, self._completion_tokens)
+            self._render_counters(lines, "llm_tokens_total", "Prompt, completion and provider-cached tokens.",
+                                  TOKEN_LABELS, self._tokens)
+            self._render_counters(lines, "llm_cache_hits_total",
+                                  "Calls answered by the response or semantic cache.", CACHE_LABELS,
+                                  self._cache_hits)
+            self._render_counters(lines, "llm_structured_output_total",
+                                  "Structured output parses by outcome (strict, recovered, invalid, failed).",
+                                  STRUCTURED_LABELS, self._structured)
+            self._render_histograms(lines, "llm_prefix_cache_request_duration_seconds",
+                                    "Latency of successful calls with and without a provider prefix-cache hit.",
+                                    PREFIX_CACHE_LABELS, self._prefix_cache)
+        self._render_connection_stats(lines)
+        self._render_scheduler_stats(lines)
+        self._render_router_stats(lines)
+        self._render_app_cache_stats(lines)
+        return "\n".join(lines) + "\n"
+
+    def _render_connection_stats(self, lines: List[str]) -> None:
+        """共享 HTTP 连接池的请求数与新建连接数：稳定运行时新建连接数应不再增长。"""
+        from ai_agents.client_registry import get_client_registry  # pylint: disable=import-outside-toplevel
+
+        stats = get_client_registry().stats.snapshot()
+        for name, counter, help_text in (
+                ("llm_http_requests_total", "requests", "HTTP requests sent by the shared LLM client pool."),
+                ("llm_http_connections_opened_total", "connections", "New connections opened by the pool."),
+                ("llm_http_tls_handshakes_total", "tls_handshakes", "TLS handshakes performed by the pool.")):
+            self._render_counters(lines, name, help_text, HTTP_LABELS,
+                                  {(host,): counts[counter] for host, counts in stats.items()})
+
+    def _render_scheduler_stats(self, lines: List[str]) -> None:
+        """请求调度器：并发占用、各优先级的排队长度与等待时间。"""
+        from ai_agents.scheduler import get_scheduler  # pylint: disable=import-outside-toplevel
+
+        snapshot = get_scheduler().snapshot()
+        self._render_gauges(lines, "llm_scheduler_in_flight", "LLM requests currently holding a slot.",
+                            (), {(): snapshot["in_flight"]})
+        self._render_gauges(lines, "llm_scheduler_max_concurrency", "Configured concurrent LLM request slots.",
+                            (), {(): snapshot["max_concurrency"]})
+        priorities = snapshot["priorities"]
+        self._render_gauges(lines, "llm_scheduler_queue_depth", "Requests waiting for a slot.", PRIORITY_LABELS,
+                            {(name,): stats["queue_depth"] for name, stats in priorities.items()})
+        for name, counter, help_text in (
+                ("llm_scheduler_enqueued_total", "enqueued", "Requests that had to wait for a slot."),
+                ("llm_scheduler_granted_total", "granted", "Slots granted."),
+                ("llm_scheduler_cancelled_total", "cancelled", "Requests cancelled while waiting."),
+                ("llm_scheduler_wait_seconds_total", "wait_s", "Total time spent waiting for a slot.")):
+            self._render_counters(lines, name, help_text, PRIORITY_LABELS,
+                                  {(priority,): stats.get(counter, 0) for priority, stats in priorities.items()})
+        self._render_gauges(lines, "llm_scheduler_max_wait_seconds", "Longest wait for a slot so far.",
+                            PRIORITY_LABELS,
+                            {(name,): stats["max_wait_ms"] / 1000 for name, stats in priorities.items()})
+
+    def _render_router_stats(self, lines: List[str]) -> None:
+        """模型路由：每个 (路由, 模型配置) 的请求数、错误数与延迟，以及各 endpoint 的请求分布。"""
+        from ai_agents.routing import get_router  # pylint: disable=import-outside-toplevel
+
+        snapshot = get_router().snapshot()
+        routes = {(route, stats["profile"]): stats for route, stats in snapshot.items()}
+        self._render_counters(lines, "llm_route_requests_total", "LLM requests per route and model profile.",
+                              ROUTE_LABELS, {key: stats["requests"] for key, stats in routes.items()})
+        self._render_counters(lines, "llm_route_errors_total", "Failed LLM requests per route and model profile.",
+                              ROUTE_LABELS, {key: stats["errors"] for key, stats in routes.items()})
+        self._render_counters(lines, "llm_route_latency_seconds_total",
+                              "Total request latency per route and model profile.", ROUTE_LABELS,
+                              {key: stats["avg_latency_ms"] * stats["requests"] / 1000
+                               for key, stats in routes.items()})
+        self._render_counters(lines, "llm_route_endpoint_requests_total", "LLM requests per endpoint.",
+                              ROUTE_ENDPOINT_LABELS,
+                              {(*key, endpoint): count for key, stats in routes.items()
+                               for endpoint, count in stats["by_endpoint"].items()})
+
+    def _render_app_cache_stats(self, lines: List[str]) -> None:
+        """响应缓存与语义缓存的命中/未命中；只读取已创建的缓存，抓取本身不会创建缓存或导入 numpy。"""
+        hits: Dict[Tuple, int] = {}
+        misses: Dict[Tuple, int] = {}
+        entries: Dict[Tuple, int] = {}
+        response_cache = sys.modules.get("ai_agents.response_cache")
+        if response_cache is not None and response_cache._cache is not None:  # pylint: disable=protected-access
+            stats = response_cache._cache.stats()  # pylint: disable=protected-access
+            hits[("response", "memory")] = stats["memory_hits"]
+            hits[("response", "disk")] = stats["disk_hits"]
+            misses[("response", "")] = stats["misses"]
+            entries[("response", "memory")] = stats["memory_entries"]
+        semantic_cache = sys.modules.get("ai_agents.semantic_cache")
+        if semantic_cache is not None and semantic_cache._cache is not None:  # pylint: disable=protected-access
+            stats = semantic_cache._cache.stats()  # pylint: disable=protected-access
+            hits[("semantic", "")] = stats["hits"]
+            misses[("semantic", "")] = stats["misses"]
+            entries[("semantic", "")] = stats["entries"]
+        self._render_counters(lines, "app_cache_hits_total", "Response and semantic cache hits.",
+                              APP_CACHE_LABELS, hits)
+        self._render_counters(lines, "app_cache_misses_total", "Response and semantic cache misses.",
+                              APP_CACHE_LABELS, misses)
+        self._render_gauges(lines, "app_cache_entries", "Entries held by the response and semantic caches.",
+                            APP_CACHE_LABELS, entries)
+
+    @staticmethod
+    def _render_histograms(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                           histograms: Dict[Tuple, Histogram]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, histogram in sorted(histograms.items()):
+            for bound, count in histogram.cumulative():
+                bucket_label = f'le="{bound}"'
+                lines.append(f"{name}_bucket{_labels(label_names, key, bucket_label)} {count}")
+            lines.append(f"{name}_sum{_labels(label_names, key)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
+
+    @staticmethod
+    def _render_counters(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                         counters: Dict[Tuple, int]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for key, value in sorted(counters.items()):
+            lines.append(f"{name}{_labels(label_names, key)} {value}")
+
+    @staticmethod
+    def _render_gauges(lines: List[str], name: str, help_text: str, label_names: Tuple[str, ...],
+                       gauges: Dict[Tuple, float]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(gauges.items()):
+            lines.append(f"{name}{_labels(label_names, key) if label_names else ''} {value}")
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """按 "Agent.method" 汇总的调用数、错误数、平均延迟与 token 数，便于在日志或调试中查看。"""
+        result: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        with self._lock:
+            for (agent, method, _, _, outcome), histogram in self._durations.items():
+                row = result[f"{agent}.{method}"]
+                row["calls"] += histogram.count
+                row["errors"] += histogram.count if outcome in ("error", "timeout") else 0
+                row["latency_s"] += histogram.sum
+            for (agent, method, _, kind), count in self._tokens.items():
+                result[f"{agent}.{method}"][f"{kind}_tokens"] += count
+            for (agent, method, cache), count in self._cache_hits.items():
+                result[f"{agent}.{method}"][f"{cache}_cache_hits"] += count
+            for (agent, method, outcome), count in self._structured.items():
+                result[f"{agent}.{method}"][f"structured_{outcome}"] += count
+            for (agent, method, prefix_cache), histogram in self._prefix_cache.items():
+                row = result[f"{agent}.{method}"]
+                row[f"prefix_cache_{prefix_cache}_calls"] += histogram.count
+                row[f"prefix_cache_{prefix_cache}_latency_s"] += histogram.sum
+        for row in result.values():
+            row["avg_latency_ms"] = row["latency_s"] / row["calls"] * 1000 if row["calls"] else 0.0
+            row["prefix_cache_token_rate"] = \
+                row["cached_tokens"] / row["prompt_tokens"] if row["prompt_tokens"] else 0.0
+            for prefix_cache in ("hit", "miss"):
+                count = row[f"prefix_cache_{prefix_cache}_calls"]
+                row[f"avg_prefix_cache_{prefix_cache}_latency_ms"] = \
+                    row[f"prefix_cache_{prefix_cache}_latency_s"] / count * 1000 if count else 0.0
+        return {key: dict(row) for key, row in result.items()}
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    return _telemetry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # noqa: N802
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_telemetry().render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+def start_metrics_server(host: str, port: int) -> Optional[ThreadingHTTPServer]:
+    """
+    在后台线程中启动 /metrics 服务 (Gradio 自身的服务器不方便挂载额外路由)。
+
+    端口无法绑定 (例如已被占用) 时只记录警告并返回 None，不影响应用启动。
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Prometheus metrics disabled: cannot listen on {host}:{port} ({e})")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Prometheus metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server